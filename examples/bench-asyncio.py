@@ -0,0 +1,58 @@
+import veo
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+print("\nVEO benchmark:")
+print("Many concurrent in-flight requests awaited in an asyncio event loop,")
+print("with the per-context completion watchers of veo.aio compared to")
+print("waiting for each request in a thread pool.\n")
+
+nreq = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+nctx = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+inflight = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+ctxs = [p.open_context() for i in range(nctx)]
+f = lib.busy_usec
+f.args_type("long")
+f.ret_type("long")
+
+
+async def run(waiter):
+    sem = asyncio.Semaphore(inflight)
+
+    async def one(i):
+        async with sem:
+            return await waiter(f(ctxs[i % nctx], 10))
+
+    t0 = time.perf_counter()
+    res = await asyncio.gather(*[one(i) for i in range(nreq)])
+    assert res == [10] * nreq
+    return time.perf_counter() - t0
+
+
+async def awaited(req):
+    return await req
+
+
+pool = ThreadPoolExecutor(max_workers=inflight)
+
+
+async def thread_per_wait(req):
+    return await asyncio.get_running_loop().run_in_executor(pool, req.wait_result)
+
+
+for label, waiter in (("await VeoRequest (veo.aio)", awaited),
+                      ("run_in_executor(wait_result)", thread_per_wait)):
+    dt = asyncio.run(run(waiter))
+    print("%-30s %10.0f requests/s  (%d in flight, %d contexts)" %
+          (label, nreq / dt, inflight, nctx))
+
+pool.shutdown()
+del p
+print("finished")
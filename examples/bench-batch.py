@@ -0,0 +1,43 @@
+import veo
+import os
+import sys
+import time
+
+
+print("\nVEO benchmark:")
+print("Submit and collect batches of small calls one by one, and with")
+print("VeoCtxt.submit_many() and veo.wait_all().\n")
+
+nbatch = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+ncalls = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+c = p.open_context()
+f = lib.sum4
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+calls = [(f, (1, 2, 3, i)) for i in range(ncalls)]
+
+
+def one_by_one():
+    reqs = [f(c, *args) for func, args in calls]
+    return [r.wait_result() for r in reqs]
+
+
+def batched():
+    return veo.wait_all(c.submit_many(calls))
+
+
+assert list(batched()) == one_by_one()
+for label, func in (("call + wait_result loops", one_by_one),
+                    ("submit_many + wait_all", batched)):
+    t0 = time.perf_counter()
+    for i in range(nbatch):
+        func()
+    dt = time.perf_counter() - t0
+    print("%-28s %8.2f us/call %8.2f ms/batch of %d" %
+          (label, dt / nbatch / ncalls * 1e6, dt / nbatch * 1e3, ncalls))
+
+del p
+print("finished")
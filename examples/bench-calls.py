@@ -0,0 +1,116 @@
+import veo
+import os
+import sys
+import time
+from veo._veo import ConvToI64
+
+
+print("\nVEO benchmark:")
+print("Calls per second of VeoFunction.__call__ with compiled signatures,")
+print("compared to the previous per-argument Python conversion path,")
+print("and of a prepared call with one rebound argument.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+c = p.open_context()
+
+f = lib.sum8
+f.args_type("int", "long", "unsigned long", "double", "float", "void *",
+            "short", "unsigned int")
+f.ret_type("long")
+args = (1, -2, 3, 4.0, 5.0, 0x1000, 7, 8)
+
+# the converters the previous implementation called for each argument
+legacy_conv = [ConvToI64.from_int, ConvToI64.from_long, ConvToI64.from_ulong,
+               ConvToI64.from_double, ConvToI64.from_float, ConvToI64.from_addr,
+               ConvToI64.from_short, ConvToI64.from_uint]
+
+
+def legacy_set(a):
+    # argument conversion as done by the previous __call__
+    for i in range(len(legacy_conv)):
+        x = args[i]
+        if hasattr(x, "_ve_array"):
+            x = x._ve_array
+        if isinstance(x, veo.OnStack):
+            a.set_stack(x, i)
+        else:
+            fc = legacy_conv[i]
+            try:
+                a.set_i64(i, fc(x))
+            except Exception as e:
+                raise ValueError("%r : args conversion: f = %r, x = %r" % (e, fc, x))
+
+
+# The previous path converted into a new VeoArgs and submitted it. Here
+# it converts into the arguments of a prepared call and submits that,
+# which saves it the allocation of the VeoArgs.
+legacy_calls = [f.prepare(*args) for j in range(ncalls)]
+
+
+def legacy_submit(n):
+    reqs = [None] * n
+    for j in range(n):
+        pc = legacy_calls[j]
+        legacy_set(pc.args)
+        reqs[j] = pc(c)
+    return reqs
+
+
+def legacy_call_wait(n):
+    pc = legacy_calls[0]
+    for j in range(n):
+        legacy_set(pc.args)
+        pc(c).wait_result()
+
+
+def submit_only(n):
+    reqs = [None] * n
+    for j in range(n):
+        reqs[j] = f(c, *args)
+    return reqs
+
+
+def collect(reqs):
+    for r in reqs:
+        r.wait_result()
+
+
+def call_wait(n):
+    for j in range(n):
+        f(c, *args).wait_result()
+
+
+pc = f.prepare(*args)
+
+
+def prepared_call_wait(n):
+    for j in range(n):
+        pc.set_i64(1, j)
+        pc(c).wait_result()
+
+
+def report(label, n, func, *fargs):
+    # thread_time() counts only the CPU time of the calling thread, i.e.
+    # the cost on the Python side without the time spent in the VE kernel
+    t0, c0 = time.perf_counter(), time.thread_time()
+    res = func(*fargs)
+    dt, dc = time.perf_counter() - t0, time.thread_time() - c0
+    print("%-40s %8.2f us/call %8.2f us cpu/call %10.0f calls/s" %
+          (label, dt / n * 1e6, dc / n * 1e6, n / dt))
+    return res
+
+
+reqs = report("previous path, convert + submit", ncalls, legacy_submit, ncalls)
+collect(reqs)
+reqs = report("compiled signature, convert + submit", ncalls, submit_only, ncalls)
+report("compiled signature, collect results", ncalls, collect, reqs)
+report("previous path, call + wait", ncalls // 5, legacy_call_wait, ncalls // 5)
+report("compiled signature, call + wait", ncalls // 5, call_wait, ncalls // 5)
+report("prepared call, set_i64 + call + wait", ncalls // 5, prepared_call_wait,
+       ncalls // 5)
+
+del p
+print("finished")
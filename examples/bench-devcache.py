@@ -0,0 +1,86 @@
+import veo
+import numpy as np
+import os
+import sys
+import time
+from veo.devcache import get_device_cache
+
+
+print("\nVEO benchmark:")
+print("Calls of a kernel summing an array that is passed again and again:")
+print("transferred before every call, or taken from the DeviceCache as")
+print("read-only array, as writable array checked by crc32 and with an")
+print("explicit version.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+n = 1 << 20
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+lib = p.load_library(os.path.abspath("libvebench.so"))
+f = lib.find_function("lsum")
+f.args_type("unsigned long", "long")
+f.ret_type("long")
+
+a = np.arange(n, dtype=np.int64)
+expect = int(a.sum())
+buf = p.alloc_mem(a.nbytes)
+
+
+def transfer():
+    for i in range(ncalls):
+        ctx.async_write_mem(buf, a, a.nbytes)
+        assert f(ctx, buf, n).wait_result() == expect
+
+
+cache = get_device_cache(p, budget=64 << 20, writable="check")
+
+
+def cached(version=None):
+    def loop():
+        for i in range(ncalls):
+            addr = cache.get(a, ctx, version=version)
+            assert f(ctx, addr, n).wait_result() == expect
+    return loop
+
+
+ro = a.copy()
+ro.flags.writeable = False
+
+
+def readonly():
+    for i in range(ncalls):
+        assert f(ctx, cache.get(ro, ctx), n).wait_result() == expect
+
+
+for label, loop in (("transfer every call", transfer),
+                    ("cache, read-only", readonly),
+                    ("cache, crc32 check", cached()),
+                    ("cache, version", cached(version=1))):
+    loop()
+    t0 = time.perf_counter()
+    loop()
+    dt = (time.perf_counter() - t0) / ncalls
+    print("%-22s %8.2fus per call" % (label, dt * 1e6))
+
+# a change of a writable array is noticed
+a[0] += 1
+assert f(ctx, cache.get(a, ctx), n).wait_result() == expect + 1
+a[0] -= 1
+assert f(ctx, cache.get(a, ctx, version=2), n).wait_result() == expect
+
+# least recently used copies are evicted under the budget
+small = [np.full(1 << 20, i, dtype=np.int64) for i in range(12)]
+for s in small:
+    cache.get(s, ctx)
+s = cache.stats()
+assert s["bytes_cached"] <= cache.budget and s["evictions"] > 0
+print("\n%d hits, %d misses, %d evictions, %.1f MiB not transferred"
+      % (s["hits"], s["misses"], s["evictions"], s["bytes_saved"] / 2 ** 20))
+
+del small
+cache.clear()
+assert len(cache) == 0
+p.free_mem(buf)
+del p
+print("finished")
@@ -0,0 +1,55 @@
+import veo
+import os
+import sys
+import time
+from veo.dispatch import Dispatcher
+
+
+print("\nVEO benchmark:")
+print("Chains of small calls: one veo_call_async() per call, submit_many(),")
+print("and one call of the VE side dispatcher per batch (submit_batch()).")
+print("The dispatcher is compiled with VECC and VECOPTS, if set.\n")
+
+nbatch = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+ncalls = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+ctx = p.open_context()
+f = lib.sum4
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+p.dispatcher = Dispatcher(p, compiler=os.getenv("VECC"), flags=os.getenv("VECOPTS"))
+p.enable_mem_pool()
+
+calls = [(f, (i, 1, 2, 3)) for i in range(ncalls)]
+expect = veo.np.arange(ncalls) + 6
+
+
+def loop():
+    res = veo.wait_all([f(ctx, *args) for fn, args in calls])
+    assert (res == expect).all()
+
+
+def many():
+    res = veo.wait_all(ctx.submit_many(calls))
+    assert (res == expect).all()
+
+
+def batch():
+    res = ctx.submit_batch(calls).wait_result()
+    assert (res == expect).all()
+
+
+for label, fn in (("veo_call_async per call", loop),
+                  ("submit_many", many),
+                  ("submit_batch (dispatcher)", batch)):
+    fn()
+    t0 = time.perf_counter()
+    for i in range(nbatch):
+        fn()
+    dt = time.perf_counter() - t0
+    print("%-28s %8.2fus per call" % (label, dt / (nbatch * ncalls) * 1e6))
+
+del p
+print("finished")
@@ -0,0 +1,67 @@
+import veo
+import numpy as np
+import os
+import resource
+import sys
+import tempfile
+import time
+from veo.staging import load_file, dump_file
+
+
+print("\nVEO benchmark:")
+print("Loading a file into VE memory with np.fromfile() and write_mem(),")
+print("and streamed in chunks with load_file(), then dumping it back with")
+print("dump_file(). Peak host RSS growth is shown for each.\n")
+
+size = (int(sys.argv[1]) if len(sys.argv) > 1 else 256) << 20
+
+p = veo.VeoProc(0)
+ctxs = [p.open_context() for i in range(2)]
+path = os.path.join(tempfile.gettempdir(), "veo-bench-filestream.bin")
+a = np.random.randint(0, 256, 1 << 20, dtype=np.uint8)
+with open(path, "wb") as f:
+    for off in range(0, size, a.nbytes):
+        f.write(a[:min(a.nbytes, size - off)])
+del a
+ve = p.alloc_mem(size)
+# touch the VE buffer, it is host memory under the emulation
+z = np.zeros(1 << 20, dtype=np.uint8)
+for off in range(0, size, z.nbytes):
+    p.write_mem(ve + off, z, min(z.nbytes, size - off))
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def streamed():
+    load_file(ctxs, path, dst=ve)
+
+
+def dumped():
+    dump_file(ctxs, ve, size, path + ".out")
+
+
+def naive():
+    a = np.fromfile(path, dtype=np.uint8)
+    p.write_mem(ve, a, a.nbytes)
+
+
+# peak RSS only grows, measure the streaming variants first
+for label, run in (("load_file", streamed), ("dump_file", dumped),
+                   ("fromfile + write_mem", naive)):
+    rss = maxrss()
+    t0 = time.perf_counter()
+    run()
+    dt = time.perf_counter() - t0
+    print("%-22s %8.1fms %8.2f GB/s  peak RSS +%.0f MiB"
+          % (label, dt * 1e3, size / dt / 1e9, maxrss() - rss))
+
+b = np.fromfile(path + ".out", dtype=np.uint8)
+assert (b == np.fromfile(path, dtype=np.uint8)).all()
+del b
+os.remove(path)
+os.remove(path + ".out")
+p.free_mem(ve)
+del p
+print("finished")
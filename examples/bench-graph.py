@@ -0,0 +1,67 @@
+import veo
+import numpy as np
+import os
+import sys
+import time
+from veo import Placeholder
+
+
+print("\nVEO benchmark:")
+print("A time step of one async_write_mem(), six calls and one")
+print("async_read_mem(): submitted operation by operation from Python and")
+print("replayed from a VeoGraph captured once, with the input buffer and a")
+print("scalar argument as placeholders.\n")
+
+nsteps = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+n = 1024
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+lib = p.load_library(os.path.abspath("libvebench.so"))
+f = lib.find_function("sum4")
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+lsum = lib.find_function("lsum")
+lsum.args_type("unsigned long", "long")
+lsum.ret_type("long")
+
+ve = p.alloc_mem(8 * n)
+out = np.zeros(n, dtype=np.int64)
+xs = [np.arange(n, dtype=np.int64) * i for i in range(4)]
+
+
+def python_step(x, k):
+    reqs = [ctx.async_write_mem(ve, x, x.nbytes)]
+    for j in range(5):
+        reqs.append(f(ctx, k, j, 2, 3))
+    reqs.append(lsum(ctx, ve, n))
+    reqs.append(ctx.async_read_mem(out, ve, out.nbytes))
+    return [r.wait_result() for r in reqs][1:-1]
+
+
+with ctx.capture() as g:
+    k = Placeholder("k")
+    ctx.async_write_mem(ve, Placeholder("x"), 8 * n)
+    for j in range(5):
+        f(ctx, k, j, 2, 3)
+    lsum(ctx, ve, n)
+    ctx.async_read_mem(out, ve, out.nbytes)
+
+
+def graph_step(x, k):
+    return g.run(x=x, k=k)
+
+
+for i in range(4):
+    assert python_step(xs[i], i) == graph_step(xs[i], i)
+    assert (out == xs[i]).all()
+
+for label, step in (("Python loop", python_step), ("graph replay", graph_step)):
+    t0 = time.perf_counter()
+    for i in range(nsteps):
+        step(xs[i & 3], i)
+    dt = (time.perf_counter() - t0) / nsteps
+    print("%-14s %8.2fus per step" % (label, dt * 1e6))
+
+del p
+print("finished")
@@ -0,0 +1,57 @@
+import veo
+import numpy as np
+import os
+import sys
+import time
+
+
+print("\nVEO benchmark:")
+print("A sweep of a kernel over a table of argument sets: a loop of calls")
+print("followed by a loop of wait_result(), submit_many() with wait_all()")
+print("and VeoFunction.map(), each over two contexts.\n")
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+p = veo.VeoProc(0)
+ctxs = [p.open_context() for i in range(2)]
+lib = p.load_library(os.path.abspath("libvebench.so"))
+f = lib.find_function("sum4")
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+
+a = np.arange(n, dtype=np.int64)
+b = np.random.randint(-1000, 1000, n)
+c = np.linspace(0, 1000, n).astype(np.int64)
+expect = a + b + c + 7
+
+
+def loop():
+    reqs = [f(ctxs[i & 1], a[i], b[i], c[i], 7) for i in range(n)]
+    return np.array([r.wait_result() for r in reqs])
+
+
+def many():
+    reqs = []
+    for k in range(2):
+        reqs += ctxs[k].submit_many(
+            [(f, (int(a[i]), int(b[i]), int(c[i]), 7)) for i in range(k, n, 2)])
+    return veo.wait_all(reqs)
+
+
+def vmap():
+    return f.map(ctxs, a, b, c, 7)
+
+
+for label, sweep in (("call + wait_result loop", loop),
+                     ("submit_many + wait_all", many),
+                     ("VeoFunction.map", vmap)):
+    sweep()
+    t0 = time.perf_counter()
+    res = sweep()
+    dt = (time.perf_counter() - t0) / n
+    assert np.array_equal(np.sort(res), np.sort(expect))
+    print("%-24s %8.2fus per call" % (label, dt * 1e6))
+
+assert np.array_equal(vmap(), expect)
+del p
+print("finished")
@@ -0,0 +1,35 @@
+import veo
+import sys
+import time
+
+
+print("\nVEO benchmark:")
+print("Allocate and free scratch buffers of the same sizes in every iteration,")
+print("directly with veo_alloc_mem/veo_free_mem and through the VeoMemPool.\n")
+
+niter = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+sizes = [1 << 12, 3 << 16, 1 << 20, 10 << 20]
+
+p = veo.VeoProc(0)
+
+
+def loop():
+    t0 = time.perf_counter()
+    for i in range(niter):
+        bufs = [p.alloc_mem(s) for s in sizes]
+        for b in bufs:
+            p.free_mem(b)
+    return (time.perf_counter() - t0) / (niter * len(sizes))
+
+
+dt = loop()
+print("%-28s %8.2fus per alloc_mem+free_mem" % ("veo_alloc_mem/veo_free_mem", dt * 1e6))
+
+pool = p.enable_mem_pool(max_cached=64 << 20)
+dt = loop()
+print("%-28s %8.2fus per alloc_mem+free_mem" % ("VeoMemPool", dt * 1e6))
+print(pool.stats())
+p.disable_mem_pool()
+
+del p
+print("finished")
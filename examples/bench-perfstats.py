@@ -0,0 +1,63 @@
+import veo
+import collections
+import math
+import os
+import sys
+import time
+from veo.perfstats import summary, prometheus_text
+
+
+print("\nVEO benchmark:")
+print("Cost of a small call (submit + wait_result) with the built-in")
+print("counters and latency histograms, which are always on, compared to")
+print("counting and timing every call in Python around it.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+lib = p.load_library(os.path.abspath("libvebench.so"))
+f = lib.find_function("sum4")
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+
+
+def builtin():
+    for i in range(ncalls):
+        f(ctx, i, 1, 2, 3).wait_result()
+
+
+counts = collections.Counter()
+hist = collections.Counter()
+
+
+def python():
+    for i in range(ncalls):
+        t0 = time.perf_counter()
+        try:
+            f(ctx, i, 1, 2, 3).wait_result()
+        except Exception:
+            counts["errors"] += 1
+            raise
+        dt = time.perf_counter() - t0
+        counts["calls"] += 1
+        hist[int(math.log2(dt * 1e9) * 8)] += 1
+
+
+for label, loop in (("built-in counters", builtin),
+                    ("Python instrumentation", python)):
+    loop()
+    t0 = time.perf_counter()
+    loop()
+    dt = (time.perf_counter() - t0) / ncalls
+    print("%-24s %8.2fus per call" % (label, dt * 1e6))
+
+s = summary(f.stats())
+print("\nsum4: %d calls, latency mean %.2fus p50 %.2fus p99 %.2fus"
+      % (s["calls"], s["latency_mean"] * 1e6, s["latency_p50"] * 1e6,
+         s["latency_p99"] * 1e6))
+assert s["calls"] == 4 * ncalls
+prometheus_text([p])
+
+del p
+print("finished")
@@ -0,0 +1,58 @@
+import veo
+import os
+import sys
+import time
+from veo.procpool import VeoProcPool
+
+
+print("\nVEO benchmark:")
+print("Start a VE process with libvebench.so loaded and two functions")
+print("resolved on each node, one node after the other and concurrently")
+print("with the VeoProcPool. On the emulation VEO_EMU_PROC_USEC models the")
+print("startup time of veorun.\n")
+
+nnodes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+nodes = list(range(nnodes))
+lib = os.path.abspath("libvebench.so")
+funcs = {"sum4": (("long",) * 4, "long"), "busy_usec": (("long",), "long")}
+
+
+def serial():
+    procs = []
+    for n in nodes:
+        p = veo.VeoProc(n)
+        l = p.load_library(lib)
+        for name, (args, ret) in funcs.items():
+            f = l.find_function(name)
+            f.args_type(*args)
+            f.ret_type(ret)
+        p.open_context()
+        procs.append(p)
+    return procs
+
+
+t0 = time.perf_counter()
+procs = serial()
+dt = time.perf_counter() - t0
+print("%-22s %8.1f ms" % ("serial", dt * 1e3))
+for p in procs:
+    p.proc_destroy()
+
+t0 = time.perf_counter()
+pool = VeoProcPool(nodes, libs=[lib], funcs=funcs)
+dt = time.perf_counter() - t0
+print("%-22s %8.1f ms\n" % ("VeoProcPool", dt * 1e3))
+print(pool.report())
+
+with pool.acquire() as wp:
+    assert wp.funcs["sum4"](wp.contexts[0], 1, 2, 3, 4).wait_result() == 10
+
+wp = pool.acquire(nodeid=nodes[-1])
+t0 = time.perf_counter()
+wp.release(discard=True)
+wp = pool.acquire(nodeid=nodes[-1])
+print("\nreplace a discarded process: %.1f ms" % ((time.perf_counter() - t0) * 1e3))
+wp.release()
+
+pool.close()
+print("finished")
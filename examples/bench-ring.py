@@ -0,0 +1,69 @@
+import veo
+import os
+import sys
+import time
+from veo.ring import RingChannel, HostRingWorker
+np = veo.np
+
+
+print("\nVEO benchmark:")
+print("Round trip latency of small calls: veo_call_async() + wait_result()")
+print("compared to the ring channel in VEO_HMEM memory served by a persistent")
+print("VE kernel, and the ring protocol served by a host thread, and the cost")
+print("of the hmemcpy() the ring channel does for posting and polling.")
+print("The ring worker is compiled with VECC and VECOPTS, if set.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+ctx = p.open_context()
+f = lib.sum4
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+
+
+def bench(label, call):
+    for i in range(100):
+        assert call(i) == i + 6
+    t0 = time.perf_counter()
+    for i in range(ncalls):
+        call(i)
+    dt = time.perf_counter() - t0
+    print("%-32s %8.2fus per call" % (label, dt / ncalls * 1e6))
+
+
+bench("call + wait_result", lambda i: f(ctx, i, 1, 2, 3).wait_result())
+
+
+def bench_hmemcpy(label, copy):
+    for i in range(100):
+        copy()
+    t0 = time.perf_counter()
+    for i in range(ncalls):
+        copy()
+    dt = time.perf_counter() - t0
+    print("%-32s %8.2fus per copy" % (label, dt / ncalls * 1e6))
+
+
+hbuf = np.zeros(1, dtype=np.uint64)
+hmem = p.alloc_hmem(8)
+bench_hmemcpy("hmemcpy 8 bytes to VE",
+              lambda: veo.VEO_HMEM.hmemcpy(hmem, hbuf.ctypes.data, 8))
+bench_hmemcpy("hmemcpy 8 bytes from VE",
+              lambda: veo.VEO_HMEM.hmemcpy(hbuf.ctypes.data, hmem, 8))
+p.free_hmem(hmem)
+
+ch = RingChannel.create(p, nslots=64)
+ch.start(p.open_context(), compiler=os.getenv("VECC"), flags=os.getenv("VECOPTS"))
+bench("ring channel, VE worker", lambda i: ch.call(f, i, 1, 2, 3))
+ch.stop()
+ch.close()
+
+lch = RingChannel.local(nslots=64)
+w = HostRingWorker(lch, {1: lambda a, b, c, d: a + b + c + d})
+bench("ring channel, host thread", lambda i: lch.call(1, i, 1, 2, 3))
+lch.stop()
+
+del p
+print("finished")
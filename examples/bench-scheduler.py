@@ -0,0 +1,54 @@
+import veo
+import os
+import sys
+import time
+from veo.scheduler import VeoScheduler
+
+
+print("\nVEO benchmark:")
+print("Calls of uneven duration arrive one after the other and are spread")
+print("over the contexts of several VE processes: round robin, as done by")
+print("hand, compared to the least loaded placement of the VeoScheduler.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+nnodes = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+nctx = 2
+lib = os.path.abspath("libvebench.so")
+funcs = {"busy_usec": (("long",), "long")}
+# every fourth call is long
+durations = [4000 if i % 4 == 0 else 250 for i in range(ncalls)]
+arrival = 0.0003
+
+sched = VeoScheduler(list(range(nnodes)), nctx=nctx, libs=[lib], funcs=funcs)
+slots = [(sched.function("busy_usec", p), c)
+         for p in sched.procs for c in p.context]
+
+
+def round_robin():
+    reqs = []
+    for i, d in enumerate(durations):
+        f, c = slots[i % len(slots)]
+        reqs.append(f(c, d))
+        time.sleep(arrival)
+    return [r.wait_result() for r in reqs]
+
+
+def scheduler():
+    futs = []
+    for d in durations:
+        futs.append(sched.submit("busy_usec", d))
+        time.sleep(arrival)
+    return [f.result() for f in futs]
+
+
+for label, f in (("round robin", round_robin), ("VeoScheduler", scheduler)):
+    t0 = time.perf_counter()
+    res = f()
+    dt = time.perf_counter() - t0
+    assert res == durations
+    print("%-14s %8.1f ms" % (label, dt * 1e3))
+
+print("calls per node:", sched.stats())
+assert list(sched.map("busy_usec", [1, 2, 3])) == [1, 2, 3]
+sched.shutdown()
+print("finished")
@@ -0,0 +1,54 @@
+import veo
+import sys
+import time
+from veo.staging import StreamWriter
+
+
+print("\nVEO benchmark:")
+print("Stream blocks of a strided numpy view into VE memory: packing each")
+print("block with np.ascontiguousarray() and writing it synchronously,")
+print("compared to the double-buffered StreamWriter with staging buffers.\n")
+
+nblk = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+rows = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+np = veo.np
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+# every second column of a 2D array is a typical non-contiguous block
+src = np.random.rand(rows, 2048)
+block = src[:, ::2]
+size = nblk * block.nbytes
+ve_buf = p.alloc_mem(size)
+
+
+def naive():
+    off = 0
+    for i in range(nblk):
+        b = np.ascontiguousarray(block)
+        p.write_mem(ve_buf + off, b, b.nbytes)
+        off += b.nbytes
+
+
+def staged(lock):
+    with StreamWriter(ctx, ve_buf, chunk_size=block.nbytes, lock=lock) as w:
+        for i in range(nblk):
+            w.write(block)
+
+
+for label, f in (("ascontiguousarray+write_mem", naive),
+                 ("StreamWriter", lambda: staged(False)),
+                 ("StreamWriter, mlock", lambda: staged(True))):
+    f()
+    t0 = time.perf_counter()
+    f()
+    dt = time.perf_counter() - t0
+    print("%-30s %8.2f GB/s" % (label, size / dt / 1e9))
+
+check = np.empty((nblk,) + block.shape)
+p.read_mem(check, ve_buf, size)
+assert (check == block).all()
+
+p.free_mem(ve_buf)
+del p
+print("finished")
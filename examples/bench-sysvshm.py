@@ -0,0 +1,80 @@
+import veo
+import sys
+import time
+import multiprocessing as mp
+from veo.sysvshm import SysVShm
+
+
+print("\nVEO benchmark:")
+print("A producer process hands batches to a worker process which writes")
+print("them to the VE: numpy arrays pickled through a multiprocessing queue,")
+print("compared to SysVShm segments of which only the id is pickled.\n")
+
+nbatch = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+mb = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+np = veo.np
+n = mb * (1 << 20) // 8
+
+
+def worker(q, r):
+    p = veo.VeoProc(0)
+    ve_buf = p.alloc_mem(n * 8)
+    total = 0.0
+    while True:
+        b = q.get()
+        if b is None:
+            break
+        if isinstance(b, SysVShm):
+            p.write_mem(ve_buf, b, b.size)
+            a = b.array(np.float64, n)
+            total += a[0]
+            del a
+            b.detach()
+        else:
+            p.write_mem(ve_buf, b, b.nbytes)
+            total += b[0]
+        r.put(True)
+    p.free_mem(ve_buf)
+    del p
+    r.put(total)
+
+
+def run(use_shm):
+    q, r = mp.Queue(), mp.Queue()
+    w = mp.Process(target=worker, args=(q, r))
+    w.start()
+    segs = [SysVShm(size=n * 8) for i in range(2)] if use_shm else None
+    t0 = time.perf_counter()
+    for i in range(nbatch):
+        if use_shm:
+            if i >= 2:
+                r.get()
+            s = segs[i % 2]
+            a = s.array(np.float64, n)
+            a[:] = i
+            del a
+            q.put(s)
+        else:
+            if i >= 2:
+                r.get()
+            q.put(np.full(n, float(i)))
+    for i in range(min(nbatch, 2)):
+        r.get()
+    dt = time.perf_counter() - t0
+    q.put(None)
+    total = r.get()
+    w.join()
+    assert total == sum(range(nbatch))
+    if use_shm:
+        for s in segs:
+            s.detach()
+    return dt
+
+
+for label, use_shm in (("pickled numpy arrays", False),
+                       ("SysVShm segments", True)):
+    dt = run(use_shm)
+    print("%-22s %8.2f ms/batch %8.2f GB/s" % (label, dt / nbatch * 1e3,
+                                               nbatch * n * 8 / dt / 1e9))
+
+print("finished")
@@ -0,0 +1,73 @@
+import veo
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+
+print("\nVEO benchmark:")
+print("Throughput of Python threads each feeding its own VE context.")
+print("Blocking waits and transfers release the GIL, so the throughput")
+print("should scale linearly with the number of contexts.\n")
+
+usecs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+ncalls = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+maxthr = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+lib.busy_usec.args_type("long")
+lib.busy_usec.ret_type("long")
+ctxs = [p.open_context() for i in range(maxthr)]
+
+
+def run_threads(nthr, work):
+    thr = [threading.Thread(target=work, args=(ctxs[i],)) for i in range(nthr)]
+    t0 = time.perf_counter()
+    for t in thr:
+        t.start()
+    for t in thr:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def calls(ctx):
+    for i in range(ncalls):
+        lib.busy_usec(ctx, usecs).wait_result()
+
+
+print("kernel runtime %d us, %d calls per thread" % (usecs, ncalls))
+base = None
+nthr = 1
+while nthr <= maxthr:
+    dt = run_threads(nthr, calls)
+    rate = nthr * ncalls / dt
+    if base is None:
+        base = rate
+    print("%2d contexts: %10.0f calls/s  speedup %5.2f" % (nthr, rate, rate / base))
+    nthr *= 2
+
+size = 32 << 20
+ve_buff = [p.alloc_mem(size) for i in range(maxthr)]
+buff = [np.ones(size, dtype=np.uint8) for i in range(maxthr)]
+
+
+def transfers(ctx):
+    i = ctxs.index(ctx)
+    for j in range(8):
+        p.write_mem(ve_buff[i], buff[i], size)
+        p.read_mem(buff[i], ve_buff[i], size)
+
+
+print("\nread_mem + write_mem of %d MiB per thread" % (size >> 20))
+nthr = 1
+while nthr <= maxthr:
+    dt = run_threads(nthr, transfers)
+    print("%2d threads: %8.3f GB/s" % (nthr, nthr * 16 * size / dt / 1e9))
+    nthr *= 2
+
+for a in ve_buff:
+    p.free_mem(a)
+del p
+print("finished")
@@ -0,0 +1,47 @@
+import veo
+import os
+import sys
+import time
+from veo import logging as vlog
+
+
+print("\nVEO benchmark:")
+print("Cost of a small call (submit + wait_result) with tracing disabled,")
+print("with tracing into the ring buffer and with text logging of the")
+print("veo logger into /dev/null.\n")
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+lib = p.load_library(os.path.abspath("libvebench.so"))
+f = lib.find_function("sum4")
+f.args_type("long", "long", "long", "long")
+f.ret_type("long")
+
+
+def loop():
+    t0 = time.perf_counter()
+    for i in range(ncalls):
+        f(ctx, i, 1, 2, 3).wait_result()
+    return (time.perf_counter() - t0) / ncalls
+
+
+loop()
+print("%-22s %8.2fus per call" % ("tracing disabled", loop() * 1e6))
+
+with vlog.tracing(capacity=1 << 16):
+    dt = loop()
+print("%-22s %8.2fus per call" % ("tracing", dt * 1e6))
+events, names, dropped = vlog.trace_events()
+print("%-22s %8d events, %d dropped" % ("", len(events), dropped))
+trace = vlog.chrome_trace()
+
+devnull = open(os.devnull, "w")
+vlog.set_stream_handler(vlog.VEO, stream=devnull)
+dt = loop()
+vlog.reset_handler(vlog.VEO)
+print("%-22s %8.2fus per call" % ("text logging", dt * 1e6))
+
+del p
+print("finished")
@@ -0,0 +1,47 @@
+import veo
+import sys
+import time
+from veo.transfer import TransferEngine
+
+
+print("\nVEO benchmark:")
+print("Transfer bandwidth of a large buffer, with one synchronous")
+print("read_mem/write_mem and with the TransferEngine, per number of")
+print("contexts and chunk size.\n")
+
+size = int(sys.argv[1]) << 20 if len(sys.argv) > 1 else 256 << 20
+nrep = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+np = veo.np
+
+p = veo.VeoProc(0)
+buf = np.ones(size, dtype=np.uint8)
+ve_buf = p.alloc_mem(size)
+
+
+def gbs(f):
+    f()
+    t0 = time.perf_counter()
+    for i in range(nrep):
+        f()
+    return size * nrep / (time.perf_counter() - t0) / 1e9
+
+
+print("%-8s %10s %12s %12s" % ("ctxs", "chunk", "write GB/s", "read GB/s"))
+print("%-8s %10s %12.2f %12.2f" % (
+    "proc", "-",
+    gbs(lambda: p.write_mem(ve_buf, buf, size)),
+    gbs(lambda: p.read_mem(buf, ve_buf, size))))
+
+for nctx in (1, 2, 4, 8):
+    eng = TransferEngine(p, nctx=nctx)
+    for chunk in (1 << 20, 4 << 20, 16 << 20, 64 << 20):
+        eng.chunk_size = chunk
+        print("%-8d %9dM %12.2f %12.2f" % (
+            nctx, chunk >> 20,
+            gbs(lambda: eng.write_mem(ve_buf, buf, size)),
+            gbs(lambda: eng.read_mem(buf, ve_buf, size))))
+    eng.close()
+
+p.free_mem(ve_buf)
+del p
+print("finished")
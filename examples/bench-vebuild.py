@@ -0,0 +1,36 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from veo import VeBuild
+
+
+print("\nVeBuild benchmark:")
+print("Wall time of building a .so from N source blocks, compiling the")
+print("blocks one after another and in parallel. The compiler is the")
+print("fake-ncc script, which sleeps before running the host compiler.\n")
+
+maxblk = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+ncc = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake-ncc")
+
+print("%-8s %12s %12s" % ("blocks", "serial [s]", "parallel [s]"))
+nblk = 1
+while nblk <= maxblk:
+    times = []
+    for jobs in (1, nblk):
+        with tempfile.TemporaryDirectory() as d:
+            bld = VeBuild()
+            bld.set_build_dir(d)
+            for i in range(nblk):
+                bld.set_c_src("blk%d" % i, "int f%d(int a) { return a + %d; }\n" % (i, i),
+                              flags="-O2 -fpic", compiler=ncc)
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                so = bld.build_so(flags="-shared", linker=ncc, jobs=jobs)
+            times.append(time.perf_counter() - t0)
+            assert so is not None
+    print("%-8d %12.2f %12.2f" % (nblk, times[0], times[1]))
+    nblk *= 2
+print("finished")
@@ -0,0 +1,59 @@
+import veo
+import numpy as np
+import sys
+import time
+from veo.vecopy import copy_between
+
+
+print("\nVEO benchmark:")
+print("Copies of VE memory from one VeoProc to another: read_mem() into a")
+print("numpy array and write_mem() from it, copy_between() staged through a")
+print("ring of host buffers and copy_between() with veo_hmemcpy().\n")
+
+nrep = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+p0 = veo.VeoProc(0)
+p1 = veo.VeoProc(1)
+c0 = p0.open_context()
+c1 = p1.open_context()
+
+
+def bounce(src, dst, size):
+    a = np.empty(size, dtype=np.uint8)
+    p0.read_mem(a, src, size)
+    p1.write_mem(dst, a, size)
+
+
+def staged(src, dst, size):
+    copy_between(p0, src, p1, dst, size, method="staged")
+
+
+def hmem(src, dst, size):
+    copy_between(p0, src, p1, dst, size, method="hmem")
+
+
+for size, label in ((64 << 10, "64 KiB halo"), (64 << 20, "64 MiB")):
+    src = p0.alloc_mem(size)
+    dst = p1.alloc_mem(size)
+    ref = np.random.randint(0, 256, size, dtype=np.uint8)
+    p0.write_mem(src, ref, size)
+    n = nrep * (64 if size < 1 << 20 else 1)
+    print(label)
+    for name, copy in (("read_mem + write_mem", bounce),
+                       ("copy_between staged", staged),
+                       ("copy_between hmem", hmem)):
+        p1.write_mem(dst, np.zeros(size, dtype=np.uint8), size)
+        copy(src, dst, size)
+        t0 = time.perf_counter()
+        for i in range(n):
+            copy(src, dst, size)
+        dt = (time.perf_counter() - t0) / n
+        out = np.empty(size, dtype=np.uint8)
+        p1.read_mem(out, dst, size)
+        assert (out == ref).all()
+        print("  %-22s %10.1fus %8.2f GB/s" % (name, dt * 1e6, size / dt / 1e9))
+    p0.free_mem(src)
+    p1.free_mem(dst)
+
+del p0, p1
+print("finished")
@@ -0,0 +1,95 @@
+import veo
+import os
+import sys
+import time
+import numpy as np
+
+
+print("\nVEO benchmark:")
+print("Measure the VH side overhead per call and per memory transfer.")
+print("Run on a VE or on the host emulation (VEO_EMULATE=1 build).\n")
+
+
+def timeit(label, n, func):
+    t0 = time.perf_counter()
+    func(n)
+    dt = time.perf_counter() - t0
+    print("%-36s %10.2f us/op %12.0f op/s" % (label, dt / n * 1e6, n / dt))
+
+
+def timebw(label, n, size, func):
+    t0 = time.perf_counter()
+    func(n)
+    dt = time.perf_counter() - t0
+    print("%-36s %10.2f us/op %10.3f GB/s" % (label, dt / n * 1e6,
+                                                n * size / dt / 1e9))
+
+
+ncalls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvebench.so")
+c = p.open_context()
+print("VEO version: %s\n" % veo._veo._veo_version)
+
+lib.empty0.args_type()
+lib.empty0.ret_type("long")
+lib.sum4.args_type("long", "long", "long", "long")
+lib.sum4.ret_type("long")
+lib.sum8.args_type(*(["long"] * 8))
+lib.sum8.ret_type("long")
+
+assert lib.sum4(c, 1, 2, 3, 4).wait_result() == 10
+
+
+def call_wait0(n):
+    for i in range(n):
+        lib.empty0(c).wait_result()
+
+
+def call_wait4(n):
+    for i in range(n):
+        lib.sum4(c, 1, 2, 3, 4).wait_result()
+
+
+def call_wait8(n):
+    for i in range(n):
+        lib.sum8(c, 1, 2, 3, 4, 5, 6, 7, 8).wait_result()
+
+
+def submit_then_wait4(n):
+    reqs = [lib.sum4(c, 1, 2, 3, i) for i in range(n)]
+    for r in reqs:
+        r.wait_result()
+
+
+timeit("call + wait, 0 args", ncalls, call_wait0)
+timeit("call + wait, 4 args", ncalls, call_wait4)
+timeit("call + wait, 8 args", ncalls, call_wait8)
+timeit("submit all, then wait, 4 args", ncalls, submit_then_wait4)
+print()
+
+for size in (8, 4096, 1 << 20, 64 << 20):
+    buff = np.ones(size, dtype=np.uint8)
+    ve_buff = p.alloc_mem(size)
+    n = max(10, min(ncalls, (1 << 30) // size))
+
+    def write(n):
+        for i in range(n):
+            p.write_mem(ve_buff, buff, size)
+
+    def read(n):
+        for i in range(n):
+            p.read_mem(buff, ve_buff, size)
+
+    def async_write(n):
+        for i in range(n):
+            c.async_write_mem(ve_buff, buff, size).wait_result()
+
+    timebw("write_mem %d bytes" % size, n, size, write)
+    timebw("read_mem %d bytes" % size, n, size, read)
+    timebw("async_write_mem + wait %d bytes" % size, n, size, async_write)
+    p.free_mem(ve_buff)
+
+del p
+print("finished")
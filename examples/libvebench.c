@@ -0,0 +1,37 @@
+//
+// /opt/nec/ve/bin/ncc -shared -fpic -pthread -o libvebench.so libvebench.c
+//
+// Trivial kernels for measuring the VH side overhead of py-veo.
+//
+#include <stdint.h>
+#include <unistd.h>
+
+int64_t empty0(void)
+{
+	return 0;
+}
+
+int64_t sum4(int64_t a, int64_t b, int64_t c, int64_t d)
+{
+	return a + b + c + d;
+}
+
+int64_t sum8(int64_t a1, int64_t a2, int64_t a3, int64_t a4,
+	     int64_t a5, int64_t a6, int64_t a7, int64_t a8)
+{
+	return a1 + a2 + a3 + a4 + a5 + a6 + a7 + a8;
+}
+
+int64_t busy_usec(int64_t usecs)
+{
+	usleep(usecs);
+	return usecs;
+}
+
+int64_t lsum(const int64_t *a, int64_t n)
+{
+	int64_t s = 0;
+	for (int64_t i = 0; i < n; i++)
+		s += a[i];
+	return s;
+}
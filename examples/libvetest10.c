@@ -0,0 +1,10 @@
+#include <stdint.h>
+
+int64_t axpy(double a, double *x, double *y, int64_t n)
+{
+	int64_t i;
+
+	for (i = 0; i < n; i++)
+		y[i] += a * x[i];
+	return n;
+}
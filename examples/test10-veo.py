@@ -0,0 +1,40 @@
+import veo
+import os
+np = veo.np
+
+
+print("""
+VEO test:
+
+VeArray: arrays in VE memory with a lazily synchronized host copy.
+
+x is created from a numpy array and written to the VE when it is first
+passed to a VE function. y is initialized on the host. axpy() computes
+y += a * x on the VE, y is read back only when it is accessed on the
+host. Repeated calls do not transfer any data.
+""")
+
+p = veo.VeoProc(0)
+lib = p.load_library(os.getcwd() + "/libvetest10.so")
+ctx = p.open_context()
+lib.axpy.args_type("double", "double *", "double *", "long")
+lib.axpy.ret_type("long")
+
+n = 10
+x = veo.VeArray.from_host(p, np.arange(n, dtype=np.float64), ctx=ctx)
+y = veo.VeArray(p, n, np.float64, ctx=ctx)
+y[:] = 1.0
+print(x, y)
+
+for i in range(3):
+    lib.axpy(ctx, 2.0, x.ve_ptr(write=False), y, n).wait_result()
+print(x, y)
+
+res = np.asarray(y)
+print("y = %r" % res)
+assert (res == 1.0 + 6.0 * np.arange(n)).all()
+assert not x.host_dirty and not x.device_dirty and not y.device_dirty
+
+del x, y
+del p
+print("finished")
@@ -0,0 +1,50 @@
+import veo
+import os
+from veo.veufunc import VeUfunc
+np = veo.np
+
+
+print("""
+VEO test:
+
+VeUfunc: elementwise VE kernels generated from C expressions.
+
+axpy = VeUfunc("a * x + y", "a, x, y") is built for the signature
+(double scalar, double array, double array) on the first call and for
+(float scalar, float array, float array) on the call with float32
+arrays. The last call keeps the result in a VeArray on the VE.
+The compiler and its flags are taken from the VECC and VECOPTS
+environment variables, if set.
+""")
+
+cc = os.getenv("VECC")
+flags = os.getenv("VECOPTS")
+p = veo.VeoProc(0)
+ctx = p.open_context()
+
+axpy = VeUfunc("a * x + y", "a, x, y", compiler=cc, flags=flags)
+hyp = VeUfunc("sqrt(x * x + y * y)", "x, y", compiler=cc, flags=flags)
+
+x = np.arange(1000, dtype=np.float64)
+y = np.ones(1000)
+z = axpy(ctx, 2.0, x, y)
+print("axpy float64: %r" % z[:5])
+assert (z == 2.0 * x + y).all()
+
+z32 = axpy(ctx, np.float32(3.0), x.astype(np.float32), y.astype(np.float32))
+print("axpy float32: %r" % z32[:5])
+assert z32.dtype == np.float32 and (z32 == 3 * x + 1).all()
+
+h = hyp(ctx, np.full((10, 10), 3.0), np.full((10, 10), 4.0))
+assert h.shape == (10, 10) and (h == 5.0).all()
+
+vx = veo.VeArray.from_host(p, x, ctx=ctx)
+vz = veo.VeArray(p, x.shape, np.float64, ctx=ctx)
+axpy(ctx, 2.0, vx, y, out=vz)
+assert vz.device_dirty
+assert (np.asarray(vz) == z).all()
+print(axpy)
+
+del vx, vz
+del p
+print("finished")
@@ -0,0 +1,74 @@
+import veo
+import os
+import tempfile
+from veo import VeBuild, VeBuildCache
+
+
+print("""
+VEO test:
+
+VeBuildCache: content-addressed cache of compiled objects and linked
+shared objects.
+
+A .so is built from two source blocks with an empty cache, then again
+unchanged: the second build copies the cached .so without compiling.
+Changing the flags of one block recompiles only that block. After
+trim() the cache is empty and everything is compiled again. Changing a
+header included by a block recompiles that block. Every
+built .so is loaded and called. The compiler and its flags are taken
+from the VECC and VECOPTS environment variables, if set.
+""")
+
+cc = os.getenv("VECC", "/opt/nec/ve/bin/ncc")
+flags = os.getenv("VECOPTS", "-O2 -fpic -pthread")
+
+src_a = "#include \"t12.h\"\nlong add1(long x) { return x + ONE; }\n"
+src_b = "long add1(long x);\nlong add2(long x) { return add1(add1(x)); }\n"
+
+p = veo.VeoProc(0)
+ctx = p.open_context()
+tmp = tempfile.TemporaryDirectory()
+flags_a = flags + " -I" + tmp.name
+with open(os.path.join(tmp.name, "t12.h"), "w") as f:
+    f.write("#define ONE 1\n")
+cache = VeBuildCache(os.path.join(tmp.name, "cache"), max_bytes=1 << 26)
+
+
+def build(n, flags_b, expect=42):
+    bld = VeBuild(cache=cache)
+    bld.set_build_dir(os.path.join(tmp.name, "build%d" % n))
+    bld.set_c_src("a", src_a, flags=flags_a, compiler=cc)
+    bld.set_c_src("b", src_b, flags=flags_b, compiler=cc)
+    h0, m0 = cache.hits, cache.misses
+    so = bld.build_so(label="t12", linker=cc)
+    assert so is not None
+    lib = p.load_library(so)
+    lib.add2.args_type("long")
+    lib.add2.ret_type("long")
+    assert lib.add2(ctx, 40).wait_result() == expect
+    return cache.hits - h0, cache.misses - m0
+
+
+# .so, a.o and b.o miss
+assert build(1, flags) == (0, 3)
+assert cache.stats()["entries"] == 3
+# the .so is a hit, nothing is compiled
+assert build(2, flags) == (1, 0)
+# .so and b.o miss, a.o is a hit
+assert build(3, flags + " -DVARIANT=1") == (1, 2)
+assert cache.stats()["entries"] == 5
+print(cache.stats())
+
+assert cache.trim(0) == 0
+assert cache.stats()["entries"] == 0
+assert build(4, flags) == (0, 3)
+print(cache.stats())
+
+# a.o includes t12.h, changing it misses .so and a.o
+with open(os.path.join(tmp.name, "t12.h"), "w") as f:
+    f.write("#define ONE 2\n")
+assert build(5, flags, expect=44) == (1, 2)
+
+tmp.cleanup()
+del p
+print("finished")
@@ -0,0 +1,63 @@
+import veo
+import multiprocessing as mp
+from veo.sysvshm import SysVShm
+np = veo.np
+
+
+print("""
+VEO test:
+
+SysVShm hand-off: the sender fills a segment, sends seg.handoff() through
+a pipe and detaches before the receiver process is started. The receiver
+attaches the segment, writes it to the VE and reads it back. When it
+detaches the segment is removed, no process owns it anymore.
+""")
+
+n = 1 << 16
+
+
+def receiver(conn, r):
+    seg = conn.recv()
+    p = veo.VeoProc(0)
+    ve_buf = p.alloc_mem(seg.size)
+    p.write_mem(ve_buf, seg, seg.size)
+    back = np.empty(n, dtype=np.float64)
+    p.read_mem(back, ve_buf, seg.size)
+    p.free_mem(ve_buf)
+    del p
+    a = seg.array(np.float64, n)
+    ok = bool((back == a).all())
+    del a
+    assert seg.auto_remove
+    seg.detach()
+    r.put(ok)
+
+
+conn, sender = mp.Pipe(duplex=False)
+r = mp.Queue()
+seg = SysVShm(size=n * 8)
+shmid = seg.shmid
+a = seg.array(np.float64, n)
+a[:] = np.arange(n)
+del a
+# pickled and written into the pipe before the sender lets go of it
+sender.send(seg.handoff())
+seg.detach()
+del seg
+print("sender detached segment %d" % shmid)
+
+w = mp.Process(target=receiver, args=(conn, r))
+w.start()
+assert r.get(timeout=60)
+w.join()
+assert w.exitcode == 0
+print("receiver attached, transferred and detached")
+
+try:
+    SysVShm(shmid=shmid)
+except OSError:
+    print("segment %d is removed" % shmid)
+else:
+    raise AssertionError("segment %d still exists" % shmid)
+
+print("finished")
@@ -17,17 +17,30 @@ if not VEO_LIB_DIR:
 VEO_INC_DIR = os.getenv("VEO_INC_DIR")
 if not VEO_INC_DIR:
     VEO_INC_DIR = "/opt/nec/ve/veos/include"
+# build against the host emulation of libveo in veo/emu instead of libveo
+VEO_EMULATE = os.getenv("VEO_EMULATE", "0") not in ("", "0")
 
 
-_ext_mods=[
-    Extension("veo._veo",
-              sources=["veo/_veo" + ext],
-              libraries=["veo"], # Unix-like specific
-              library_dirs=["veo", VEO_LIB_DIR],
-              include_dirs=["veo", VEO_INC_DIR, numpy.get_include()],
-              extra_link_args=["-Wl,-rpath=%s" % VEO_LIB_DIR]
-    ),
-]
+if VEO_EMULATE:
+    _ext_mods=[
+        Extension("veo._veo",
+                  sources=["veo/_veo" + ext, "veo/emu/veo_emu.c"],
+                  libraries=["dl", "pthread"],
+                  include_dirs=["veo/emu", "veo", numpy.get_include()],
+        ),
+        Extension("veo.sysvshm", sources=["veo/sysvshm" + ext]),
+    ]
+else:
+    _ext_mods=[
+        Extension("veo._veo",
+                  sources=["veo/_veo" + ext],
+                  libraries=["veo"], # Unix-like specific
+                  library_dirs=["veo", VEO_LIB_DIR],
+                  include_dirs=["veo", VEO_INC_DIR, numpy.get_include()],
+                  extra_link_args=["-Wl,-rpath=%s" % VEO_LIB_DIR]
+        ),
+        Extension("veo.sysvshm", sources=["veo/sysvshm" + ext]),
+    ]
 
 _example_files = glob.glob("./examples/*.py")
 _example_files.extend(glob.glob("./examples/*.c"))
@@ -51,6 +64,7 @@ setup(
     ext_modules = ext_mods,
     data_files = [("share/py-veo/examples", _example_files), ("share/py-veo", ["README.md"])],
     packages = [ "veo", "veo.logging" ],
+    package_data = {"veo": ["veo_dispatch.c", "veo_ring.c"]},
     author = "Erich Focht",
     author_email = "efocht@gmail.com",
     license = "BSD",
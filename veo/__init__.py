@@ -11,3 +11,4 @@
 
 from veo._veo import *  # NOQA
 from veo.vebuild import *  # NOQA
+from veo.vearray import VeArray  # NOQA
@@ -9,6 +9,7 @@
 # See LICENSE file for details.
 #
 from veo.libveo cimport *
+from libcpp.unordered_map cimport unordered_map
 
 cdef _proc_init_hook
 
@@ -50,12 +51,44 @@ cdef union U64:
     double d64
 
 
+#
+# Performance counters kept in VeoFunction, VeoCtxt and VeoProc, see
+# stats.pxi. The latency histogram has log-linear buckets over
+# nanoseconds: 8 sub-buckets per power of two.
+#
+cdef enum:
+    _HIST_SUB_BITS = 3
+    _HIST_BUCKETS = 320
+
+cdef struct _VeoStats:
+    uint64_t calls
+    uint64_t errors
+    uint64_t reads
+    uint64_t writes
+    uint64_t bytes_read
+    uint64_t bytes_written
+    uint64_t allocs
+    uint64_t frees
+    int64_t bytes_allocated
+    uint64_t lat_count
+    double lat_sum
+    double lat_max
+    uint64_t lat_hist[_HIST_BUCKETS]
+
+
 cdef class VeoProc(object):
     cdef veo_proc_handle *proc_handle
     cdef readonly int nodeid
     cdef readonly list context
     cdef readonly dict lib
     cdef readonly int tid
+    cdef readonly object mem_pool
+    cdef public object dispatcher
+    cdef public object device_cache
+    cdef object __weakref__
+    cdef _VeoStats _stats
+    # sizes of the live allocations, for bytes_allocated
+    cdef unordered_map[uint64_t, uint64_t] _alloc_sizes
 
 
 cdef class VeoLibrary(object):
@@ -72,15 +105,39 @@ cdef class VeoFunction(object):
     cdef readonly name
     cdef readonly _args_type
     cdef readonly _ret_type
-    cdef args_conv
+    cdef int _argc
+    cdef int _argt[VEO_MAX_NUM_ARGS]
+    cdef int _rett
     cdef ret_conv
+    cdef _VeoStats _stats
+
+    cdef VeoArgs _make_args(self, tuple args)
+    cdef int _pack(self, tuple args, uint64_t *rec) except -1
+    cdef _result(self, uint64_t x)
 
 
 cdef class VeoRequest(object):
     cdef readonly uint64_t req
     cdef readonly VeoCtxt ctx
     cdef ret_conv
+    cdef int ret_code
     cdef VeoArgs args
+    cdef bint _done
+    cdef bint _waiting
+    cdef int _rc
+    cdef uint64_t _res
+    cdef double _t0
+    cdef VeoFunction _func
+
+    cdef _release(self)
+    cdef _complete(self, int rc, uint64_t res)
+    cdef _result(self, bint peek)
+    cdef bint _poll(self)
+    cdef _wait_other(self)
+
+    @staticmethod
+    cdef VeoRequest _new(VeoCtxt ctx, VeoArgs args, uint64_t req, ret_conv,
+                         int ret_code)
 
 
 cdef class VeoMemRequest(VeoRequest):
@@ -99,13 +156,34 @@ cdef class OnStack(object):
 
 cdef class VeoArgs(object):
     cdef veo_args *args
-    cdef readonly list stacks
+    # OnStack buffers referenced by the arguments, by argument number
+    cdef dict _stacks
+    cdef bint _pooled
+
+    cdef int _set(self, int argnum, int code, x) except -1
+    cdef int _set_stack(self, OnStack x, int argnum) except -1
+
+
+cdef class VeoCall(object):
+    cdef readonly VeoFunction func
+    cdef readonly VeoArgs args
+    cdef VeoRequest _req
+    cdef uint64_t _bound        # bit mask of the arguments set
+
+    cdef int _check_idle(self) except -1
+    cdef int _check_argnum(self, int argnum) except -1
+    cdef int _check_set(self, int argnum, int rc) except -1
+    cdef int _check_bound(self) except -1
 
 
 cdef class VeoCtxt(object):
     cdef veo_thr_ctxt *thr_ctxt
-    cdef VeoProc proc
+    cdef readonly VeoProc proc
     cdef readonly int tid
+    cdef _VeoStats _stats
+    cdef object _graph      # VeoGraph capturing the context
+
+    cdef _capture_mem(self, int kind, addr, buf, Py_ssize_t size)
 
 cdef class VEO_HMEM(object):
     pass
@@ -24,8 +24,15 @@ from cpython.buffer cimport \
     PyObject_CheckBuffer, PyBuffer_Release
 import numpy as np
 # cimport numpy as np
+cimport cython
+from libc.stdlib cimport malloc, calloc, free
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+from posix.unistd cimport usleep
 
 include "conv_i64.pxi"
+include "trace.pxi"
+include "stats.pxi"
+include "graph.pxi"
 
 
 _veo_api_version = VEO_API_VERSION
@@ -35,6 +42,16 @@ _veo_version = veo_version_string().decode()
 #                      % _veo_api_version)
 _veo_max_num_args = VEO_MAX_NUM_ARGS
 
+#
+# Records of the VE side call dispatcher (veo/veo_dispatch.c): a batch is
+# an array of uint64 words, the number of calls followed by one record
+# per call of function address, number of arguments, the argument
+# registers and the result.
+#
+cdef enum:
+    _DISPATCH_MAX_ARGS = 8
+    _DISPATCH_REC = 11
+
 
 cdef _proc_init_hook
 _proc_init_hook = list()
@@ -86,7 +103,8 @@ cdef class VeoFunction(object):
         self.lib = lib
         self.addr = addr
         self.name = name
-        self.args_conv = None
+        self._argc = 0
+        self._rett = _T_INT
         self.ret_conv = conv_from_i64_func(self.lib.proc, "int")
 
     def __repr__(self):
@@ -95,16 +113,35 @@ cdef class VeoFunction(object):
         return out
 
     def args_type(self, *args):
-        self._args_type = args
-        self.args_conv = list()
+        """
+        Set the argument types and compile them into the type codes
+        used for converting the arguments of a call.
+        """
+        cdef int code, argc = 0
         for t in args:
-            if t == "void":
+            code = type_code(t)
+            if code == _T_VOID:
                 continue
-            self.args_conv.append(conv_to_i64_func(self.lib.proc, t))
+            if argc >= _veo_max_num_args:
+                raise ValueError("args_type: too many arguments (%d)" % len(args))
+            self._argt[argc] = code
+            argc += 1
+        self._argc = argc
+        self._args_type = args
 
     def ret_type(self, rettype):
-        self._ret_type = rettype
         self.ret_conv = conv_from_i64_func(self.lib.proc, rettype)
+        self._rett = type_code(rettype)
+        if (self._rett == _T_PTR and type(self.lib.proc).i64_to_addr
+                is not VeoProc.i64_to_addr):
+            # the proc translates VE addresses, convert through its hook
+            self._rett = _T_NONE
+        self._ret_type = rettype
+
+    cdef _result(self, uint64_t x):
+        if self._rett != _T_NONE:
+            return conv_from_i64(self._rett, x)
+        return self.ret_conv(<int64_t>x)
 
     def __call__(self, VeoCtxt ctx, *args):
         """
@@ -122,39 +159,21 @@ cdef class VeoFunction(object):
         is a memoryview of the object and size its length. Look at
         examples/pass_on_stack.py for an example.
 
-        Returns: VeoRequest instance, None in case of error.
+        Returns: VeoRequest instance, None in case of error or while the
+        context is captured into a VeoGraph.
         """
-        if self._args_type is None:
-            raise RuntimeError("VeoFunction needs arguments format info before call()")
-        if len(args) > _veo_max_num_args:
-            raise ValueError("call_async: too many arguments (%d)" % len(args))
-        if len(args) != len(self.args_conv):
-            raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
-                             .format(len(self.args_conv), len(args)))
-
-        a = VeoArgs()
-        for i in xrange(len(self.args_conv)):
-            x = args[i]
-            if hasattr(x, "_ve_array"):
-                x = x._ve_array
-            if isinstance(x, OnStack):
-                try:
-                    # a.set_stack(x.scope(), i, x.c_pointer(), x.size())
-                    a.set_stack(x, i)
-                except Exception as e:
-                    raise ValueError("%r : arg on stack: c_pointer = %r, size = %r" %
-                                     (e, x.c_pointer(), x.size()))
-            else:
-                f = self.args_conv[i]
-                try:
-                    a.set_i64(i, f(x))
-                except Exception as e:
-                    raise ValueError("%r : args conversion: f = %r, x = %r" % (e, f, x))
-
+        cdef VeoArgs a
+        cdef VeoRequest r
         cdef uint64_t res
+        if ctx._graph is not None:
+            (<VeoGraph>ctx._graph)._record_call(self, args)
+            return None
+        a = self._make_args(args)
         with nogil:
             res = veo_call_async(ctx.thr_ctxt, self.addr, a.args)
         if res == VEO_REQUEST_ID_INVALID:
+            _args_put(a)
+            _count_call(self, ctx, False)
             return None
             # raise RuntimeError("veo_call_async failed")
         #
@@ -166,9 +185,105 @@ cdef class VeoFunction(object):
             _vp_logging.info(
                 _vp_logging.VEO,
                 'veo_call_async: name=%s, reqid=%d', self.name, res)
-        return VeoRequest(ctx, a, res, self.ret_conv)
+        if _tracing:
+            _trace(_TR_CALL, <uint64_t>ctx.thr_ctxt, ctx.proc.nodeid, res, 0,
+                   _trace_name(self.name))
+        _count_call(self, ctx, True)
+        r = VeoRequest._new(ctx, a, res, self.ret_conv, self._rett)
+        r._func = self
+        return r
+
+    def prepare(self, *args):
+        """
+        Create a prepared call of this function, see VeoCall.
+        """
+        return VeoCall(self, *args)
 
+    def map(self, ctxs, *columns, Py_ssize_t window=256):
+        """
+        Call the function once per row of a table of arguments and return
+        the results as numpy array.
+
+        columns are one array (or scalar) per argument, broadcast against
+        each other, or one structured array with a field per argument.
+        They are converted to the argument types column by column, then
+        all calls are submitted round robin to the contexts ctxs (one
+        VeoCtxt or a sequence) and waited for in C without the GIL, with
+        at most window calls in flight per context. The result array has
+        the broadcast shape of the columns and the dtype of ret_type().
+        """
+        return _map_calls(self, ctxs, columns, window)
 
+    def stats(self):
+        """
+        Snapshot of the performance counters of the function as dict,
+        see veo.perfstats.
+        """
+        return _stats_dict(&self._stats)
+
+    def reset_stats(self):
+        _stats_reset(&self._stats)
+
+    cdef VeoArgs _make_args(self, tuple args):
+        """
+        Convert the arguments of a call into a VeoArgs from the pool.
+        """
+        if self._args_type is None:
+            raise RuntimeError("VeoFunction needs arguments format info before call()")
+        if len(args) > _veo_max_num_args:
+            raise ValueError("call_async: too many arguments (%d)" % len(args))
+        if len(args) != self._argc:
+            raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
+                             .format(self._argc, len(args)))
+
+        cdef VeoArgs a = _args_get()
+        cdef int i = 0
+        try:
+            for i in range(self._argc):
+                a._set(i, self._argt[i], args[i])
+        except Exception as e:
+            _args_put(a)
+            raise ValueError("%r : args conversion: arg %d = %r" % (e, i, args[i]))
+        return a
+
+    cdef int _pack(self, tuple args, uint64_t *rec) except -1:
+        """
+        Pack a call into a dispatcher record: function address, number of
+        arguments, 8 argument registers and the result slot.
+        """
+        cdef int i, code
+        if self._args_type is None:
+            raise RuntimeError("VeoFunction needs arguments format info before call()")
+        if self._argc > _DISPATCH_MAX_ARGS:
+            raise TypeError("%s: the dispatcher passes at most %d arguments"
+                            % (self.name, _DISPATCH_MAX_ARGS))
+        if len(args) != self._argc:
+            raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
+                             .format(self._argc, len(args)))
+        rec[0] = self.addr
+        rec[1] = self._argc
+        for i in range(_DISPATCH_MAX_ARGS + 1):
+            rec[2 + i] = 0
+        for i in range(self._argc):
+            x = args[i]
+            code = self._argt[i]
+            if type(x) is not int:
+                x = getattr(x, "_ve_array", x)
+            if code == _T_LONG:
+                rec[2 + i] = <uint64_t><int64_t>x
+            elif code == _T_PTR or code == _T_ULONG:
+                rec[2 + i] = <uint64_t>x
+            elif code == _T_INT or code == _T_SHORT or code == _T_CHAR:
+                rec[2 + i] = <uint64_t><int64_t><int32_t>x
+            elif code == _T_UINT or code == _T_USHORT or code == _T_UCHAR:
+                rec[2 + i] = <uint64_t><uint32_t>x
+            else:
+                raise TypeError("%s: the dispatcher passes integer and pointer "
+                                "arguments only" % self.name)
+        return 0
+
+
+@cython.freelist(64)
 cdef class VeoRequest(object):
     """
     VE offload call request
@@ -184,68 +299,618 @@ cdef class VeoRequest(object):
         self.args = args
         self.ret_conv = ret_conv
 
+    @staticmethod
+    cdef VeoRequest _new(VeoCtxt ctx, VeoArgs args, uint64_t req, ret_conv,
+                         int ret_code):
+        """
+        Fast constructor, bypasses __init__. With a ret_code other than
+        _T_NONE the result is converted by conv_from_i64() instead of
+        calling ret_conv.
+        """
+        cdef VeoRequest r = VeoRequest.__new__(VeoRequest)
+        r.ctx = ctx
+        r.req = req
+        r.args = args
+        r.ret_conv = ret_conv
+        r.ret_code = ret_code
+        r._t0 = _monotonic()
+        return r
+
     def __repr__(self):
         out = "<%s object req %d in context %r>" % \
               (self.__class__.__name__, self.req, self.ctx)
         return out
 
-    def wait_result(self):
-        cdef uint64_t res
-        cdef int rc = veo_call_wait_result(self.ctx.thr_ctxt, self.req, &res)
-        if rc == VEO_COMMAND_EXCEPTION:
+    cdef _release(self):
+        """
+        Recycle the arguments of the request once it is finished.
+        """
+        if self.args is not None and self.args._pooled:
+            _args_put(self.args)
+        self.args = None
+
+    cdef _complete(self, int rc, uint64_t res):
+        """
+        Store the status and raw result of the finished request. The
+        result is kept, later calls of wait_result() or peek_result()
+        return it again.
+        """
+        cdef double dt = _monotonic() - self._t0
+        self._done = True
+        self._rc = rc
+        self._res = res
+        self._release()
+        _stats_done(&self.ctx._stats, rc, dt)
+        _stats_done(&self.ctx.proc._stats, rc, dt)
+        if self._func is not None:
+            _stats_done(&self._func._stats, rc, dt)
+        if _tracing:
+            _trace(_TR_DONE, <uint64_t>self.ctx.thr_ctxt, self.ctx.proc.nodeid,
+                   self.req, 0, -1)
+
+    cdef _result(self, bint peek):
+        if self._rc == VEO_COMMAND_EXCEPTION:
+            if peek:
+                raise ArithmeticError("peek_result command exception")
             raise ArithmeticError("wait_result command exception on VE")
-        elif rc == VEO_COMMAND_ERROR:
+        elif self._rc == VEO_COMMAND_ERROR:
+            if peek:
+                raise RuntimeError("peek_result command error on VE")
             raise RuntimeError("wait_result command handling error")
-        elif rc < 0:
+        elif self._rc < 0:
+            if peek:
+                raise RuntimeError("peek_result command exception on VH")
             raise RuntimeError("wait_result command exception on VH")
-        if _vp_logging._is_enable(_vp_logging.VEO):
-            _vp_logging.info(
-                _vp_logging.VEO,
-                'veo_call_wait_result: nodeid=%d, reqid=%d',
-                self.ctx.proc.nodeid, self.req)
-        return self.ret_conv(<int64_t>res)
+        if self.ret_code != _T_NONE:
+            return conv_from_i64(self.ret_code, self._res)
+        return self.ret_conv(<int64_t>self._res)
 
-    def peek_result(self):
+    cdef bint _poll(self):
+        """
+        Check for the completion of the request without raising an
+        exception. Returns True when the request is finished.
+        """
+        cdef uint64_t res
+        cdef int rc
+        if self._done:
+            return True
+        if self._waiting:
+            # another thread waits for it and takes the result
+            return False
+        rc = veo_call_peek_result(self.ctx.thr_ctxt, self.req, &res)
+        if rc == VEO_COMMAND_UNFINISHED:
+            return False
+        self._complete(rc, res)
+        return True
+
+    def done(self):
+        """
+        Return True if the request has finished, False otherwise.
+
+        Unlike peek_result() this never raises an exception, the result
+        (or the error) is retrieved with wait_result() or peek_result().
+        """
+        return self._poll()
+
+    cdef _wait_other(self):
+        """
+        Wait until the thread that waits for the request in
+        veo_call_wait_result() has completed it. The result of a request
+        id can be fetched only once, a second wait would not return.
+        """
+        cdef unsigned int sleep_us = 0
+        while not self._done:
+            with nogil:
+                if sleep_us < 1000:
+                    sleep_us += 10
+                usleep(sleep_us)
+
+    def wait_result(self):
         cdef uint64_t res
-        cdef int rc = veo_call_peek_result(self.ctx.thr_ctxt, self.req, &res)
-        if rc == VEO_COMMAND_EXCEPTION:
-            raise ArithmeticError("peek_result command exception")
-        elif rc == VEO_COMMAND_ERROR:
-            raise RuntimeError("peek_result command error on VE")
-        elif rc == VEO_COMMAND_UNFINISHED:
+        cdef int rc
+        cdef veo_thr_ctxt *thr_ctxt = self.ctx.thr_ctxt
+        cdef uint64_t req = self.req
+        if not self._done and self._waiting:
+            self._wait_other()
+        elif not self._done:
+            if _tracing:
+                _trace(_TR_WAIT, <uint64_t>thr_ctxt, self.ctx.proc.nodeid, req,
+                       0, -1)
+            self._waiting = True
+            with nogil:
+                rc = veo_call_wait_result(thr_ctxt, req, &res)
+            self._waiting = False
+            self._complete(rc, res)
+            if _vp_logging._is_enable(_vp_logging.VEO):
+                _vp_logging.info(
+                    _vp_logging.VEO,
+                    'veo_call_wait_result: nodeid=%d, reqid=%d',
+                    self.ctx.proc.nodeid, self.req)
+        return self._result(False)
+
+    def peek_result(self):
+        if not self._poll():
             raise NameError("peek_result command unfinished")
-        elif rc < 0:
-            raise RuntimeError("peek_result command exception on VH")
-        return self.ret_conv(res)
+        return self._result(True)
+
+    def __await__(self):
+        """
+        Await the result inside an asyncio coroutine, see veo.aio.
+        """
+        from veo.aio import wrap_request
+        return wrap_request(self).__await__()
 
 
 cdef class VeoMemRequest(VeoRequest):
 
     @staticmethod
     cdef create(VeoCtxt ctx, req, Py_buffer data):
-        vmr = VeoMemRequest(ctx, VeoArgs(), req, conv_from_i64_func(ctx.proc, "int"))
+        cdef VeoMemRequest vmr = VeoMemRequest.__new__(VeoMemRequest)
+        vmr.ctx = ctx
+        vmr.req = req
+        vmr.ret_code = _T_INT
         vmr.data = data
+        vmr._t0 = _monotonic()
         return vmr
 
-    def wait_result(self):
-        try:
-            res = super(VeoMemRequest, self).wait_result()
-        except Exception as e:
-            raise e
-        finally:
-            PyBuffer_Release(&self.data)
-        return res
+    cdef _release(self):
+        PyBuffer_Release(&self.data)
 
-    def peek_result(self):
+
+#
+# Raw results of finished requests converted in bulk to numpy dtypes,
+# the same conversions conv_from_i64() does for single values.
+#
+cdef _results_array(int code, raw):
+    if code == _T_LONG:
+        return raw.view(np.int64)
+    elif code == _T_ULONG or code == _T_PTR:
+        return raw
+    elif code == _T_DOUBLE:
+        return raw.view(np.float64)
+    elif code == _T_FLOAT:
+        return (raw >> np.uint64(32)).astype(np.uint32).view(np.float32)
+    elif code == _T_INT:
+        return raw.astype(np.uint32).view(np.int32)
+    elif code == _T_UINT:
+        return raw.astype(np.uint32)
+    elif code == _T_SHORT:
+        return raw.astype(np.uint16).view(np.int16)
+    elif code == _T_USHORT:
+        return raw.astype(np.uint16)
+    elif code == _T_CHAR:
+        return raw.astype(np.uint8).view(np.int8)
+    elif code == _T_UCHAR:
+        return raw.astype(np.uint8)
+    return None
+
+
+#
+# VeoFunction.map(): argument columns are converted in bulk into a table
+# of 64 bit words, one row per call, the calls are then submitted and
+# waited for in one C loop.
+#
+cdef _map_column(int code, col):
+    """
+    Convert an argument column to the type code and widen it to the word
+    the argument setter takes: integers sign or zero extended, floats as
+    double bits.
+    """
+    if col.dtype == object:
+        col = np.array([getattr(x, "_ve_array", x) for x in col])
+    if code == _T_DOUBLE:
+        return col.astype(np.float64).view(np.uint64)
+    elif code == _T_FLOAT:
+        return col.astype(np.float32).astype(np.float64).view(np.uint64)
+    elif code == _T_LONG:
+        return col.astype(np.int64).view(np.uint64)
+    elif code == _T_ULONG or code == _T_PTR:
+        return col.astype(np.uint64)
+    elif code == _T_INT:
+        return col.astype(np.int32).astype(np.int64).view(np.uint64)
+    elif code == _T_SHORT:
+        return col.astype(np.int16).astype(np.int64).view(np.uint64)
+    elif code == _T_CHAR:
+        return col.astype(np.int8).astype(np.int64).view(np.uint64)
+    elif code == _T_UINT:
+        return col.astype(np.uint32).astype(np.uint64)
+    elif code == _T_USHORT:
+        return col.astype(np.uint16).astype(np.uint64)
+    elif code == _T_UCHAR:
+        return col.astype(np.uint8).astype(np.uint64)
+    raise TypeError("invalid argument type code %d" % code)
+
+
+cdef inline int _map_set(veo_args *a, int i, int code, uint64_t x) noexcept nogil:
+    cdef U64 u
+    u.u64 = x
+    if code == _T_LONG:
+        return veo_args_set_i64(a, i, u.i64)
+    elif code == _T_ULONG or code == _T_PTR:
+        return veo_args_set_u64(a, i, x)
+    elif code == _T_DOUBLE:
+        return veo_args_set_double(a, i, u.d64)
+    elif code == _T_FLOAT:
+        return veo_args_set_float(a, i, <float>u.d64)
+    elif code == _T_INT or code == _T_SHORT or code == _T_CHAR:
+        return veo_args_set_i32(a, i, <int32_t>u.i64)
+    return veo_args_set_u32(a, i, <uint32_t>x)
+
+
+cdef Py_ssize_t _map_loop(uint64_t faddr, int argc, const int *codes,
+                          const uint64_t *raw, Py_ssize_t n,
+                          veo_thr_ctxt **thr, Py_ssize_t nctx,
+                          veo_args **args, uint64_t *ids, Py_ssize_t *owner,
+                          Py_ssize_t window, uint64_t *res, int *rc, double *t,
+                          int node, int name) noexcept nogil:
+    """
+    Submit the n calls round robin to the nctx contexts, the slot of a
+    call in its context is reused after the call window calls earlier
+    has been waited for. Returns the number of calls submitted.
+    """
+    cdef Py_ssize_t j, k, s, c, nsub = n
+    cdef int i
+    for j in range(n):
+        c = j % nctx
+        s = c * window + (j // nctx) % window
+        k = owner[s]
+        if k >= 0:
+            rc[k] = veo_call_wait_result(thr[c], ids[s], &res[k])
+            t[k] = _monotonic() - t[k]
+            owner[s] = -1
+            if _tracing:
+                with gil:
+                    _trace(_TR_DONE, <uint64_t>thr[c], node, ids[s], 0, -1)
+        for i in range(argc):
+            _map_set(args[s], i, codes[i], raw[j * argc + i])
+        t[j] = _monotonic()
+        ids[s] = veo_call_async(thr[c], faddr, args[s])
+        if ids[s] == VEO_REQUEST_ID_INVALID:
+            nsub = j
+            break
+        owner[s] = j
+        if _tracing:
+            with gil:
+                _trace(_TR_CALL, <uint64_t>thr[c], node, ids[s], 0, name)
+    for s in range(nctx * window):
+        k = owner[s]
+        if k >= 0:
+            c = s // window
+            rc[k] = veo_call_wait_result(thr[c], ids[s], &res[k])
+            t[k] = _monotonic() - t[k]
+            owner[s] = -1
+            if _tracing:
+                with gil:
+                    _trace(_TR_DONE, <uint64_t>thr[c], node, ids[s], 0, -1)
+    return nsub
+
+
+cdef _map_calls(VeoFunction f, ctxs, tuple columns, Py_ssize_t window):
+    cdef list cl
+    cdef Py_ssize_t i, j, n, nctx, nsub, nslot
+    cdef VeoCtxt ctx
+    cdef int argc = f._argc
+    cdef int name
+    cdef uint64_t[:, ::1] rawv
+    cdef uint64_t[::1] resv
+    cdef veo_thr_ctxt **thr = NULL
+    cdef veo_args **args = NULL
+    cdef uint64_t *ids = NULL
+    cdef Py_ssize_t *owner = NULL
+    cdef int *rc = NULL
+    cdef double *t = NULL
+
+    if f._args_type is None:
+        raise RuntimeError("VeoFunction needs arguments format info before map()")
+    cl = [ctxs] if isinstance(ctxs, VeoCtxt) else list(ctxs)
+    if not cl:
+        raise ValueError("map: at least one context is needed")
+    for ctx in cl:
+        if ctx.proc is not f.lib.proc:
+            raise ValueError("map: context of another process")
+        if ctx._graph is not None:
+            raise RuntimeError("map: the context is captured")
+    if window < 1:
+        raise ValueError("map: window must be positive")
+    if len(columns) == 1 and isinstance(columns[0], np.ndarray) \
+            and columns[0].dtype.names is not None:
+        columns = tuple(columns[0][k] for k in columns[0].dtype.names)
+    if argc == 0:
+        raise ValueError("map: %s takes no arguments" % f.name)
+    if len(columns) != argc:
+        raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
+                         .format(argc, len(columns)))
+    cols = np.broadcast_arrays(*[np.asarray(c) for c in columns])
+    shape = cols[0].shape
+    n = cols[0].size
+    raw = np.empty((n, argc), dtype=np.uint64)
+    for i in range(argc):
         try:
-            res = super(VeoMemRequest, self).peek_result()
-            PyBuffer_Release(&self.data)
+            raw[:, i] = _map_column(f._argt[i], cols[i].reshape(-1))
+        except (TypeError, ValueError, OverflowError) as e:
+            raise ValueError("%r : args conversion: arg %d" % (e, i))
+    rawv = raw
+    res = np.zeros(n, dtype=np.uint64)
+    resv = res
+    nctx = len(cl)
+    window = max(1, min(window, (n + nctx - 1) // nctx))
+    nslot = nctx * window
+    name = _trace_name(f.name) if _tracing else -1
+    try:
+        thr = <veo_thr_ctxt **>malloc(nctx * sizeof(veo_thr_ctxt *))
+        args = <veo_args **>calloc(nslot, sizeof(veo_args *))
+        ids = <uint64_t *>malloc(nslot * sizeof(uint64_t))
+        owner = <Py_ssize_t *>malloc(nslot * sizeof(Py_ssize_t))
+        rc = <int *>malloc(n * sizeof(int) + 1)
+        t = <double *>malloc(n * sizeof(double) + 1)
+        if thr == NULL or args == NULL or ids == NULL or owner == NULL \
+                or rc == NULL or t == NULL:
+            raise MemoryError("map: out of memory")
+        for i in range(nctx):
+            thr[i] = (<VeoCtxt>cl[i]).thr_ctxt
+        for i in range(nslot):
+            owner[i] = -1
+            args[i] = veo_args_alloc()
+            if args[i] == NULL:
+                raise MemoryError("map: out of memory")
+        with nogil:
+            nsub = _map_loop(f.addr, argc, f._argt,
+                             &rawv[0, 0] if n else NULL, n, thr, nctx, args,
+                             ids, owner, window, &resv[0] if n else NULL,
+                             rc, t, f.lib.proc.nodeid, name)
+        for j in range(nsub):
+            ctx = <VeoCtxt>cl[j % nctx]
+            _count_call(f, ctx, True)
+            _stats_done(&f._stats, rc[j], t[j])
+            _stats_done(&ctx._stats, rc[j], t[j])
+            _stats_done(&ctx.proc._stats, rc[j], t[j])
+        if nsub < n:
+            _count_call(f, <VeoCtxt>cl[nsub % nctx], False)
+            raise RuntimeError("map: veo_call_async failed for call %d" % nsub)
+        for j in range(n):
+            if rc[j] == VEO_COMMAND_EXCEPTION:
+                raise ArithmeticError("map: command exception on VE in call %d" % j)
+            elif rc[j] == VEO_COMMAND_ERROR:
+                raise RuntimeError("map: command handling error in call %d" % j)
+            elif rc[j] < 0:
+                raise RuntimeError("map: command exception on VH in call %d" % j)
+    finally:
+        if args != NULL:
+            for i in range(nslot):
+                if args[i] != NULL:
+                    veo_args_free(args[i])
+        free(thr)
+        free(args)
+        free(ids)
+        free(owner)
+        free(rc)
+        free(t)
+    if f._rett == _T_VOID:
+        return None
+    if f._rett == _T_NONE:
+        out = np.empty(n, dtype=object)
+        for j in range(n):
+            out[j] = f.ret_conv(<int64_t>resv[j])
+        return out.reshape(shape)
+    return _results_array(f._rett, res).reshape(shape)
+
+
+def _dispatch_pack(calls):
+    """
+    Pack a sequence of (VeoFunction, args) into a dispatcher batch,
+    returned as numpy uint64 array.
+    """
+    cdef list batch = list(calls)
+    cdef Py_ssize_t i, n = len(batch)
+    cdef uint64_t[::1] blk
+    cdef VeoFunction f
+    buf = np.zeros(1 + n * _DISPATCH_REC, dtype=np.uint64)
+    blk = buf
+    blk[0] = n
+    for i in range(n):
+        func, args = batch[i]
+        f = <VeoFunction?>func
+        f._pack(tuple(args), &blk[1 + i * _DISPATCH_REC])
+    return buf
+
+
+def _dispatch_pack_into(func, args, buf, Py_ssize_t off):
+    """
+    Pack one call of the VeoFunction func into the dispatcher record
+    starting at word off of the numpy uint64 array buf.
+    """
+    cdef uint64_t[::1] blk = buf
+    if off < 0 or off + _DISPATCH_REC > blk.shape[0]:
+        raise IndexError("dispatcher record out of range")
+    (<VeoFunction?>func)._pack(tuple(args), &blk[off])
+
+
+def _dispatch_result(func, uint64_t x):
+    """
+    Convert the raw result x of a dispatched call of func.
+    """
+    return (<VeoFunction?>func)._result(x)
+
+
+def _dispatch_results(calls, buf):
+    """
+    Convert the result slots of a dispatched batch according to the
+    return types of the functions, like wait_all().
+    """
+    cdef list batch = list(calls)
+    cdef Py_ssize_t i, n = len(batch)
+    cdef uint64_t[::1] blk = buf
+    cdef VeoFunction f
+    cdef int code = _T_NONE
+    cdef bint same = True
+    for i in range(n):
+        f = <VeoFunction?>batch[i][0]
+        if i == 0:
+            code = f._rett
+        elif f._rett != code:
+            same = False
+    if n > 0 and same and code != _T_VOID:
+        raw = np.asarray(buf)[1 + _DISPATCH_REC - 1::_DISPATCH_REC].copy()
+        res = _results_array(code, raw)
+        if res is not None:
             return res
-        except NameError as e:
-            raise e
-        except Exception as e:
-            PyBuffer_Release(&self.data)
-            raise e
+    return [(<VeoFunction>batch[i][0])._result(
+                blk[i * _DISPATCH_REC + _DISPATCH_REC])
+            for i in range(n)]
+
+
+def wait_all(requests):
+    """
+    Wait for all VeoRequests in the sequence requests to finish.
+
+    The waiting is done in C without holding the GIL. If all requests
+    succeeded and have the same numeric return type the results are
+    returned as a numpy array, otherwise as a list. If a request failed,
+    its exception is raised after all requests have finished.
+
+    Finished requests are not waited for again, a request given more
+    than once is waited for once. Requests another thread is waiting
+    for are left to that thread.
+    """
+    cdef list reqs = list(requests)
+    cdef list waited = []
+    cdef list others = []
+    cdef set seen = set()
+    cdef Py_ssize_t i, m = 0, n = len(reqs)
+    cdef VeoRequest r
+    cdef veo_thr_ctxt **thr = NULL
+    cdef uint64_t *ids = NULL
+    cdef uint64_t *res = NULL
+    cdef int *rc = NULL
+    cdef int code = _T_NONE
+    cdef bint same = True
+
+    for i in range(n):
+        if not isinstance(reqs[i], VeoRequest):
+            raise TypeError("wait_all: %r is not a VeoRequest" % (reqs[i],))
+    try:
+        thr = <veo_thr_ctxt **>malloc(n * sizeof(veo_thr_ctxt *) + 1)
+        ids = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+        res = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+        rc = <int *>malloc(n * sizeof(int) + 1)
+        if thr == NULL or ids == NULL or res == NULL or rc == NULL:
+            raise MemoryError("wait_all: out of memory")
+        for i in range(n):
+            r = <VeoRequest>reqs[i]
+            if r._done or id(r) in seen:
+                continue
+            seen.add(id(r))
+            if r._waiting:
+                others.append(r)
+                continue
+            if _tracing:
+                _trace(_TR_WAIT, <uint64_t>r.ctx.thr_ctxt,
+                       r.ctx.proc.nodeid, r.req, 0, -1)
+            r._waiting = True
+            waited.append(r)
+            thr[m] = r.ctx.thr_ctxt
+            ids[m] = r.req
+            m += 1
+        with nogil:
+            for i in range(m):
+                rc[i] = veo_call_wait_result(thr[i], ids[i], &res[i])
+        for i in range(m):
+            r = <VeoRequest>waited[i]
+            r._waiting = False
+            r._complete(rc[i], res[i])
+    finally:
+        free(thr)
+        free(ids)
+        free(res)
+        free(rc)
+    for r in others:
+        r._wait_other()
+
+    for i in range(n):
+        r = <VeoRequest>reqs[i]
+        if i == 0:
+            code = r.ret_code
+        if r._rc != VEO_COMMAND_OK or r.ret_code != code:
+            same = False
+            break
+    if same and n > 0 and code != _T_NONE and code != _T_VOID:
+        raw = np.empty(n, dtype=np.uint64)
+        for i in range(n):
+            raw[i] = (<VeoRequest>reqs[i])._res
+        return _results_array(code, raw)
+    return [(<VeoRequest>x)._result(False) for x in reqs]
+
+
+def wait_any(requests, timeout=None):
+    """
+    Wait until one of the VeoRequests in the sequence requests finishes.
+
+    The requests are polled in C without holding the GIL. Returns a tuple
+    (index, result) of the first finished request found. Raises
+    TimeoutError if none finished within timeout seconds.
+    """
+    cdef list reqs = list(requests)
+    cdef Py_ssize_t i, n = len(reqs), found = -1
+    cdef VeoRequest r
+    cdef veo_thr_ctxt **thr = NULL
+    cdef uint64_t *ids = NULL
+    cdef uint64_t res = 0
+    cdef int rc = 0
+    cdef double tmax = -1.0
+    cdef double t0
+    cdef unsigned int sleep_us = 0
+
+    if n == 0:
+        raise ValueError("wait_any: no requests")
+    for i in range(n):
+        if not isinstance(reqs[i], VeoRequest):
+            raise TypeError("wait_any: %r is not a VeoRequest" % (reqs[i],))
+        if (<VeoRequest>reqs[i])._done:
+            return i, (<VeoRequest>reqs[i])._result(False)
+    if timeout is not None:
+        tmax = timeout
+    try:
+        thr = <veo_thr_ctxt **>malloc(n * sizeof(veo_thr_ctxt *))
+        ids = <uint64_t *>malloc(n * sizeof(uint64_t))
+        if thr == NULL or ids == NULL:
+            raise MemoryError("wait_any: out of memory")
+        for i in range(n):
+            r = <VeoRequest>reqs[i]
+            thr[i] = r.ctx.thr_ctxt
+            ids[i] = r.req
+            if _tracing:
+                _trace(_TR_WAIT, <uint64_t>r.ctx.thr_ctxt, r.ctx.proc.nodeid,
+                       r.req, 0, -1)
+        with nogil:
+            t0 = _monotonic()
+            while True:
+                for i in range(n):
+                    rc = veo_call_peek_result(thr[i], ids[i], &res)
+                    if rc != VEO_COMMAND_UNFINISHED:
+                        found = i
+                        break
+                if found >= 0:
+                    break
+                if tmax >= 0.0 and _monotonic() - t0 >= tmax:
+                    break
+                # back off from busy polling to sleeping up to 1ms
+                if sleep_us < 1000:
+                    sleep_us += 10
+                usleep(sleep_us)
+    finally:
+        free(thr)
+        free(ids)
+    if found < 0:
+        raise TimeoutError("wait_any: no request finished within %r s" % timeout)
+    r = <VeoRequest>reqs[found]
+    r._complete(rc, res)
+    return found, r._result(False)
+
+
+cdef double _monotonic() nogil:
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec + ts.tv_nsec * 1e-9
 
 
 cdef class VeoLibrary(object):
@@ -344,11 +1009,19 @@ cdef class VeoArgs(object):
         self.args = veo_args_alloc()
         if self.args == NULL:
             raise RuntimeError("Failed to alloc veo_args")
-        self.stacks = []
+        self._stacks = {}
 
     def __dealloc__(self):
         veo_args_free(self.args)
-        self.stacks.clear()
+        self._stacks.clear()
+
+    @property
+    def stacks(self):
+        """
+        List of the OnStack buffers referenced by the arguments, in
+        argument order.
+        """
+        return [self._stacks[i] for i in sorted(self._stacks)]
 
     def set_i32(self, int argnum, int32_t val):
         veo_args_set_i32(self.args, argnum, val)
@@ -371,14 +1044,210 @@ cdef class VeoArgs(object):
     # def set_stack(self, veo_args_intent inout, int argnum,
     #               uint64_t buff, size_t len):
     def set_stack(self, OnStack x, int argnum):
-        cdef uint64_t buff = x.c_pointer()
-        cdef veo_args_intent _inout = x.scope()
-        veo_args_set_stack(
-            self.args, _inout, argnum, <char *>buff, x.size())
-        self.stacks.append(x)
+        self._set_stack(x, argnum)
 
     def clear(self):
         veo_args_clear(self.args)
+        self._stacks.clear()
+
+    cdef int _set_stack(self, OnStack x, int argnum) except -1:
+        if veo_args_set_stack(self.args, x._inout, argnum,
+                              <char *>x._c_pointer, x._size):
+            raise ValueError("arg on stack: c_pointer = %r, size = %r" %
+                             (x._c_pointer, x._size))
+        self._stacks[argnum] = x
+        return 0
+
+    cdef int _set(self, int argnum, int code, x) except -1:
+        """
+        Set argument argnum of type code to x. Python ints and floats go
+        straight to the typed setters, other objects can be OnStack
+        instances or carry the argument in a _ve_array attribute.
+        """
+        cdef int rc
+        if type(x) is not int and type(x) is not float:
+            x = getattr(x, "_ve_array", x)
+            if isinstance(x, OnStack):
+                return self._set_stack(<OnStack>x, argnum)
+        if self._stacks:
+            self._stacks.pop(argnum, None)
+        if code == _T_PTR or code == _T_ULONG:
+            rc = veo_args_set_u64(self.args, argnum, <uint64_t>x)
+        elif code == _T_INT:
+            rc = veo_args_set_i32(self.args, argnum, <int32_t>x)
+        elif code == _T_LONG:
+            rc = veo_args_set_i64(self.args, argnum, <int64_t>x)
+        elif code == _T_DOUBLE:
+            rc = veo_args_set_double(self.args, argnum, <double>x)
+        elif code == _T_FLOAT:
+            rc = veo_args_set_float(self.args, argnum, <float>x)
+        elif code == _T_UINT:
+            rc = veo_args_set_u32(self.args, argnum, <uint32_t>x)
+        elif code == _T_CHAR:
+            rc = veo_args_set_i32(self.args, argnum, <char>x)
+        elif code == _T_UCHAR:
+            rc = veo_args_set_u32(self.args, argnum, <unsigned char>x)
+        elif code == _T_SHORT:
+            rc = veo_args_set_i32(self.args, argnum, <int16_t>x)
+        elif code == _T_USHORT:
+            rc = veo_args_set_u32(self.args, argnum, <uint16_t>x)
+        else:
+            raise TypeError("invalid argument type code %d" % code)
+        if rc:
+            raise ValueError("failed to set argument %d" % argnum)
+        return 0
+
+
+#
+# Pool of VeoArgs instances used by VeoFunction.__call__(). The arguments
+# of a call are recycled when the result of its request has been
+# collected, saving the allocation of a veo_args per call.
+#
+cdef list _args_pool = []
+cdef Py_ssize_t _args_pool_max = 256
+
+
+cdef VeoArgs _args_get():
+    cdef VeoArgs a
+    if _args_pool:
+        return <VeoArgs>_args_pool.pop()
+    a = VeoArgs()
+    a._pooled = True
+    return a
+
+
+cdef _args_put(VeoArgs a):
+    if len(_args_pool) < _args_pool_max:
+        a.clear()
+        _args_pool.append(a)
+
+
+cdef class VeoCall(object):
+    """
+    Prepared call of a VeoFunction.
+
+    The call keeps its own VeoArgs with the converted arguments. Single
+    arguments can be rebound in place with set_arg() or the typed
+    set_*() methods and the call can be submitted again and again without
+    converting the other arguments. All arguments must be set before
+    the call is submitted. The request of a submission must be collected
+    before the arguments are changed or the call is submitted again.
+
+    Created by VeoFunction.prepare(*args).
+    """
+
+    def __init__(self, VeoFunction func, *args):
+        cdef int i = 0
+        if func._args_type is None:
+            raise RuntimeError("VeoFunction needs arguments format info before prepare()")
+        if args and len(args) != func._argc:
+            raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
+                             .format(func._argc, len(args)))
+        self.func = func
+        self.args = VeoArgs()
+        try:
+            for i in range(len(args)):
+                self.args._set(i, func._argt[i], args[i])
+        except Exception as e:
+            raise ValueError("%r : args conversion: arg %d = %r" % (e, i, args[i]))
+        if args:
+            self._bound = (<uint64_t>1 << func._argc) - 1
+
+    def __repr__(self):
+        return "<%s object of %r>" % (self.__class__.__name__, self.func)
+
+    cdef int _check_idle(self) except -1:
+        if self._req is not None and not self._req._done:
+            raise RuntimeError("VeoCall: request %d of the previous submission "
+                               "was not collected" % self._req.req)
+        return 0
+
+    cdef int _check_argnum(self, int argnum) except -1:
+        if argnum < 0 or argnum >= self.func._argc:
+            raise IndexError("VeoCall: invalid argument number %d" % argnum)
+        self._check_idle()
+        return 0
+
+    cdef int _check_set(self, int argnum, int rc) except -1:
+        if rc:
+            raise ValueError("failed to set argument %d" % argnum)
+        if self.args._stacks:
+            self.args._stacks.pop(argnum, None)
+        self._bound |= <uint64_t>1 << argnum
+        return 0
+
+    cdef int _check_bound(self) except -1:
+        cdef int i
+        if self._bound != (<uint64_t>1 << self.func._argc) - 1:
+            for i in range(self.func._argc):
+                if not self._bound & (<uint64_t>1 << i):
+                    raise RuntimeError("VeoCall: argument %d is not set" % i)
+        return 0
+
+    def set_arg(self, int argnum, x):
+        """
+        Set argument argnum to x, converted to the argument type of the
+        function.
+        """
+        self._check_argnum(argnum)
+        self.args._set(argnum, self.func._argt[argnum], x)
+        self._bound |= <uint64_t>1 << argnum
+
+    def set_i32(self, int argnum, int32_t val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_i32(self.args.args, argnum, val))
+
+    def set_u32(self, int argnum, uint32_t val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_u32(self.args.args, argnum, val))
+
+    def set_i64(self, int argnum, int64_t val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_i64(self.args.args, argnum, val))
+
+    def set_u64(self, int argnum, uint64_t val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_u64(self.args.args, argnum, val))
+
+    def set_float(self, int argnum, float val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_float(self.args.args, argnum, val))
+
+    def set_double(self, int argnum, double val):
+        self._check_argnum(argnum)
+        self._check_set(argnum, veo_args_set_double(self.args.args, argnum, val))
+
+    def __call__(self, VeoCtxt ctx):
+        """
+        Submit the prepared call to the context ctx.
+
+        Returns: VeoRequest instance, None in case of error.
+        """
+        cdef uint64_t res
+        self._check_bound()
+        if ctx._graph is not None:
+            (<VeoGraph>ctx._graph)._record_prepared(self)
+            return None
+        self._check_idle()
+        with nogil:
+            res = veo_call_async(ctx.thr_ctxt, self.func.addr, self.args.args)
+        if res == VEO_REQUEST_ID_INVALID:
+            _count_call(self.func, ctx, False)
+            return None
+        if _vp_logging._is_enable(_vp_logging.VEO):
+            _vp_logging.info(
+                _vp_logging.VEO,
+                'veo_call_async: name=%s, reqid=%d', self.func.name, res)
+        if _tracing:
+            _trace(_TR_CALL, <uint64_t>ctx.thr_ctxt, ctx.proc.nodeid, res, 0,
+                   _trace_name(self.func.name))
+        _count_call(self.func, ctx, True)
+        self._req = VeoRequest._new(ctx, self.args, res, self.func.ret_conv,
+                                    self.func._rett)
+        self._req._func = self.func
+        return self._req
+
+    submit = __call__
 
 
 cdef class VeoCtxt(object):
@@ -393,7 +1262,8 @@ cdef class VeoCtxt(object):
 
     def __init__(self, VeoProc proc):
         self.proc = proc
-        self.thr_ctxt = veo_context_open(proc.proc_handle)
+        with nogil:
+            self.thr_ctxt = veo_context_open(proc.proc_handle)
         if self.thr_ctxt == NULL:
             raise RuntimeError("veo_context_open failed")
 
@@ -405,15 +1275,45 @@ cdef class VeoCtxt(object):
         return <uint64_t>self.thr_ctxt
 
     def context_close(self):
+        cdef int rc
         if self.thr_ctxt == NULL:
             return
-        if veo_context_close(self.thr_ctxt):
+        with nogil:
+            rc = veo_context_close(self.thr_ctxt)
+        if rc:
             raise RuntimeError("veo_context_close failed")
         self.thr_ctxt = NULL
 
-    def async_read_mem(self, dst, uint64_t src, Py_ssize_t size):
+    def context_state(self):
+        """
+        State of the VE thread of the context, a _veo_context_state.
+        STATE_RUNNING while the context accepts commands, STATE_EXIT
+        after it terminated or was closed.
+        """
+        cdef int state
+        if self.thr_ctxt == NULL:
+            return _veo_context_state.STATE_EXIT
+        with nogil:
+            state = veo_get_context_state(self.thr_ctxt)
+        return _veo_context_state(state)
+
+    def stats(self):
+        """
+        Snapshot of the performance counters of the context as dict,
+        see veo.perfstats.
+        """
+        return _stats_dict(&self._stats)
+
+    def reset_stats(self):
+        _stats_reset(&self._stats)
+
+    def async_read_mem(self, dst, src_, Py_ssize_t size):
         cdef Py_buffer data
-        cdef uint64_t req
+        cdef uint64_t req, src
+        if self._graph is not None:
+            self._capture_mem(_TR_READ, src_, dst, size)
+            return None
+        src = src_
         if not PyObject_CheckBuffer(dst):
             raise TypeError("dst must implement the buffer protocol!")
 
@@ -426,20 +1326,32 @@ cdef class VeoCtxt(object):
                 % (data.len, size)
             )
 
-        req = veo_async_read_mem(self.thr_ctxt, data.buf, src, size)
+        with nogil:
+            req = veo_async_read_mem(self.thr_ctxt, data.buf, src, size)
         if req == VEO_REQUEST_ID_INVALID:
             PyBuffer_Release(&data)
+            self._stats.errors += 1
+            self.proc._stats.errors += 1
             raise RuntimeError("veo_async_read_mem failed")
         if _vp_logging._is_enable(_vp_logging.VEO):
             _vp_logging.info(
                 _vp_logging.VEO,
                 'veo_async_read_mem: nodeid=%d, size=%d, reqid=%d',
                 self.proc.nodeid, size, req)
+        if _tracing:
+            _trace(_TR_READ, <uint64_t>self.thr_ctxt, self.proc.nodeid, req,
+                   size, -1)
+        _count_transfer(&self._stats, False, size)
+        _count_transfer(&self.proc._stats, False, size)
         return VeoMemRequest.create(self, req, data)
 
-    def async_write_mem(self, uint64_t dst, src, Py_ssize_t size):
+    def async_write_mem(self, dst_, src, Py_ssize_t size):
         cdef Py_buffer data
-        cdef uint64_t req
+        cdef uint64_t req, dst
+        if self._graph is not None:
+            self._capture_mem(_TR_WRITE, dst_, src, size)
+            return None
+        dst = dst_
         if not PyObject_CheckBuffer(src):
             raise TypeError("src must implement the buffer protocol!")
 
@@ -452,35 +1364,156 @@ cdef class VeoCtxt(object):
                 % (data.len, size)
             )
 
-        req = veo_async_write_mem(self.thr_ctxt, dst, data.buf, size)
+        with nogil:
+            req = veo_async_write_mem(self.thr_ctxt, dst, data.buf, size)
         if req == VEO_REQUEST_ID_INVALID:
             PyBuffer_Release(&data)
+            self._stats.errors += 1
+            self.proc._stats.errors += 1
             raise RuntimeError("veo_write_mem failed")
         if _vp_logging._is_enable(_vp_logging.VEO):
             _vp_logging.info(
                 _vp_logging.VEO,
                 'veo_async_write_mem: nodeid=%d, size=%d, reqid=%d',
                 self.proc.nodeid, size, req)
+        if _tracing:
+            _trace(_TR_WRITE, <uint64_t>self.thr_ctxt, self.proc.nodeid, req,
+                   size, -1)
+        _count_transfer(&self._stats, True, size)
+        _count_transfer(&self.proc._stats, True, size)
         return VeoMemRequest.create(self, req, data)
 
     def context_sync(self):
-        veo_context_sync(self.thr_ctxt)
+        with nogil:
+            veo_context_sync(self.thr_ctxt)
+
+    def capture(self):
+        """
+        Start recording calls and async transfers of this context into a
+        new VeoGraph instead of submitting them, until the graph's
+        end_capture(). Used as context manager the capture ends on exit:
+
+            with ctx.capture() as g:
+                ctx.async_write_mem(x_ve, Placeholder("x"), nbytes)
+                step(ctx, x_ve, Placeholder("dt"))
+                ctx.async_read_mem(y, y_ve, nbytes)
+            for i in range(nsteps):
+                g.run(x=xs[i], dt=0.1)
+        """
+        if self._graph is not None:
+            raise RuntimeError("the context is already captured")
+        self._graph = VeoGraph(self)
+        return self._graph
+
+    cdef _capture_mem(self, int kind, addr, buf, Py_ssize_t size):
+        ph = addr if isinstance(addr, Placeholder) else None
+        (<VeoGraph>self._graph)._record_mem(kind, 0 if ph is not None else addr,
+                                            buf, size, ph)
+
+    def submit_batch(self, calls):
+        """
+        Run a batch of calls with one call of the VE side dispatcher, see
+        veo.dispatch. calls is a sequence of (VeoFunction, args) tuples.
+        Returns a BatchRequest.
+        """
+        from veo.dispatch import submit_batch
+        return submit_batch(self, calls)
+
+    def submit_many(self, calls):
+        """
+        Submit a batch of calls to this context.
+
+        calls is a sequence of (VeoFunction, args) tuples, args being the
+        tuple of arguments of the call. The arguments of all calls are
+        converted first, then all calls are submitted in one loop without
+        the GIL. Returns the list of VeoRequests, with None for calls that
+        could not be submitted.
+        """
+        cdef list batch = list(calls)
+        cdef Py_ssize_t i, n = len(batch)
+        cdef list fargs = [None] * n
+        cdef VeoFunction f
+        cdef VeoArgs a
+        cdef VeoRequest r
+        cdef uint64_t *addr = NULL
+        cdef veo_args **cargs = NULL
+        cdef uint64_t *ids = NULL
+        cdef veo_thr_ctxt *thr_ctxt = self.thr_ctxt
+
+        if self._graph is not None:
+            for func, args in batch:
+                (<VeoGraph>self._graph)._record_call(<VeoFunction?>func,
+                                                     tuple(args))
+            return [None] * n
+        try:
+            addr = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+            cargs = <veo_args **>malloc(n * sizeof(veo_args *) + 1)
+            ids = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+            if addr == NULL or cargs == NULL or ids == NULL:
+                raise MemoryError("submit_many: out of memory")
+            try:
+                for i in range(n):
+                    func, args = batch[i]
+                    f = <VeoFunction?>func
+                    a = f._make_args(tuple(args))
+                    fargs[i] = a
+                    addr[i] = f.addr
+                    cargs[i] = a.args
+            except Exception:
+                for a in fargs:
+                    if a is not None:
+                        _args_put(a)
+                raise
+            with nogil:
+                for i in range(n):
+                    ids[i] = veo_call_async(thr_ctxt, addr[i], cargs[i])
+            reqs = [None] * n
+            for i in range(n):
+                a = <VeoArgs>fargs[i]
+                f = <VeoFunction>batch[i][0]
+                if ids[i] == VEO_REQUEST_ID_INVALID:
+                    _args_put(a)
+                    _count_call(f, self, False)
+                    continue
+                _count_call(f, self, True)
+                r = VeoRequest._new(self, a, ids[i], f.ret_conv, f._rett)
+                r._func = f
+                reqs[i] = r
+                if _tracing:
+                    _trace(_TR_CALL, <uint64_t>thr_ctxt, self.proc.nodeid,
+                           ids[i], 0, _trace_name(f.name))
+        finally:
+            free(addr)
+            free(cargs)
+            free(ids)
+        if _vp_logging._is_enable(_vp_logging.VEO):
+            _vp_logging.info(
+                _vp_logging.VEO,
+                'veo_call_async: submit_many nodeid=%d, calls=%d',
+                self.proc.nodeid, n)
+        return reqs
 
 
 cdef class VeoProc(object):
 
     def __init__(self, int nodeid, veorun_bin=None):
         global _proc_init_hook
+        cdef char *_veorun_bin
         self.nodeid = nodeid
         self.context = list()
         self.lib = dict()
         if veorun_bin is not None:
-            self.proc_handle = veo_proc_create_static(nodeid, veorun_bin)
+            if isinstance(veorun_bin, str):
+                veorun_bin = veorun_bin.encode()
+            _veorun_bin = veorun_bin
+            with nogil:
+                self.proc_handle = veo_proc_create_static(nodeid, _veorun_bin)
             if self.proc_handle == NULL:
                 raise RuntimeError("veo_proc_create_static(%d, %s) failed" %
                                    (nodeid, veorun_bin))
         else:
-            self.proc_handle = veo_proc_create(nodeid)
+            with nogil:
+                self.proc_handle = veo_proc_create(nodeid)
             if self.proc_handle == NULL:
                 raise RuntimeError("veo_proc_create(%d) failed" % nodeid)
         if len(_proc_init_hook) > 0:
@@ -499,9 +1532,17 @@ cdef class VeoProc(object):
         self.proc_destroy()
 
     def proc_destroy(self):
+        cdef int rc
         if self.proc_handle == NULL:
             return  # to avoid segmentation fault when ve node is offline.
-        if veo_proc_destroy(self.proc_handle):
+        if self.mem_pool is not None:
+            self.mem_pool.discard()
+            self.mem_pool = None
+        # the VE memory of the cached copies goes away with the process
+        self.device_cache = None
+        with nogil:
+            rc = veo_proc_destroy(self.proc_handle)
+        if rc:
             raise RuntimeError("veo_proc_destroy failed")
         self.proc_handle = NULL
         if _vp_logging._is_enable(_vp_logging.VEO):
@@ -517,7 +1558,10 @@ cdef class VeoProc(object):
             libname = libname.encode('utf-8')
         elif not isinstance(libname, bytes):
             raise TypeError("ilibname must be either a str or a bytes")
-        cdef uint64_t res = veo_load_library(self.proc_handle, libname)
+        cdef uint64_t res
+        cdef const char *_libname = libname
+        with nogil:
+            res = veo_load_library(self.proc_handle, _libname)
         if res == 0UL:
             raise RuntimeError("veo_load_library '%s' failed" % libname)
         lib = VeoLibrary(self, libname, res)
@@ -525,15 +1569,66 @@ cdef class VeoProc(object):
         return lib
 
     def unload_library(self, VeoLibrary lib):
-        cdef int res = veo_unload_library(self.proc_handle, lib.lib_handle)
+        cdef int res
+        with nogil:
+            res = veo_unload_library(self.proc_handle, lib.lib_handle)
         if res != 0:
             raise RuntimeError("veo_unload_library '%s' failed" % lib.name)
         del self.lib[<bytes>lib.name]
 
+    def enable_mem_pool(self, max_cached=None):
+        """
+        Route alloc_mem() and free_mem() through a caching VeoMemPool,
+        see veo.mempool. Returns the pool.
+        """
+        from veo.mempool import VeoMemPool, DEFAULT_MAX_CACHED
+        if self.mem_pool is None:
+            self.mem_pool = VeoMemPool(self)
+        self.mem_pool.max_cached = (DEFAULT_MAX_CACHED if max_cached is None
+                                    else max_cached)
+        return self.mem_pool
+
+    def disable_mem_pool(self):
+        """
+        Release the cached blocks and stop using the pool. Blocks still in
+        use are freed on the VE by free_mem().
+        """
+        if self.mem_pool is not None:
+            self.mem_pool.trim()
+            self.mem_pool = None
+
+    def stats(self):
+        """
+        Snapshot of the performance counters of the process as dict,
+        see veo.perfstats.
+        """
+        return _stats_dict(&self._stats)
+
+    def reset_stats(self):
+        _stats_reset(&self._stats)
+
     def alloc_mem(self, size_t size):
+        if self.mem_pool is not None:
+            return self.mem_pool.alloc(size)
+        return self._alloc_mem(size)
+
+    def free_mem(self, uint64_t addr):
+        if self.mem_pool is not None:
+            self.mem_pool.free(addr)
+        else:
+            self._free_mem(addr)
+
+    def _alloc_mem(self, size_t size):
         cdef uint64_t addr
-        if veo_alloc_mem(self.proc_handle, &addr, size):
+        cdef int rc
+        with nogil:
+            rc = veo_alloc_mem(self.proc_handle, &addr, size)
+        if rc:
+            self._stats.errors += 1
             raise MemoryError("Out of memory on VE")
+        self._stats.allocs += 1
+        self._stats.bytes_allocated += size
+        self._alloc_sizes[addr] = size
         if _vp_logging._is_enable(_vp_logging.VEO):
             _vp_logging.info(
                 _vp_logging.VEO,
@@ -544,7 +1639,10 @@ cdef class VeoProc(object):
     def alloc_hmem(self, size_t size):
         cdef void *vemem
         cdef uint64_t addr
-        if veo_alloc_hmem(self.proc_handle, &vemem, size):
+        cdef int rc
+        with nogil:
+            rc = veo_alloc_hmem(self.proc_handle, &vemem, size)
+        if rc:
             raise MemoryError("Out of memory on VE")
         addr = <uint64_t>vemem
         if _vp_logging._is_enable(_vp_logging.VEO):
@@ -554,9 +1652,17 @@ cdef class VeoProc(object):
                 self.nodeid, addr, size)
         return <uint64_t>addr
 
-    def free_mem(self, uint64_t addr):
-        if veo_free_mem(self.proc_handle, addr):
+    def _free_mem(self, uint64_t addr):
+        cdef int rc
+        with nogil:
+            rc = veo_free_mem(self.proc_handle, addr)
+        if rc:
+            self._stats.errors += 1
             raise RuntimeError("veo_free_mem failed")
+        self._stats.frees += 1
+        if self._alloc_sizes.count(addr):
+            self._stats.bytes_allocated -= self._alloc_sizes[addr]
+            self._alloc_sizes.erase(addr)
         if _vp_logging._is_enable(_vp_logging.VEO):
             _vp_logging.info(
                 _vp_logging.VEO,
@@ -564,7 +1670,10 @@ cdef class VeoProc(object):
                 self.nodeid, addr)
 
     def free_hmem(self, uint64_t addr):
-        if veo_free_hmem(<void *>addr):
+        cdef int rc
+        with nogil:
+            rc = veo_free_hmem(<void *>addr)
+        if rc:
             raise RuntimeError("veo_free_hmem failed")
         if _vp_logging._is_enable(_vp_logging.VEO):
             _vp_logging.info(
@@ -574,6 +1683,7 @@ cdef class VeoProc(object):
 
     def read_mem(self, dst, uint64_t src, Py_ssize_t size):
         cdef Py_buffer data
+        cdef int rc
         if not PyObject_CheckBuffer(dst):
             raise TypeError("dst must implement the buffer protocol!")
         try:
@@ -585,8 +1695,18 @@ cdef class VeoProc(object):
                     % (data.len, size)
                 )
 
-            if veo_read_mem(self.proc_handle, data.buf, src, size):
+            if _tracing:
+                _trace(_TR_SYNC_READ, <uint64_t>self.proc_handle, self.nodeid,
+                       0, size, -1)
+            with nogil:
+                rc = veo_read_mem(self.proc_handle, data.buf, src, size)
+            if _tracing:
+                _trace(_TR_SYNC_DONE, <uint64_t>self.proc_handle, self.nodeid,
+                       0, 0, -1)
+            if rc:
+                self._stats.errors += 1
                 raise RuntimeError("veo_read_mem failed")
+            _count_transfer(&self._stats, False, size)
         finally:
             PyBuffer_Release(&data)
         if _vp_logging._is_enable(_vp_logging.VEO):
@@ -597,6 +1717,7 @@ cdef class VeoProc(object):
 
     def write_mem(self, uint64_t dst, src, Py_ssize_t size):
         cdef Py_buffer data
+        cdef int rc
         if not PyObject_CheckBuffer(src):
             raise TypeError("src must implement the buffer protocol!")
         try:
@@ -608,8 +1729,18 @@ cdef class VeoProc(object):
                     % (data.len, size)
                 )
 
-            if veo_write_mem(self.proc_handle, dst, data.buf, size):
+            if _tracing:
+                _trace(_TR_SYNC_WRITE, <uint64_t>self.proc_handle, self.nodeid,
+                       0, size, -1)
+            with nogil:
+                rc = veo_write_mem(self.proc_handle, dst, data.buf, size)
+            if _tracing:
+                _trace(_TR_SYNC_DONE, <uint64_t>self.proc_handle, self.nodeid,
+                       0, 0, -1)
+            if rc:
+                self._stats.errors += 1
                 raise RuntimeError("veo_write_mem failed")
+            _count_transfer(&self._stats, True, size)
         finally:
             PyBuffer_Release(&data)
         if _vp_logging._is_enable(_vp_logging.VEO):
@@ -674,5 +1805,8 @@ cdef class VEO_HMEM(object):
 
     @staticmethod
     def hmemcpy(uint64_t dst, const uint64_t src, size_t size):
-        if veo_hmemcpy(<void*>dst, <void*>src, size) < 0:
+        cdef int rc
+        with nogil:
+            rc = veo_hmemcpy(<void*>dst, <void*>src, size)
+        if rc < 0:
             raise RuntimeError('veo_hmemcpy failed')
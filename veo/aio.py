@@ -0,0 +1,136 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+asyncio integration of VeoRequest.
+
+A VeoRequest can be awaited inside a coroutine:
+
+    res = await lib.func(ctxt, arg1, arg2)
+
+Each VeoCtxt with awaited requests gets a completion watcher thread. The
+commands of a context are executed in order, therefore the watcher simply
+waits (without the GIL) for its oldest pending request and resolves the
+future of each finished request in the event loop that awaits it. No
+polling and no exceptions are involved for unfinished requests. A watcher
+thread exits after being idle for a while.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+
+
+WATCHER_IDLE_TIMEOUT = 1.0
+
+_watchers = dict()
+_watchers_lock = threading.Lock()
+_seq = itertools.count()
+
+
+def _resolve(fut, res, exc):
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(res)
+
+
+class CompletionWatcher(object):
+    """
+    Background thread collecting the results of the awaited requests of
+    one VeoCtxt.
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="veo-aio-watcher-%x" % id(ctx), daemon=True)
+        self._thread.start()
+
+    def add(self, req, fut, loop):
+        """
+        Resolve fut in loop with the result of req. Returns False if the
+        watcher is stopping and cannot accept the request.
+        """
+        with self._cond:
+            if self._stopped:
+                return False
+            heapq.heappush(self._pending, (req.req, next(_seq), req, fut, loop))
+            self._cond.notify()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(WATCHER_IDLE_TIMEOUT)
+                if not self._pending:
+                    self._stopped = True
+                    break
+                entry = self._pending[0]
+                req, fut, loop = entry[2:]
+            res = exc = None
+            try:
+                res = req.wait_result()
+            except Exception as e:
+                exc = e
+            with self._cond:
+                # older requests may have been added while waiting, remove
+                # the entry that was waited for
+                i = self._pending.index(entry)
+                if i == 0:
+                    heapq.heappop(self._pending)
+                else:
+                    self._pending[i] = self._pending[-1]
+                    self._pending.pop()
+                    heapq.heapify(self._pending)
+            try:
+                loop.call_soon_threadsafe(_resolve, fut, res, exc)
+            except RuntimeError:
+                pass  # event loop is closed
+        with _watchers_lock:
+            if _watchers.get(id(self.ctx)) is self:
+                del _watchers[id(self.ctx)]
+
+
+def wrap_request(req, loop=None):
+    """
+    Return an asyncio future that is resolved with the result of the
+    VeoRequest req, or with its exception.
+    """
+    if loop is None:
+        loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    if req.done():
+        try:
+            fut.set_result(req.wait_result())
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+    while True:
+        with _watchers_lock:
+            w = _watchers.get(id(req.ctx))
+            if w is None:
+                w = CompletionWatcher(req.ctx)
+                _watchers[id(req.ctx)] = w
+        if w.add(req, fut, loop):
+            return fut
+        # the watcher was just stopping, start a new one
+        with _watchers_lock:
+            if _watchers.get(id(req.ctx)) is w:
+                del _watchers[id(req.ctx)]
@@ -18,6 +18,13 @@ cdef union U64:
     double d64
 
 
+#
+# Kept for backward compatibility only: arguments are no longer
+# converted through these Python level converters, VeoArgs._set()
+# converts them by type code. Code importing ConvToI64 from veo._veo,
+# like examples/bench-calls.py which times the old conversion path,
+# keeps working.
+#
 cdef class ConvToI64(object):
     @staticmethod
     def from_char(x):
@@ -135,44 +142,6 @@ cdef class ConvFromI64(object):
         return None
 
 
-cdef conv_to_i64_func(proc, t):
-    if t == "char":
-        return ConvToI64.from_char
-    elif t == "short":
-        return ConvToI64.from_short
-    elif t == "int":
-        return ConvToI64.from_int
-    elif t == "int32_t":
-        return ConvToI64.from_int
-    elif t == "long":
-        return ConvToI64.from_long
-    elif t == "int64_t":
-        return ConvToI64.from_long
-    elif t == "unsigned char":
-        return ConvToI64.from_uchar
-    elif t == "unsigned short":
-        return ConvToI64.from_ushort
-    elif t == "unsigned int":
-        return ConvToI64.from_uint
-    elif t == "uint32_t":
-        return ConvToI64.from_uint
-    elif t == "unsigned long":
-        return ConvToI64.from_ulong
-    elif t == "uint64_t":
-        return ConvToI64.from_ulong
-    elif t == "float":
-        return ConvToI64.from_float
-    elif t == "double":
-        return ConvToI64.from_double
-    elif t == "void":
-        return ConvToI64.from_void
-    elif type(t) is str and t.endswith("*"):
-        return ConvToI64.from_addr
-    elif type(t) is bytes and t.endswith(b"*"):
-        return ConvToI64.from_addr
-    else:
-        raise TypeError("Don't know how to convert '%s' to I64" % t)
-
 cdef conv_from_i64_func(proc, t):
     if t == "char":
         return ConvFromI64.to_char
@@ -210,3 +179,84 @@ cdef conv_from_i64_func(proc, t):
         return proc.i64_to_addr
     else:
         raise TypeError("Don't know how to convert from I64 to '%s'" % t)
+
+
+#
+# Type codes of compiled call signatures. VeoFunction.args_type() and
+# ret_type() translate the type strings once into these codes, calls
+# and results are then converted by a switch over the codes instead of
+# calling a converter function per argument.
+#
+cdef enum:
+    _T_NONE = 0     # no compiled code, use the converter function
+    _T_VOID
+    _T_CHAR
+    _T_UCHAR
+    _T_SHORT
+    _T_USHORT
+    _T_INT
+    _T_UINT
+    _T_LONG
+    _T_ULONG
+    _T_FLOAT
+    _T_DOUBLE
+    _T_PTR
+
+
+cdef int type_code(t) except -1:
+    if t == "char":
+        return _T_CHAR
+    elif t == "short":
+        return _T_SHORT
+    elif t == "int" or t == "int32_t":
+        return _T_INT
+    elif t == "long" or t == "int64_t":
+        return _T_LONG
+    elif t == "unsigned char":
+        return _T_UCHAR
+    elif t == "unsigned short":
+        return _T_USHORT
+    elif t == "unsigned int" or t == "uint32_t":
+        return _T_UINT
+    elif t == "unsigned long" or t == "uint64_t":
+        return _T_ULONG
+    elif t == "float":
+        return _T_FLOAT
+    elif t == "double":
+        return _T_DOUBLE
+    elif t == "void":
+        return _T_VOID
+    elif type(t) is str and t.endswith("*"):
+        return _T_PTR
+    elif type(t) is bytes and t.endswith(b"*"):
+        return _T_PTR
+    else:
+        raise TypeError("Don't know how to convert '%s' to I64" % t)
+
+
+cdef conv_from_i64(int code, uint64_t x):
+    cdef U64 u
+    u.u64 = x
+    if code == _T_INT:
+        return <int32_t>x
+    elif code == _T_LONG:
+        return u.i64
+    elif code == _T_PTR or code == _T_ULONG:
+        return x
+    elif code == _T_DOUBLE:
+        return u.d64
+    elif code == _T_FLOAT:
+        return u.f32[1]
+    elif code == _T_UINT:
+        return <uint32_t>x
+    elif code == _T_VOID:
+        return None
+    elif code == _T_CHAR:
+        return <char>x
+    elif code == _T_UCHAR:
+        return <unsigned char>x
+    elif code == _T_SHORT:
+        return <int16_t>x
+    elif code == _T_USHORT:
+        return <uint16_t>x
+    raise TypeError("invalid return type code %d" % code)
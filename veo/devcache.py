@@ -0,0 +1,351 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+VE resident copies of host arrays.
+
+Kernels called again and again with the same input arrays (weights,
+lookup tables, coefficients) need not transfer them for every call. A
+DeviceCache keeps the VE copy of a host array and returns its address
+as long as the host array is known to be unchanged:
+
+    cache = get_device_cache(proc, budget=1 << 30)
+    addr = cache.get(weights, ctx)
+    func(ctx, addr, n).wait_result()
+
+Arrays are identified by their memory (data pointer, size, dtype and
+strides), the entry is dropped when the array is garbage collected.
+Whether an array changed is decided by
+
+  * read-only arrays backed by immutable memory never change,
+  * an explicit version passed by the caller, a new version uploads
+    the array again,
+  * for writable arrays without a version the policy writable:
+    "upload" (the default) transfers it every time into the cached VE
+    buffer, "check" compares a crc32 of the contents and transfers only
+    changed arrays, "trust" assumes no change until invalidate().
+
+crc32 runs at about 2 GB/s on the host, "check" pays off when the
+transfer is slower than that, e.g. when the PCIe link is shared.
+
+With by_content=True the key is a hash of the contents instead, equal
+arrays share one VE copy even if they are different host objects.
+
+The VE memory held by the cache is bounded by budget, the least
+recently used copies are freed first. Copies handed out to contexts are
+only freed or overwritten after those contexts were synchronized, calls
+still queued there never see the memory change.
+"""
+import collections
+import hashlib
+import threading
+import weakref
+import zlib
+
+import numpy as np
+
+
+DEFAULT_BUDGET = 1 << 30
+WRITABLE_POLICIES = ("check", "upload", "trust")
+
+
+def _root(a):
+    while isinstance(a.base, np.ndarray):
+        a = a.base
+    return a
+
+
+def _immutable(a):
+    """
+    True if a and every array it is a view of are read-only and the
+    memory they finally refer to can not be written either.
+    """
+    while isinstance(a, np.ndarray):
+        if a.flags.writeable:
+            return False
+        if a.base is None:
+            return True
+        a = a.base
+    try:
+        return memoryview(a).readonly
+    except TypeError:
+        return False
+
+
+def _identity_key(a):
+    return ("id", id(_root(a)), a.__array_interface__["data"][0], a.nbytes,
+            a.dtype.str, a.shape, a.strides)
+
+
+def _contiguous(a):
+    """
+    The memory of a as C-contiguous buffer, a packed copy if a is not
+    contiguous.
+    """
+    if a.flags.c_contiguous:
+        return a
+    if a.flags.f_contiguous:
+        return a.T
+    return np.ascontiguousarray(a)
+
+
+class _Entry(object):
+    __slots__ = ("key", "addr", "nbytes", "version", "crc", "ctxs", "req",
+                 "finalizer")
+
+    def __init__(self, key, addr, nbytes):
+        self.key = key
+        self.addr = addr
+        self.nbytes = nbytes
+        self.version = None
+        self.crc = None
+        # id()s of the contexts the address was handed out to
+        self.ctxs = set()
+        self.req = None
+        self.finalizer = None
+
+
+class DeviceCache(object):
+    """
+    Per VeoProc cache of VE copies of host arrays.
+    """
+    def __init__(self, proc, budget=DEFAULT_BUDGET, writable="upload"):
+        if writable not in WRITABLE_POLICIES:
+            raise ValueError("writable must be one of %s"
+                             % ", ".join(WRITABLE_POLICIES))
+        # the VeoProc owns the cache, avoid a reference cycle
+        self._proc = weakref.ref(proc)
+        self.budget = budget
+        self.writable = writable
+        self._lock = threading.Lock()
+        # key -> _Entry, least recently used first
+        self._lru = collections.OrderedDict()
+        # keys of arrays that were garbage collected, filled by finalizers
+        self._dead = collections.deque()
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self.bytes_cached = 0
+
+    @property
+    def proc(self):
+        return self._proc()
+
+    def get(self, a, ctx=None, version=None, by_content=False):
+        """
+        Return the VE address of a copy of the array a, transferring it
+        only if the cached copy is missing or outdated. With ctx the
+        transfer is queued in ctx, calls submitted there afterwards see
+        the data; without ctx it is synchronous.
+        """
+        a = np.asarray(a)
+        data = None
+        if by_content:
+            data = _contiguous(a)
+            key = ("content", hashlib.blake2b(data, digest_size=16).digest(),
+                   a.nbytes)
+            policy = "content"
+        else:
+            key = _identity_key(a)
+            if version is not None:
+                policy = "version"
+            elif _immutable(a):
+                policy = "readonly"
+            else:
+                policy = self.writable
+        with self._lock:
+            self._reap()
+            e = self._lru.get(key)
+            crc = None
+            if policy == "check":
+                data = _contiguous(a)
+                crc = zlib.crc32(data)
+            if e is not None:
+                self._lru.move_to_end(key)
+                if policy == "version":
+                    stale = version != e.version
+                elif policy == "check":
+                    stale = crc != e.crc
+                else:
+                    stale = policy == "upload"
+                if not stale:
+                    self.hits += 1
+                    self.bytes_saved += a.nbytes
+                    self._use(e, ctx)
+                    return e.addr
+                # overwritten in place, calls queued elsewhere must finish
+                self._sync(e.ctxs - {id(ctx)})
+                e.ctxs.clear()
+            else:
+                e = self._insert(key, a)
+            self.misses += 1
+            e.version = version
+            e.crc = crc
+            self._upload(e, _contiguous(a) if data is None else data, ctx)
+            return e.addr
+
+    def _insert(self, key, a):
+        # called with the lock held
+        nbytes = a.nbytes
+        self._release(self._evict(self.budget - nbytes))
+        proc = self.proc
+        try:
+            addr = proc.alloc_mem(max(nbytes, 1))
+        except MemoryError:
+            # memory pressure: give all cached copies back and retry
+            self._release(self._evict(0))
+            addr = proc.alloc_mem(max(nbytes, 1))
+        e = _Entry(key, addr, nbytes)
+        if key[0] == "id":
+            e.finalizer = weakref.finalize(_root(a), self._dead.append, key)
+        self._lru[key] = e
+        self.bytes_cached += nbytes
+        return e
+
+    def _upload(self, e, data, ctx):
+        if e.req is not None:
+            e.req.wait_result()
+            e.req = None
+        if ctx is None:
+            self.proc.write_mem(e.addr, data, e.nbytes)
+        elif e.nbytes:
+            e.req = ctx.async_write_mem(e.addr, data, e.nbytes)
+        self._use(e, ctx)
+        self.uploads += 1
+        self.bytes_uploaded += e.nbytes
+
+    def _use(self, e, ctx):
+        if ctx is not None:
+            e.ctxs.add(id(ctx))
+        if e.req is not None and e.req.done():
+            e.req.wait_result()
+            e.req = None
+
+    def _sync(self, ctx_ids):
+        if ctx_ids:
+            for c in self.proc.context:
+                if id(c) in ctx_ids:
+                    c.context_sync()
+
+    def _reap(self):
+        # called with the lock held: drop entries of collected arrays
+        dead = []
+        while self._dead:
+            e = self._lru.pop(self._dead.popleft(), None)
+            if e is not None:
+                self.bytes_cached -= e.nbytes
+                dead.append(e)
+        self._release(dead)
+
+    def _evict(self, limit):
+        # called with the lock held, returns the entries to be released
+        evicted = []
+        while self.bytes_cached > limit and self._lru:
+            key, e = self._lru.popitem(last=False)
+            self.bytes_cached -= e.nbytes
+            evicted.append(e)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _release(self, entries):
+        if not entries:
+            return
+        ctxs = set()
+        for e in entries:
+            ctxs |= e.ctxs
+        proc = self.proc
+        if proc is not None:
+            self._sync(ctxs)
+        for e in entries:
+            if e.finalizer is not None:
+                e.finalizer.detach()
+            # the memory of a destroyed process is gone already
+            if proc is not None:
+                if e.req is not None:
+                    e.req.wait_result()
+                proc.free_mem(e.addr)
+
+    def invalidate(self, a):
+        """
+        Forget the cached copy of a, the next get() transfers it again.
+        Returns True if a was cached.
+        """
+        key = _identity_key(np.asarray(a))
+        with self._lock:
+            e = self._lru.pop(key, None)
+            if e is None:
+                return False
+            self.bytes_cached -= e.nbytes
+            self._release([e])
+            return True
+
+    def trim(self, budget=0):
+        """
+        Free the least recently used copies until at most budget bytes
+        remain cached. Returns the number of bytes freed.
+        """
+        with self._lock:
+            self._reap()
+            before = self.bytes_cached
+            self._release(self._evict(budget))
+            return before - self.bytes_cached
+
+    def clear(self):
+        """
+        Free all cached copies on the VE.
+        """
+        self.trim(0)
+
+    def discard(self):
+        """
+        Forget all copies without freeing them on the VE.
+        """
+        with self._lock:
+            for e in self._lru.values():
+                if e.finalizer is not None:
+                    e.finalizer.detach()
+            self._lru.clear()
+            self._dead.clear()
+            self.bytes_cached = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "uploads": self.uploads,
+                    "bytes_uploaded": self.bytes_uploaded,
+                    "bytes_saved": self.bytes_saved,
+                    "evictions": self.evictions,
+                    "bytes_cached": self.bytes_cached,
+                    "entries": len(self._lru),
+                    "budget": self.budget}
+
+    def __repr__(self):
+        return ("<DeviceCache nodeid=%d entries=%d cached=%d hits=%d misses=%d>"
+                % (self.proc.nodeid, len(self._lru), self.bytes_cached,
+                   self.hits, self.misses))
+
+
+def get_device_cache(proc, **kwargs):
+    """
+    Return the DeviceCache of proc, kept in proc.device_cache, creating
+    it on first use. kwargs are passed to DeviceCache().
+    """
+    c = proc.device_cache
+    if c is None:
+        c = DeviceCache(proc, **kwargs)
+        proc.device_cache = c
+    return c
@@ -0,0 +1,164 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Batches of VE calls executed by a VE side dispatcher.
+
+Every VeoFunction call is a veo_call_async() with its own round trip
+to the VE. For chains of small kernels the calls of a batch are packed
+into an array of records (see veo_dispatch.c) which is written to the VE
+and executed by the dispatcher function with one call:
+
+    req = ctx.submit_batch([(lib.f, (a, b)), (lib.g, (c,))])
+    results = req.wait_result()
+
+The dispatcher is built with VeBuild from veo_dispatch.c and loaded
+into each VeoProc on first use, or it can be taken from a static veorun
+that has veo_dispatch.c linked in. The functions of a batch take at most
+8 integer or pointer arguments.
+"""
+import os
+import tempfile
+import threading
+
+from veo._veo import wait_all, _dispatch_pack, _dispatch_results
+from veo.vebuild import VeBuild, COMPILER, FLAGS
+
+
+_lock = threading.Lock()
+# (name, compiler, flags) -> path of the built .so
+_so = dict()
+
+
+def build_src(name, compiler=None, flags=None, cache=None):
+    """
+    Build the C source name.c shipped in the veo package into a .so with
+    VeBuild and return its path. The .so is built once per process for
+    each compiler and flags.
+    """
+    compiler = compiler or COMPILER["C"]
+    flags = flags or FLAGS["C"]
+    with _lock:
+        so = _so.get((name, compiler, flags))
+        if so is not None and os.path.exists(so):
+            return so
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               name + ".c")) as f:
+            src = f.read()
+        bld = VeBuild(cache=cache)
+        bld.set_build_dir(tempfile.mkdtemp(prefix="veo-%s-" % name))
+        bld.set_c_src(name, src, flags=flags, compiler=compiler)
+        so = bld.build_so(linker=compiler)
+        if so is None:
+            raise RuntimeError("building %s.c failed" % name)
+        _so[(name, compiler, flags)] = so
+        return so
+
+
+class Dispatcher(object):
+    """
+    The dispatcher function in one VeoProc. func can be the VeoFunction
+    veo_dispatch found in a static veorun, otherwise the dispatcher is
+    built with compiler and flags (default: those of VeBuild for C).
+    """
+    def __init__(self, proc, func=None, compiler=None, flags=None, cache=None):
+        self.proc = proc
+        if func is None:
+            lib = proc.load_library(self.build(compiler, flags, cache))
+            func = lib.find_function("veo_dispatch")
+        func.args_type("void *")
+        func.ret_type("long")
+        self.func = func
+
+    @staticmethod
+    def build(compiler=None, flags=None, cache=None):
+        """
+        Build the dispatcher .so and return its path.
+        """
+        return build_src("veo_dispatch", compiler, flags, cache)
+
+    def submit(self, ctx, calls):
+        """
+        Pack the sequence of (VeoFunction, args) calls, write them to the
+        VE and run them with one call of the dispatcher in ctx. Returns a
+        BatchRequest.
+        """
+        calls = list(calls)
+        blk = _dispatch_pack(calls)
+        addr = self.proc.alloc_mem(blk.nbytes)
+        reqs = []
+        try:
+            reqs.append(ctx.async_write_mem(addr, blk, blk.nbytes))
+            req = self.func(ctx, addr)
+            if req is None:
+                raise RuntimeError("submitting veo_dispatch failed")
+            reqs.append(req)
+            reqs.append(ctx.async_read_mem(blk, addr, blk.nbytes))
+        except Exception:
+            # the queued requests still use addr
+            if reqs:
+                try:
+                    wait_all(reqs)
+                except Exception:
+                    pass
+            self.proc.free_mem(addr)
+            raise
+        return BatchRequest(self.proc, calls, blk, addr, reqs)
+
+
+class BatchRequest(object):
+    """
+    Request of a dispatched batch. wait_result() returns the results of
+    the calls, as numpy array if all functions have the same numeric
+    return type, otherwise as list.
+    """
+    def __init__(self, proc, calls, blk, addr, reqs):
+        self.proc = proc
+        self.calls = calls
+        self._blk = blk
+        self._addr = addr
+        self._reqs = reqs
+        self._res = None
+
+    def done(self):
+        return self._res is not None or self._reqs[-1].done()
+
+    def wait_result(self):
+        if self._res is None:
+            try:
+                wait_all(self._reqs)
+            finally:
+                if self._addr:
+                    self.proc.free_mem(self._addr)
+                    self._addr = 0
+            self._res = _dispatch_results(self.calls, self._blk)
+        return self._res
+
+    def __len__(self):
+        return len(self.calls)
+
+    def __repr__(self):
+        return "<BatchRequest calls=%d>" % len(self.calls)
+
+
+def get_dispatcher(proc, **kwargs):
+    """
+    Return the Dispatcher of proc, kept in proc.dispatcher, creating it
+    on first use. kwargs are passed to Dispatcher().
+    """
+    d = proc.dispatcher
+    if d is None:
+        d = Dispatcher(proc, **kwargs)
+        proc.dispatcher = d
+    return d
+
+
+def submit_batch(ctx, calls):
+    return get_dispatcher(ctx.proc).submit(ctx, calls)
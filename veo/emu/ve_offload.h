@@ -0,0 +1,107 @@
+/*
+ * Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+ *
+ * See LICENSE file for details.
+ *
+ * Host emulation of the VE Offloading API.
+ *
+ * This header replaces <ve_offload.h> when py-veo is built with
+ * VEO_EMULATE=1. Processes, contexts and memory live on the vector host:
+ * each context is a host thread with a real command queue, VE memory is
+ * host memory and libraries are host shared objects loaded with dlopen().
+ * It is meant for building, testing and profiling the Python binding on
+ * machines without a VE card, not for running VE code.
+ */
+#ifndef _VE_OFFLOAD_EMU_H_
+#define _VE_OFFLOAD_EMU_H_
+
+#include <stdint.h>
+#include <stddef.h>
+
+#define VEO_EMULATION 1
+#define VEO_API_VERSION 11
+#define VEO_MAX_NUM_ARGS 32
+#define VEO_REQUEST_ID_INVALID (~0UL)
+#define VEO_SYMNAME_LEN_MAX (255)
+#define VEO_LIBNAME_LEN_MAX (255)
+
+enum veo_context_state {
+	VEO_STATE_UNKNOWN = 0,
+	VEO_STATE_RUNNING,
+	VEO_STATE_SYSCALL,
+	VEO_STATE_BLOCKED,
+	VEO_STATE_EXIT,
+};
+
+enum veo_command_state {
+	VEO_COMMAND_OK = 0,
+	VEO_COMMAND_EXCEPTION,
+	VEO_COMMAND_ERROR,
+	VEO_COMMAND_UNFINISHED,
+};
+
+enum veo_args_intent {
+	VEO_INTENT_IN = 0,
+	VEO_INTENT_INOUT,
+	VEO_INTENT_OUT,
+};
+
+struct veo_args;
+struct veo_proc_handle;
+struct veo_thr_ctxt;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+const char *veo_version_string(void);
+int veo_api_version(void);
+struct veo_proc_handle *veo_proc_create(int);
+struct veo_proc_handle *veo_proc_create_static(int, char *);
+int veo_proc_destroy(struct veo_proc_handle *);
+int veo_proc_identifier(struct veo_proc_handle *);
+void *veo_set_proc_identifier(void *, int);
+uint64_t veo_load_library(struct veo_proc_handle *, const char *);
+int veo_unload_library(struct veo_proc_handle *, const uint64_t);
+uint64_t veo_get_sym(struct veo_proc_handle *, uint64_t, const char *);
+struct veo_thr_ctxt *veo_context_open(struct veo_proc_handle *);
+int veo_context_close(struct veo_thr_ctxt *);
+int veo_get_context_state(struct veo_thr_ctxt *);
+void veo_context_sync(struct veo_thr_ctxt *);
+struct veo_args *veo_args_alloc(void);
+int veo_args_set_u64(struct veo_args *, int, uint64_t);
+int veo_args_set_i64(struct veo_args *, int, int64_t);
+int veo_args_set_u32(struct veo_args *, int, uint32_t);
+int veo_args_set_i32(struct veo_args *, int, int32_t);
+int veo_args_set_float(struct veo_args *, int, float);
+int veo_args_set_double(struct veo_args *, int, double);
+int veo_args_set_stack(struct veo_args *, enum veo_args_intent, int,
+		       char *, size_t);
+void veo_args_clear(struct veo_args *);
+void veo_args_free(struct veo_args *);
+uint64_t veo_call_async(struct veo_thr_ctxt *, uint64_t, struct veo_args *);
+int veo_call_peek_result(struct veo_thr_ctxt *, uint64_t, uint64_t *);
+int veo_call_wait_result(struct veo_thr_ctxt *, uint64_t, uint64_t *);
+int veo_alloc_mem(struct veo_proc_handle *, uint64_t *, const size_t);
+int veo_alloc_hmem(struct veo_proc_handle *, void **, const size_t);
+int veo_free_mem(struct veo_proc_handle *, uint64_t);
+int veo_free_hmem(void *);
+int veo_read_mem(struct veo_proc_handle *, void *, uint64_t, size_t);
+int veo_write_mem(struct veo_proc_handle *, uint64_t, const void *, size_t);
+int veo_hmemcpy(void *, const void *, size_t);
+uint64_t veo_async_read_mem(struct veo_thr_ctxt *, void *, uint64_t, size_t);
+uint64_t veo_async_write_mem(struct veo_thr_ctxt *, uint64_t, const void *,
+			     size_t);
+int veo_get_ve_arch(int);
+
+int veo_is_ve_addr(const void *);
+void *veo_get_hmem_addr(void *);
+int veo_get_max_proc_identifier(void);
+int veo_get_proc_identifier_from_hmem(const void *);
+struct veo_proc_handle *veo_get_proc_handle_from_hmem(const void *);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif /* _VE_OFFLOAD_EMU_H_ */
@@ -0,0 +1,998 @@
+/*
+ * Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+ *
+ * See LICENSE file for details.
+ *
+ * Host emulation of the VE Offloading API, see ve_offload.h.
+ *
+ * - A process is a slot in a process table. Its "static library" is the
+ *   host program itself, or the shared object named by VEORUN_BIN resp.
+ *   passed to veo_proc_create_static().
+ * - VE memory is host memory, VE addresses are host pointers.
+ * - Each context runs one host thread that executes the commands of its
+ *   queue in order: function calls and asynchronous memory transfers.
+ *   Results are collected with veo_call_peek_result() and
+ *   veo_call_wait_result(), like with the real libveo.
+ * - Arguments are copied when a command is submitted, arguments passed on
+ *   the stack are copied into a per-command buffer and copied back after
+ *   the call for VEO_INTENT_INOUT and VEO_INTENT_OUT.
+ * - Function arguments are passed with the host calling convention:
+ *   values set with veo_args_set_float() and veo_args_set_double() go to
+ *   floating point registers, all other values to integer registers. The
+ *   result is the content of the integer return register, therefore host
+ *   kernels used with the emulation should return integers or pointers.
+ * - HMEM addresses are host pointers tagged with bit 63 and the process
+ *   identifier.
+ */
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <pthread.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+#include "ve_offload.h"
+
+#define EMU_VERSION_STRING "emulated (host threads)"
+#define EMU_MAX_PROCS 32
+#define EMU_DEFAULT_NODES 8
+#define EMU_MEM_ALIGN 64
+
+#define EMU_HMEM_FLAG (1UL << 63)
+#define EMU_HMEM_IDENT_SHIFT 56
+#define EMU_HMEM_IDENT_MASK 0x7fUL
+#define EMU_HMEM_ADDR_MASK ((1UL << EMU_HMEM_IDENT_SHIFT) - 1)
+
+#if defined(__aarch64__)
+#define EMU_INT_REGS 8
+#else
+#define EMU_INT_REGS 6
+#endif
+#define EMU_FP_REGS 8
+
+/*
+ * Context workers and waiters poll for this many rounds before going to
+ * sleep on a condition variable. This keeps futex wakeups out of the
+ * submit and wait paths, similar to the polling of the real libveo.
+ * Polling is disabled on single CPU hosts, the environment variable
+ * VEO_EMU_SPIN overrides the number of rounds.
+ */
+#define EMU_SPIN 4000
+
+#if defined(__x86_64__) || defined(__i386__)
+#define emu_cpu_relax() __builtin_ia32_pause()
+#elif defined(__aarch64__)
+#define emu_cpu_relax() __asm__ __volatile__("yield")
+#else
+#define emu_cpu_relax() do { } while (0)
+#endif
+
+enum emu_arg_class {
+	EMU_ARG_INT = 0,
+	EMU_ARG_FP,
+	EMU_ARG_STACK,
+};
+
+struct emu_arg {
+	int cls;
+	uint64_t val;
+	enum veo_args_intent intent;
+	char *buf;
+	size_t len;
+};
+
+struct veo_args {
+	int nargs;
+	struct emu_arg arg[VEO_MAX_NUM_ARGS];
+};
+
+enum emu_cmd_kind {
+	EMU_CMD_CALL = 0,
+	EMU_CMD_READ,
+	EMU_CMD_WRITE,
+	EMU_CMD_EXIT,
+};
+
+struct emu_cmd {
+	struct emu_cmd *next;
+	uint64_t reqid;
+	int kind;
+	/* EMU_CMD_CALL: function address, EMU_CMD_READ/WRITE: VE address */
+	uint64_t addr;
+	void *hbuf;
+	size_t size;
+	int nargs;
+	struct emu_arg arg[VEO_MAX_NUM_ARGS];
+	void *stack[VEO_MAX_NUM_ARGS];
+	int state;
+	uint64_t retval;
+};
+
+struct emu_lib {
+	struct emu_lib *next;
+	void *handle;
+};
+
+struct veo_thr_ctxt {
+	struct veo_thr_ctxt *next;
+	struct veo_proc_handle *proc;
+	pthread_t thread;
+	pthread_mutex_t lock;
+	pthread_cond_t submit_cond;
+	pthread_cond_t done_cond;
+	struct emu_cmd *qhead, *qtail;	/* submitted, not yet started */
+	struct emu_cmd *running;
+	struct emu_cmd *dhead, *dtail;	/* finished, result not collected */
+	uint64_t next_reqid;
+	uint64_t ndone;		/* number of finished commands */
+	int state;
+	int closing;
+	int sleeping;		/* worker waits for submit_cond */
+	int waiters;		/* threads waiting for done_cond */
+};
+
+struct veo_proc_handle {
+	int nodeid;
+	int ident;
+	void *static_handle;
+	pthread_mutex_t lock;
+	struct emu_lib *libs;
+	struct veo_thr_ctxt *ctxs;
+};
+
+static pthread_mutex_t emu_procs_lock = PTHREAD_MUTEX_INITIALIZER;
+static struct veo_proc_handle *emu_procs[EMU_MAX_PROCS];
+static int emu_spin = -1;
+
+/*
+ * veo_alloc_mem() and veo_free_mem() are synchronous requests to the VE
+ * process in the real libveo. The environment variable VEO_EMU_MEM_USEC
+ * adds this round trip latency to the emulated calls (default 0).
+ */
+static int emu_mem_usec = -1;
+
+static void emu_mem_delay(void)
+{
+	if (emu_mem_usec < 0) {
+		char *s = getenv("VEO_EMU_MEM_USEC");
+
+		emu_mem_usec = s ? atoi(s) : 0;
+	}
+	if (emu_mem_usec > 0)
+		usleep(emu_mem_usec);
+}
+
+/*
+ * veo_proc_create() starts veorun on the VE, which takes about a second.
+ * VEO_EMU_PROC_USEC adds this startup latency to the emulated process
+ * creation (default 0).
+ */
+static int emu_proc_usec = -1;
+
+static void emu_proc_delay(void)
+{
+	if (emu_proc_usec < 0) {
+		char *s = getenv("VEO_EMU_PROC_USEC");
+
+		emu_proc_usec = s ? atoi(s) : 0;
+	}
+	if (emu_proc_usec > 0)
+		usleep(emu_proc_usec);
+}
+
+static int emu_ctx_stop(struct veo_thr_ctxt *ctx);
+static void emu_ctx_unlink(struct veo_thr_ctxt *ctx);
+
+typedef uint64_t (*emu_func_t)(
+	uint64_t, uint64_t, uint64_t, uint64_t,
+#if EMU_INT_REGS == 8
+	uint64_t, uint64_t, uint64_t, uint64_t,
+#else
+	uint64_t, uint64_t,
+#endif
+	double, double, double, double, double, double, double, double,
+	uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t,
+	uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t,
+	uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t,
+	uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t);
+
+/*
+ * Call a host function with up to VEO_MAX_NUM_ARGS arguments. Arguments
+ * are sorted into integer and floating point registers, the ones that don't
+ * fit into registers go onto the stack in their original order. Passing
+ * the remaining slots of the register and stack arrays is harmless, they
+ * are ignored by the callee.
+ */
+static uint64_t emu_invoke(uint64_t addr, int nargs, const struct emu_arg *arg,
+			   void **stack)
+{
+	uint64_t ir[EMU_INT_REGS] = {0};
+	double fr[EMU_FP_REGS] = {0};
+	uint64_t st[VEO_MAX_NUM_ARGS] = {0};
+	int i, ni = 0, nf = 0, ns = 0;
+	uint64_t v;
+
+	for (i = 0; i < nargs; i++) {
+		v = arg[i].cls == EMU_ARG_STACK ? (uint64_t)stack[i] : arg[i].val;
+		if (arg[i].cls == EMU_ARG_FP && nf < EMU_FP_REGS)
+			memcpy(&fr[nf++], &v, sizeof(v));
+		else if (arg[i].cls != EMU_ARG_FP && ni < EMU_INT_REGS)
+			ir[ni++] = v;
+		else
+			st[ns++] = v;
+	}
+	return ((emu_func_t)addr)(
+		ir[0], ir[1], ir[2], ir[3], ir[4], ir[5],
+#if EMU_INT_REGS == 8
+		ir[6], ir[7],
+#endif
+		fr[0], fr[1], fr[2], fr[3], fr[4], fr[5], fr[6], fr[7],
+		st[0], st[1], st[2], st[3], st[4], st[5], st[6], st[7],
+		st[8], st[9], st[10], st[11], st[12], st[13], st[14], st[15],
+		st[16], st[17], st[18], st[19], st[20], st[21], st[22], st[23],
+		st[24], st[25], st[26], st[27], st[28], st[29], st[30], st[31]);
+}
+
+static struct emu_cmd *emu_cmd_alloc(int kind)
+{
+	struct emu_cmd *cmd = (struct emu_cmd *)malloc(sizeof(*cmd));
+
+	if (cmd == NULL)
+		return NULL;
+	cmd->next = NULL;
+	cmd->kind = kind;
+	cmd->nargs = 0;
+	cmd->retval = 0;
+	return cmd;
+}
+
+static void emu_cmd_free(struct emu_cmd *cmd)
+{
+	int i;
+
+	for (i = 0; i < cmd->nargs; i++)
+		free(cmd->stack[i]);
+	free(cmd);
+}
+
+static void emu_cmd_execute(struct emu_cmd *cmd)
+{
+	const struct emu_arg *a;
+	int i;
+
+	switch (cmd->kind) {
+	case EMU_CMD_CALL:
+		cmd->retval = emu_invoke(cmd->addr, cmd->nargs, cmd->arg,
+					 cmd->stack);
+		for (i = 0; i < cmd->nargs; i++) {
+			a = &cmd->arg[i];
+			if (a->cls == EMU_ARG_STACK && a->intent != VEO_INTENT_IN)
+				memcpy(a->buf, cmd->stack[i], a->len);
+		}
+		break;
+	case EMU_CMD_READ:
+		memcpy(cmd->hbuf, (void *)cmd->addr, cmd->size);
+		cmd->retval = 0;
+		break;
+	case EMU_CMD_WRITE:
+		memcpy((void *)cmd->addr, cmd->hbuf, cmd->size);
+		cmd->retval = 0;
+		break;
+	}
+	cmd->state = VEO_COMMAND_OK;
+}
+
+static void *emu_ctx_worker(void *data)
+{
+	struct veo_thr_ctxt *ctx = (struct veo_thr_ctxt *)data;
+	struct emu_cmd *cmd;
+
+	int i;
+
+	pthread_mutex_lock(&ctx->lock);
+	for (;;) {
+		if (ctx->qhead == NULL && emu_spin > 0) {
+			pthread_mutex_unlock(&ctx->lock);
+			for (i = 0; i < emu_spin &&
+			     __atomic_load_n(&ctx->qhead, __ATOMIC_ACQUIRE) == NULL; i++)
+				emu_cpu_relax();
+			pthread_mutex_lock(&ctx->lock);
+		}
+		while (ctx->qhead == NULL) {
+			ctx->sleeping = 1;
+			pthread_cond_wait(&ctx->submit_cond, &ctx->lock);
+			ctx->sleeping = 0;
+		}
+		cmd = ctx->qhead;
+		ctx->qhead = cmd->next;
+		if (ctx->qhead == NULL)
+			ctx->qtail = NULL;
+		cmd->next = NULL;
+		if (cmd->kind == EMU_CMD_EXIT) {
+			emu_cmd_free(cmd);
+			break;
+		}
+		ctx->running = cmd;
+		pthread_mutex_unlock(&ctx->lock);
+
+		emu_cmd_execute(cmd);
+
+		pthread_mutex_lock(&ctx->lock);
+		ctx->running = NULL;
+		if (ctx->dtail)
+			ctx->dtail->next = cmd;
+		else
+			ctx->dhead = cmd;
+		ctx->dtail = cmd;
+		__atomic_store_n(&ctx->ndone, ctx->ndone + 1, __ATOMIC_RELEASE);
+		if (ctx->waiters)
+			pthread_cond_broadcast(&ctx->done_cond);
+	}
+	ctx->state = VEO_STATE_EXIT;
+	pthread_cond_broadcast(&ctx->done_cond);
+	pthread_mutex_unlock(&ctx->lock);
+	return NULL;
+}
+
+static uint64_t emu_submit(struct veo_thr_ctxt *ctx, struct emu_cmd *cmd)
+{
+	uint64_t reqid;
+
+	pthread_mutex_lock(&ctx->lock);
+	if (ctx->state != VEO_STATE_RUNNING || ctx->closing) {
+		pthread_mutex_unlock(&ctx->lock);
+		emu_cmd_free(cmd);
+		return VEO_REQUEST_ID_INVALID;
+	}
+	if (cmd->kind == EMU_CMD_EXIT)
+		ctx->closing = 1;
+	reqid = cmd->reqid = ctx->next_reqid++;
+	cmd->state = VEO_COMMAND_UNFINISHED;
+	if (ctx->qtail)
+		ctx->qtail->next = cmd;
+	else
+		__atomic_store_n(&ctx->qhead, cmd, __ATOMIC_RELEASE);
+	ctx->qtail = cmd;
+	if (ctx->sleeping)
+		pthread_cond_signal(&ctx->submit_cond);
+	pthread_mutex_unlock(&ctx->lock);
+	return reqid;
+}
+
+/* must be called with ctx->lock held */
+static int emu_is_pending(struct veo_thr_ctxt *ctx, uint64_t reqid)
+{
+	struct emu_cmd *c;
+
+	if (ctx->running && ctx->running->reqid == reqid)
+		return 1;
+	for (c = ctx->qhead; c; c = c->next)
+		if (c->reqid == reqid)
+			return 1;
+	return 0;
+}
+
+/* must be called with ctx->lock held */
+static struct emu_cmd *emu_take_done(struct veo_thr_ctxt *ctx, uint64_t reqid)
+{
+	struct emu_cmd *c, *prev = NULL;
+
+	for (c = ctx->dhead; c; prev = c, c = c->next) {
+		if (c->reqid != reqid)
+			continue;
+		if (prev)
+			prev->next = c->next;
+		else
+			ctx->dhead = c->next;
+		if (ctx->dtail == c)
+			ctx->dtail = prev;
+		return c;
+	}
+	return NULL;
+}
+
+/*
+ * Wait until the worker finished another command. Must be called with
+ * ctx->lock held, polls for a while without the lock before sleeping.
+ */
+static void emu_wait_done(struct veo_thr_ctxt *ctx, int *spun)
+{
+	uint64_t ndone = ctx->ndone;
+	int i;
+
+	if (!*spun && emu_spin > 0) {
+		*spun = 1;
+		pthread_mutex_unlock(&ctx->lock);
+		for (i = 0; i < emu_spin &&
+		     __atomic_load_n(&ctx->ndone, __ATOMIC_ACQUIRE) == ndone; i++)
+			emu_cpu_relax();
+		pthread_mutex_lock(&ctx->lock);
+		return;
+	}
+	*spun = 0;
+	ctx->waiters++;
+	pthread_cond_wait(&ctx->done_cond, &ctx->lock);
+	ctx->waiters--;
+}
+
+static int emu_collect(struct emu_cmd *cmd, uint64_t *retp)
+{
+	int state = cmd->state;
+
+	if (retp)
+		*retp = cmd->retval;
+	emu_cmd_free(cmd);
+	return state;
+}
+
+static int emu_nodes(void)
+{
+	char *s = getenv("VEO_EMU_NODES");
+
+	if (s && atoi(s) > 0)
+		return atoi(s);
+	return EMU_DEFAULT_NODES;
+}
+
+static void *emu_untag(const void *addr)
+{
+	uint64_t a = (uint64_t)addr;
+
+	if (a & EMU_HMEM_FLAG)
+		a &= EMU_HMEM_ADDR_MASK;
+	return (void *)a;
+}
+
+const char *veo_version_string(void)
+{
+	return EMU_VERSION_STRING;
+}
+
+int veo_api_version(void)
+{
+	return VEO_API_VERSION;
+}
+
+int veo_get_ve_arch(int ve_node_number)
+{
+	if (ve_node_number < 0 || ve_node_number >= emu_nodes())
+		return -1;
+	return 1;
+}
+
+struct veo_proc_handle *veo_proc_create_static(int nodeid, char *veorun_bin)
+{
+	struct veo_proc_handle *proc;
+	char *s;
+	int i;
+
+	if (nodeid < 0) {
+		s = getenv("VE_NODE_NUMBER");
+		nodeid = s ? atoi(s) : 0;
+	}
+	if (nodeid < 0 || nodeid >= emu_nodes()) {
+		errno = ENODEV;
+		return NULL;
+	}
+	proc = (struct veo_proc_handle *)calloc(1, sizeof(*proc));
+	if (proc == NULL)
+		return NULL;
+	emu_proc_delay();
+	proc->nodeid = nodeid;
+	proc->static_handle = dlopen(veorun_bin, RTLD_NOW | RTLD_LOCAL);
+	if (proc->static_handle == NULL) {
+		free(proc);
+		errno = ENOENT;
+		return NULL;
+	}
+	pthread_mutex_init(&proc->lock, NULL);
+
+	pthread_mutex_lock(&emu_procs_lock);
+	for (i = 0; i < EMU_MAX_PROCS; i++) {
+		if (emu_procs[i] == NULL) {
+			emu_procs[i] = proc;
+			proc->ident = i;
+			break;
+		}
+	}
+	pthread_mutex_unlock(&emu_procs_lock);
+	if (i == EMU_MAX_PROCS) {
+		dlclose(proc->static_handle);
+		pthread_mutex_destroy(&proc->lock);
+		free(proc);
+		errno = EAGAIN;
+		return NULL;
+	}
+	return proc;
+}
+
+struct veo_proc_handle *veo_proc_create(int nodeid)
+{
+	return veo_proc_create_static(nodeid, getenv("VEORUN_BIN"));
+}
+
+int veo_proc_destroy(struct veo_proc_handle *proc)
+{
+	struct veo_thr_ctxt *ctx;
+	struct emu_lib *l;
+
+	/*
+	 * Contexts still referenced by the caller are stopped but not freed,
+	 * they are released by a later veo_context_close().
+	 */
+	pthread_mutex_lock(&proc->lock);
+	while (proc->ctxs) {
+		ctx = proc->ctxs;
+		pthread_mutex_unlock(&proc->lock);
+		emu_ctx_stop(ctx);
+		pthread_mutex_lock(&proc->lock);
+		emu_ctx_unlink(ctx);
+	}
+	pthread_mutex_unlock(&proc->lock);
+	while (proc->libs) {
+		l = proc->libs;
+		proc->libs = l->next;
+		dlclose(l->handle);
+		free(l);
+	}
+	dlclose(proc->static_handle);
+	pthread_mutex_lock(&emu_procs_lock);
+	emu_procs[proc->ident] = NULL;
+	pthread_mutex_unlock(&emu_procs_lock);
+	pthread_mutex_destroy(&proc->lock);
+	free(proc);
+	return 0;
+}
+
+int veo_proc_identifier(struct veo_proc_handle *proc)
+{
+	int i, iden = -1;
+
+	pthread_mutex_lock(&emu_procs_lock);
+	for (i = 0; i < EMU_MAX_PROCS; i++) {
+		if (emu_procs[i] == proc) {
+			iden = i;
+			break;
+		}
+	}
+	pthread_mutex_unlock(&emu_procs_lock);
+	return iden;
+}
+
+int veo_get_max_proc_identifier(void)
+{
+	int i, max = -1;
+
+	pthread_mutex_lock(&emu_procs_lock);
+	for (i = 0; i < EMU_MAX_PROCS; i++)
+		if (emu_procs[i])
+			max = i;
+	pthread_mutex_unlock(&emu_procs_lock);
+	return max;
+}
+
+uint64_t veo_load_library(struct veo_proc_handle *proc, const char *libname)
+{
+	struct emu_lib *l;
+	void *handle;
+
+	handle = dlopen(libname, RTLD_NOW | RTLD_LOCAL);
+	if (handle == NULL)
+		return 0;
+	l = (struct emu_lib *)malloc(sizeof(*l));
+	if (l == NULL) {
+		dlclose(handle);
+		return 0;
+	}
+	l->handle = handle;
+	pthread_mutex_lock(&proc->lock);
+	l->next = proc->libs;
+	proc->libs = l;
+	pthread_mutex_unlock(&proc->lock);
+	return (uint64_t)handle;
+}
+
+int veo_unload_library(struct veo_proc_handle *proc, const uint64_t libhdl)
+{
+	struct emu_lib *l, **lp;
+
+	pthread_mutex_lock(&proc->lock);
+	for (lp = &proc->libs; *lp; lp = &(*lp)->next) {
+		if ((uint64_t)(*lp)->handle == libhdl) {
+			l = *lp;
+			*lp = l->next;
+			pthread_mutex_unlock(&proc->lock);
+			dlclose(l->handle);
+			free(l);
+			return 0;
+		}
+	}
+	pthread_mutex_unlock(&proc->lock);
+	return -1;
+}
+
+uint64_t veo_get_sym(struct veo_proc_handle *proc, uint64_t libhdl,
+		     const char *symname)
+{
+	void *handle = libhdl ? (void *)libhdl : proc->static_handle;
+
+	return (uint64_t)dlsym(handle, symname);
+}
+
+struct veo_thr_ctxt *veo_context_open(struct veo_proc_handle *proc)
+{
+	struct veo_thr_ctxt *ctx;
+	char *s;
+
+	if (emu_spin < 0) {
+		s = getenv("VEO_EMU_SPIN");
+		if (s)
+			emu_spin = atoi(s);
+		else
+			emu_spin = sysconf(_SC_NPROCESSORS_ONLN) > 1 ? EMU_SPIN : 0;
+	}
+	ctx = (struct veo_thr_ctxt *)calloc(1, sizeof(*ctx));
+	if (ctx == NULL)
+		return NULL;
+	ctx->proc = proc;
+	ctx->next_reqid = 1;
+	ctx->state = VEO_STATE_RUNNING;
+	pthread_mutex_init(&ctx->lock, NULL);
+	pthread_cond_init(&ctx->submit_cond, NULL);
+	pthread_cond_init(&ctx->done_cond, NULL);
+	if (pthread_create(&ctx->thread, NULL, emu_ctx_worker, ctx)) {
+		pthread_cond_destroy(&ctx->done_cond);
+		pthread_cond_destroy(&ctx->submit_cond);
+		pthread_mutex_destroy(&ctx->lock);
+		free(ctx);
+		return NULL;
+	}
+	pthread_mutex_lock(&proc->lock);
+	ctx->next = proc->ctxs;
+	proc->ctxs = ctx;
+	pthread_mutex_unlock(&proc->lock);
+	return ctx;
+}
+
+/*
+ * Stop the worker thread of a context after it has finished the commands
+ * submitted so far. The context structure stays valid until it is freed
+ * by veo_context_close().
+ */
+static int emu_ctx_stop(struct veo_thr_ctxt *ctx)
+{
+	struct emu_cmd *cmd;
+
+	if (veo_get_context_state(ctx) != VEO_STATE_RUNNING)
+		return 0;
+	cmd = emu_cmd_alloc(EMU_CMD_EXIT);
+	if (cmd == NULL)
+		return -1;
+	if (emu_submit(ctx, cmd) == VEO_REQUEST_ID_INVALID)
+		return -1;
+	pthread_join(ctx->thread, NULL);
+	return 0;
+}
+
+/* must be called with proc->lock held */
+static void emu_ctx_unlink(struct veo_thr_ctxt *ctx)
+{
+	struct veo_thr_ctxt **cp;
+
+	for (cp = &ctx->proc->ctxs; *cp; cp = &(*cp)->next) {
+		if (*cp == ctx) {
+			*cp = ctx->next;
+			break;
+		}
+	}
+	ctx->proc = NULL;
+}
+
+int veo_context_close(struct veo_thr_ctxt *ctx)
+{
+	struct veo_proc_handle *proc = ctx->proc;
+	struct emu_cmd *cmd;
+
+	if (emu_ctx_stop(ctx))
+		return -1;
+	if (proc) {
+		pthread_mutex_lock(&proc->lock);
+		emu_ctx_unlink(ctx);
+		pthread_mutex_unlock(&proc->lock);
+	}
+	while (ctx->dhead) {
+		cmd = ctx->dhead;
+		ctx->dhead = cmd->next;
+		emu_cmd_free(cmd);
+	}
+	pthread_cond_destroy(&ctx->done_cond);
+	pthread_cond_destroy(&ctx->submit_cond);
+	pthread_mutex_destroy(&ctx->lock);
+	free(ctx);
+	return 0;
+}
+
+int veo_get_context_state(struct veo_thr_ctxt *ctx)
+{
+	int state;
+
+	pthread_mutex_lock(&ctx->lock);
+	state = ctx->state;
+	pthread_mutex_unlock(&ctx->lock);
+	return state;
+}
+
+void veo_context_sync(struct veo_thr_ctxt *ctx)
+{
+	int spun = 0;
+
+	pthread_mutex_lock(&ctx->lock);
+	while (ctx->state == VEO_STATE_RUNNING && (ctx->qhead || ctx->running))
+		emu_wait_done(ctx, &spun);
+	pthread_mutex_unlock(&ctx->lock);
+}
+
+struct veo_args *veo_args_alloc(void)
+{
+	return (struct veo_args *)calloc(1, sizeof(struct veo_args));
+}
+
+static int emu_args_set(struct veo_args *ca, int argnum, int cls, uint64_t val)
+{
+	if (argnum < 0 || argnum >= VEO_MAX_NUM_ARGS)
+		return -1;
+	ca->arg[argnum].cls = cls;
+	ca->arg[argnum].val = val;
+	if (argnum >= ca->nargs)
+		ca->nargs = argnum + 1;
+	return 0;
+}
+
+int veo_args_set_u64(struct veo_args *ca, int argnum, uint64_t val)
+{
+	return emu_args_set(ca, argnum, EMU_ARG_INT, val);
+}
+
+int veo_args_set_i64(struct veo_args *ca, int argnum, int64_t val)
+{
+	return emu_args_set(ca, argnum, EMU_ARG_INT, (uint64_t)val);
+}
+
+int veo_args_set_u32(struct veo_args *ca, int argnum, uint32_t val)
+{
+	return emu_args_set(ca, argnum, EMU_ARG_INT, (uint64_t)val);
+}
+
+int veo_args_set_i32(struct veo_args *ca, int argnum, int32_t val)
+{
+	return emu_args_set(ca, argnum, EMU_ARG_INT, (uint64_t)(int64_t)val);
+}
+
+int veo_args_set_float(struct veo_args *ca, int argnum, float val)
+{
+	uint64_t v = 0;
+
+	/* the callee reads the lower half of the floating point register */
+	memcpy(&v, &val, sizeof(val));
+	return emu_args_set(ca, argnum, EMU_ARG_FP, v);
+}
+
+int veo_args_set_double(struct veo_args *ca, int argnum, double val)
+{
+	uint64_t v;
+
+	memcpy(&v, &val, sizeof(val));
+	return emu_args_set(ca, argnum, EMU_ARG_FP, v);
+}
+
+int veo_args_set_stack(struct veo_args *ca, enum veo_args_intent inout,
+		       int argnum, char *buff, size_t len)
+{
+	if (emu_args_set(ca, argnum, EMU_ARG_STACK, 0))
+		return -1;
+	ca->arg[argnum].intent = inout;
+	ca->arg[argnum].buf = buff;
+	ca->arg[argnum].len = len;
+	return 0;
+}
+
+void veo_args_clear(struct veo_args *ca)
+{
+	memset(ca, 0, sizeof(*ca));
+}
+
+void veo_args_free(struct veo_args *ca)
+{
+	free(ca);
+}
+
+uint64_t veo_call_async(struct veo_thr_ctxt *ctx, uint64_t addr,
+			struct veo_args *ca)
+{
+	struct emu_cmd *cmd;
+	struct emu_arg *a;
+	int i;
+
+	if (addr == 0 || ca == NULL)
+		return VEO_REQUEST_ID_INVALID;
+	cmd = emu_cmd_alloc(EMU_CMD_CALL);
+	if (cmd == NULL)
+		return VEO_REQUEST_ID_INVALID;
+	cmd->addr = addr;
+	cmd->nargs = ca->nargs;
+	memcpy(cmd->arg, ca->arg, ca->nargs * sizeof(struct emu_arg));
+	memset(cmd->stack, 0, ca->nargs * sizeof(void *));
+	for (i = 0; i < cmd->nargs; i++) {
+		a = &cmd->arg[i];
+		if (a->cls != EMU_ARG_STACK)
+			continue;
+		cmd->stack[i] = calloc(1, a->len ? a->len : 1);
+		if (cmd->stack[i] == NULL) {
+			emu_cmd_free(cmd);
+			return VEO_REQUEST_ID_INVALID;
+		}
+		if (a->intent != VEO_INTENT_OUT)
+			memcpy(cmd->stack[i], a->buf, a->len);
+	}
+	return emu_submit(ctx, cmd);
+}
+
+int veo_call_peek_result(struct veo_thr_ctxt *ctx, uint64_t reqid,
+			 uint64_t *retp)
+{
+	struct emu_cmd *cmd;
+	int pending;
+
+	pthread_mutex_lock(&ctx->lock);
+	cmd = emu_take_done(ctx, reqid);
+	pending = cmd ? 0 : emu_is_pending(ctx, reqid);
+	pthread_mutex_unlock(&ctx->lock);
+	if (cmd)
+		return emu_collect(cmd, retp);
+	return pending ? VEO_COMMAND_UNFINISHED : -1;
+}
+
+int veo_call_wait_result(struct veo_thr_ctxt *ctx, uint64_t reqid,
+			 uint64_t *retp)
+{
+	struct emu_cmd *cmd;
+	int spun = 0;
+
+	pthread_mutex_lock(&ctx->lock);
+	for (;;) {
+		cmd = emu_take_done(ctx, reqid);
+		if (cmd || !emu_is_pending(ctx, reqid) ||
+		    ctx->state != VEO_STATE_RUNNING)
+			break;
+		emu_wait_done(ctx, &spun);
+	}
+	pthread_mutex_unlock(&ctx->lock);
+	if (cmd)
+		return emu_collect(cmd, retp);
+	return -1;
+}
+
+int veo_alloc_mem(struct veo_proc_handle *proc, uint64_t *addr,
+		  const size_t size)
+{
+	void *p;
+
+	emu_mem_delay();
+	if (posix_memalign(&p, EMU_MEM_ALIGN, size ? size : 1))
+		return -1;
+	*addr = (uint64_t)p;
+	return 0;
+}
+
+int veo_free_mem(struct veo_proc_handle *proc, uint64_t addr)
+{
+	emu_mem_delay();
+	free((void *)addr);
+	return 0;
+}
+
+int veo_read_mem(struct veo_proc_handle *proc, void *dst, uint64_t src,
+		 size_t size)
+{
+	memcpy(dst, (void *)src, size);
+	return 0;
+}
+
+int veo_write_mem(struct veo_proc_handle *proc, uint64_t dst, const void *src,
+		  size_t size)
+{
+	memcpy((void *)dst, src, size);
+	return 0;
+}
+
+static uint64_t emu_async_mem(struct veo_thr_ctxt *ctx, int kind,
+			      uint64_t addr, void *hbuf, size_t size)
+{
+	struct emu_cmd *cmd;
+
+	cmd = emu_cmd_alloc(kind);
+	if (cmd == NULL)
+		return VEO_REQUEST_ID_INVALID;
+	cmd->addr = addr;
+	cmd->hbuf = hbuf;
+	cmd->size = size;
+	return emu_submit(ctx, cmd);
+}
+
+uint64_t veo_async_read_mem(struct veo_thr_ctxt *ctx, void *dst, uint64_t src,
+			    size_t size)
+{
+	return emu_async_mem(ctx, EMU_CMD_READ, src, dst, size);
+}
+
+uint64_t veo_async_write_mem(struct veo_thr_ctxt *ctx, uint64_t dst,
+			     const void *src, size_t size)
+{
+	return emu_async_mem(ctx, EMU_CMD_WRITE, dst, (void *)src, size);
+}
+
+void *veo_set_proc_identifier(void *addr, int proc_ident)
+{
+	uint64_t a = (uint64_t)emu_untag(addr);
+
+	if (proc_ident < 0 || proc_ident >= EMU_MAX_PROCS)
+		return NULL;
+	return (void *)(a | EMU_HMEM_FLAG |
+			((uint64_t)proc_ident << EMU_HMEM_IDENT_SHIFT));
+}
+
+int veo_alloc_hmem(struct veo_proc_handle *proc, void **addr,
+		   const size_t size)
+{
+	void *p;
+
+	if (posix_memalign(&p, EMU_MEM_ALIGN, size ? size : 1))
+		return -1;
+	*addr = veo_set_proc_identifier(p, proc->ident);
+	return 0;
+}
+
+int veo_free_hmem(void *addr)
+{
+	free(emu_untag(addr));
+	return 0;
+}
+
+int veo_hmemcpy(void *dst, const void *src, size_t size)
+{
+	memcpy(emu_untag(dst), emu_untag(src), size);
+	return 0;
+}
+
+int veo_is_ve_addr(const void *addr)
+{
+	return ((uint64_t)addr & EMU_HMEM_FLAG) ? 1 : 0;
+}
+
+void *veo_get_hmem_addr(void *addr)
+{
+	return emu_untag(addr);
+}
+
+int veo_get_proc_identifier_from_hmem(const void *addr)
+{
+	uint64_t a = (uint64_t)addr;
+
+	if (!(a & EMU_HMEM_FLAG))
+		return -1;
+	return (int)((a >> EMU_HMEM_IDENT_SHIFT) & EMU_HMEM_IDENT_MASK);
+}
+
+struct veo_proc_handle *veo_get_proc_handle_from_hmem(const void *addr)
+{
+	struct veo_proc_handle *proc;
+	int iden = veo_get_proc_identifier_from_hmem(addr);
+
+	if (iden < 0 || iden >= EMU_MAX_PROCS)
+		return NULL;
+	pthread_mutex_lock(&emu_procs_lock);
+	proc = emu_procs[iden];
+	pthread_mutex_unlock(&emu_procs_lock);
+	return proc;
+}
@@ -0,0 +1,472 @@
+#
+# Record and replay of call and transfer sequences, see VeoCtxt.capture().
+#
+# While a VeoGraph captures a context, VeoFunction and VeoCall
+# submissions and async transfers in that context are recorded instead
+# of being submitted. Each recorded call keeps its own veo_args, fixed
+# host buffers are pinned once at capture time. Arguments, VE addresses
+# and host buffers that change between replays are Placeholders, they
+# are bound by name in replay(), which then submits all operations in
+# one loop without the GIL.
+#
+from cpython.buffer cimport PyBUF_WRITABLE
+from libc.stdlib cimport realloc
+from libc.string cimport memset
+
+cdef enum:
+    _G_ADDR = -1    # binding of the VE address of a transfer
+    _G_BUF = -2     # binding of the host buffer of a transfer
+
+cdef struct _GraphOp:
+    int kind        # _TR_CALL, _TR_READ or _TR_WRITE
+    uint64_t addr   # function address or VE address
+    veo_args *args
+    void *buf
+    size_t size
+    bint pinned     # view holds a buffer pinned at capture time
+    Py_buffer view
+
+cdef struct _GraphBind:
+    int op
+    int field       # argument number, _G_ADDR or _G_BUF
+    int code        # type code of the argument
+    int slot
+
+
+cdef class Placeholder(object):
+    """
+    Named argument of a captured operation, bound in VeoGraph.replay().
+    """
+    cdef readonly object name
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "<Placeholder %r>" % (self.name,)
+
+
+cdef class VeoGraph(object):
+    """
+    Sequence of calls and transfers recorded in a context, created by
+    VeoCtxt.capture().
+    """
+    cdef readonly VeoCtxt ctx
+    cdef _GraphOp *ops
+    cdef Py_ssize_t nops
+    cdef Py_ssize_t cap
+    cdef _GraphBind *binds
+    cdef Py_ssize_t nbinds
+    cdef list _funcs            # VeoFunction of each op, None for transfers
+    cdef list _args             # VeoArgs keeping the veo_args of calls
+    cdef dict _slots            # placeholder name -> slot
+    cdef list _slot_buf         # per slot: True for buffers
+    cdef readonly bint capturing
+    cdef object _run            # VeoGraphRun in flight
+
+    def __cinit__(self):
+        self.ops = NULL
+        self.binds = NULL
+
+    def __init__(self, VeoCtxt ctx):
+        self.ctx = ctx
+        self._funcs = []
+        self._args = []
+        self._slots = {}
+        self._slot_buf = []
+        self.capturing = True
+
+    def __dealloc__(self):
+        cdef Py_ssize_t i
+        if self.ops != NULL:
+            for i in range(self.nops):
+                if self.ops[i].pinned:
+                    PyBuffer_Release(&self.ops[i].view)
+            free(self.ops)
+        free(self.binds)
+
+    def __repr__(self):
+        return "<VeoGraph ops=%d placeholders=%r%s>" % (
+            self.nops, list(self._slots), " capturing" if self.capturing else "")
+
+    def __len__(self):
+        return self.nops
+
+    @property
+    def placeholders(self):
+        return list(self._slots)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end_capture()
+
+    def end_capture(self):
+        """
+        Stop recording, the context submits operations again.
+        """
+        if self.capturing:
+            self.capturing = False
+            if self.ctx._graph is self:
+                self.ctx._graph = None
+
+    cdef _GraphOp *_add(self, int kind, VeoFunction f, VeoArgs a) except NULL:
+        cdef _GraphOp *op
+        if not self.capturing:
+            raise RuntimeError("VeoGraph: capture has ended")
+        if self.nops == self.cap:
+            op = <_GraphOp *>realloc(self.ops, (2 * self.cap + 8) * sizeof(_GraphOp))
+            if op == NULL:
+                raise MemoryError("VeoGraph: out of memory")
+            self.ops = op
+            self.cap = 2 * self.cap + 8
+        op = &self.ops[self.nops]
+        memset(op, 0, sizeof(_GraphOp))
+        op.kind = kind
+        self.nops += 1
+        self._funcs.append(f)
+        self._args.append(a)
+        return op
+
+    cdef _rollback(self, Py_ssize_t nops, Py_ssize_t nbinds, Py_ssize_t nslots):
+        """
+        Drop what a failed recording added.
+        """
+        cdef Py_ssize_t i
+        for i in range(nops, self.nops):
+            if self.ops[i].pinned:
+                PyBuffer_Release(&self.ops[i].view)
+        self.nops = nops
+        self.nbinds = nbinds
+        del self._funcs[nops:]
+        del self._args[nops:]
+        del self._slot_buf[nslots:]
+        for name in [k for k, v in self._slots.items() if v >= nslots]:
+            del self._slots[name]
+
+    cdef int _bind(self, int field, int code, Placeholder p, bint buf) except -1:
+        cdef _GraphBind *b
+        slot = self._slots.get(p.name)
+        if slot is None:
+            slot = len(self._slots)
+            self._slots[p.name] = slot
+            self._slot_buf.append(buf)
+        elif self._slot_buf[slot] != buf:
+            raise TypeError("placeholder %r is used as buffer and as value"
+                            % (p.name,))
+        b = <_GraphBind *>realloc(self.binds, (self.nbinds + 1) * sizeof(_GraphBind))
+        if b == NULL:
+            raise MemoryError("VeoGraph: out of memory")
+        self.binds = b
+        b = &self.binds[self.nbinds]
+        b.op = self.nops - 1
+        b.field = field
+        b.code = code
+        b.slot = slot
+        self.nbinds += 1
+        return 0
+
+    cdef _record_call(self, VeoFunction f, tuple args):
+        cdef Py_ssize_t n0 = self.nops, b0 = self.nbinds, s0 = len(self._slots)
+        try:
+            self._record_args(f, args)
+        except BaseException:
+            self._rollback(n0, b0, s0)
+            raise
+
+    cdef _record_args(self, VeoFunction f, tuple args):
+        cdef VeoArgs a
+        cdef _GraphOp *op
+        cdef int i
+        if f._args_type is None:
+            raise RuntimeError("VeoFunction needs arguments format info before call()")
+        if len(args) != f._argc:
+            raise ValueError("invalid number of arguments, expected `{}`, got `{}`"
+                             .format(f._argc, len(args)))
+        a = VeoArgs()
+        op = self._add(_TR_CALL, f, a)
+        op.addr = f.addr
+        op.args = a.args
+        for i in range(f._argc):
+            x = args[i]
+            if isinstance(x, Placeholder):
+                # set to 0 until the placeholder is bound
+                a._set(i, f._argt[i], 0.0 if f._argt[i] == _T_DOUBLE
+                       or f._argt[i] == _T_FLOAT else 0)
+                self._bind(i, f._argt[i], <Placeholder>x, False)
+            else:
+                a._set(i, f._argt[i], x)
+
+    cdef _record_prepared(self, VeoCall c):
+        cdef _GraphOp *op = self._add(_TR_CALL, c.func, c.args)
+        op.addr = c.func.addr
+        op.args = c.args.args
+
+    cdef _record_mem(self, int kind, uint64_t addr, buf, Py_ssize_t size,
+                     addr_ph):
+        cdef Py_ssize_t n0 = self.nops, b0 = self.nbinds, s0 = len(self._slots)
+        try:
+            self._record_transfer(kind, addr, buf, size, addr_ph)
+        except BaseException:
+            self._rollback(n0, b0, s0)
+            raise
+
+    cdef _record_transfer(self, int kind, uint64_t addr, buf, Py_ssize_t size,
+                          addr_ph):
+        cdef _GraphOp *op = self._add(kind, None, None)
+        op.addr = addr
+        op.size = size
+        if addr_ph is not None:
+            self._bind(_G_ADDR, _T_ULONG, <Placeholder>addr_ph, False)
+        if isinstance(buf, Placeholder):
+            self._bind(_G_BUF, 0, <Placeholder>buf, True)
+            return
+        if not PyObject_CheckBuffer(buf):
+            raise TypeError("buffer must implement the buffer protocol!")
+        PyObject_GetBuffer(buf, &op.view, PyBUF_ANY_CONTIGUOUS |
+                           (PyBUF_WRITABLE if kind == _TR_READ else 0))
+        op.pinned = True
+        op.buf = op.view.buf
+        if op.view.len < size:
+            raise ValueError("buffer is smaller than required size (%d < %d)"
+                             % (op.view.len, size))
+
+    def replay(self, **values):
+        """
+        Submit the recorded operations with the placeholders bound to
+        values, passed by name. Returns a VeoGraphRun, which must be
+        waited for before the graph is replayed again.
+        """
+        cdef Py_ssize_t i, n = self.nops
+        cdef _GraphBind *b
+        cdef _GraphOp *op
+        cdef VeoGraphRun run
+        cdef VeoArgs a
+        cdef veo_thr_ctxt *thr_ctxt = self.ctx.thr_ctxt
+        cdef Py_ssize_t nsub = n
+        if self.capturing:
+            raise RuntimeError("VeoGraph: replay() while capturing")
+        if self._run is not None and not (<VeoGraphRun>self._run)._finished:
+            raise RuntimeError("VeoGraph: the previous replay was not waited for")
+        missing = [k for k in self._slots if k not in values]
+        if missing or len(values) != len(self._slots):
+            raise TypeError("replay: %s placeholders %s" % (
+                ("missing", missing) if missing else
+                ("unknown", [k for k in values if k not in self._slots])))
+        slotval = [None] * len(self._slots)
+        for name, slot in self._slots.items():
+            slotval[slot] = values[name]
+        run = VeoGraphRun.__new__(VeoGraphRun)
+        run._init(self)
+        for i in range(self.nbinds):
+            b = &self.binds[i]
+            op = &self.ops[b.op]
+            x = slotval[b.slot]
+            if b.field == _G_BUF:
+                op.buf = run._pin(x, op.size, op.kind == _TR_READ)
+            elif b.field == _G_ADDR:
+                op.addr = <uint64_t>getattr(x, "_ve_array", x)
+            else:
+                if isinstance(x, OnStack):
+                    raise TypeError("replay: placeholder %r can not be OnStack"
+                                    % (run._name(b.slot),))
+                a = <VeoArgs>self._args[b.op]
+                a._set(b.field, b.code, x)
+        with nogil:
+            for i in range(n):
+                op = &self.ops[i]
+                if op.kind == _TR_CALL:
+                    run.ids[i] = veo_call_async(thr_ctxt, op.addr, op.args)
+                elif op.kind == _TR_WRITE:
+                    run.ids[i] = veo_async_write_mem(thr_ctxt, op.addr, op.buf,
+                                                     op.size)
+                else:
+                    run.ids[i] = veo_async_read_mem(thr_ctxt, op.buf, op.addr,
+                                                    op.size)
+                if run.ids[i] == VEO_REQUEST_ID_INVALID:
+                    nsub = i
+                    break
+        run._submitted(nsub)
+        self._run = run
+        if nsub < n:
+            run.wait_result()
+            raise RuntimeError("replay: submission of operation %d failed" % nsub)
+        return run
+
+    def run(self, **values):
+        """
+        replay() and wait for the results.
+        """
+        return self.replay(**values).wait_result()
+
+
+cdef class VeoGraphRun(object):
+    """
+    One replay of a VeoGraph in flight.
+    """
+    cdef readonly VeoGraph graph
+    cdef uint64_t *ids
+    cdef uint64_t *res
+    cdef int *rc
+    cdef Py_ssize_t n
+    cdef Py_buffer *views
+    cdef Py_ssize_t nviews
+    cdef bint _finished
+    cdef double _t0
+
+    def __cinit__(self):
+        self.ids = NULL
+        self.res = NULL
+        self.rc = NULL
+        self.views = NULL
+
+    cdef _init(self, VeoGraph g):
+        cdef Py_ssize_t i, n = g.nops, nb = 0
+        self.graph = g
+        for i in range(g.nbinds):
+            if g.binds[i].field == _G_BUF:
+                nb += 1
+        self.ids = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+        self.res = <uint64_t *>malloc(n * sizeof(uint64_t) + 1)
+        self.rc = <int *>malloc(n * sizeof(int) + 1)
+        self.views = <Py_buffer *>malloc(nb * sizeof(Py_buffer) + 1)
+        if self.ids == NULL or self.res == NULL or self.rc == NULL \
+                or self.views == NULL:
+            raise MemoryError("VeoGraph: out of memory")
+        for i in range(n):
+            self.rc[i] = VEO_COMMAND_UNFINISHED
+
+    cdef void *_pin(self, x, size_t size, bint writable) except? NULL:
+        cdef Py_buffer *v = &self.views[self.nviews]
+        if not PyObject_CheckBuffer(x):
+            raise TypeError("replay: buffer placeholder needs an object "
+                            "with the buffer protocol")
+        PyObject_GetBuffer(x, v, PyBUF_ANY_CONTIGUOUS |
+                           (PyBUF_WRITABLE if writable else 0))
+        self.nviews += 1
+        if <size_t>v.len < size:
+            raise ValueError("replay: buffer is smaller than required size "
+                             "(%d < %d)" % (v.len, size))
+        return v.buf
+
+    cdef _name(self, int slot):
+        for name, s in self.graph._slots.items():
+            if s == slot:
+                return name
+
+    cdef _submitted(self, Py_ssize_t nsub):
+        cdef VeoGraph g = self.graph
+        cdef VeoCtxt ctx = g.ctx
+        cdef Py_ssize_t i
+        cdef _GraphOp *op
+        cdef int kind
+        self.n = nsub
+        self._t0 = _monotonic()
+        for i in range(nsub):
+            op = &g.ops[i]
+            if op.kind == _TR_CALL:
+                _count_call(<VeoFunction>g._funcs[i], ctx, True)
+            else:
+                _count_transfer(&ctx._stats, op.kind == _TR_WRITE, op.size)
+                _count_transfer(&ctx.proc._stats, op.kind == _TR_WRITE, op.size)
+            if _tracing:
+                kind = op.kind
+                _trace(kind, <uint64_t>ctx.thr_ctxt, ctx.proc.nodeid,
+                       self.ids[i], op.size if kind != _TR_CALL else 0,
+                       _trace_name((<VeoFunction>g._funcs[i]).name)
+                       if kind == _TR_CALL else -1)
+
+    def done(self):
+        """
+        Return True if all operations have finished.
+        """
+        cdef Py_ssize_t i
+        cdef veo_thr_ctxt *thr_ctxt = self.graph.ctx.thr_ctxt
+        if self._finished:
+            return True
+        for i in range(self.n):
+            if self.rc[i] == VEO_COMMAND_UNFINISHED:
+                self.rc[i] = veo_call_peek_result(thr_ctxt, self.ids[i],
+                                                  &self.res[i])
+                if self.rc[i] == VEO_COMMAND_UNFINISHED:
+                    return False
+        self._finish()
+        return True
+
+    cdef _finish(self):
+        cdef VeoGraph g = self.graph
+        cdef VeoCtxt ctx = g.ctx
+        cdef double dt = _monotonic() - self._t0
+        cdef Py_ssize_t i
+        cdef VeoFunction f
+        for i in range(self.nviews):
+            PyBuffer_Release(&self.views[i])
+        self.nviews = 0
+        self._finished = True
+        for i in range(self.n):
+            _stats_done(&ctx._stats, self.rc[i], dt)
+            _stats_done(&ctx.proc._stats, self.rc[i], dt)
+            if g._funcs[i] is not None:
+                f = <VeoFunction>g._funcs[i]
+                _stats_done(&f._stats, self.rc[i], dt)
+            if _tracing:
+                _trace(_TR_DONE, <uint64_t>ctx.thr_ctxt, ctx.proc.nodeid,
+                       self.ids[i], 0, -1)
+
+    def wait_result(self):
+        """
+        Wait for all operations. Returns the list of the results of the
+        recorded calls, errors are raised like by VeoRequest.wait_result().
+        """
+        cdef Py_ssize_t i
+        cdef veo_thr_ctxt *thr_ctxt = self.graph.ctx.thr_ctxt
+        cdef VeoFunction f
+        if not self._finished:
+            if _tracing and self.n:
+                _trace(_TR_WAIT, <uint64_t>thr_ctxt, self.graph.ctx.proc.nodeid,
+                       self.ids[self.n - 1], 0, -1)
+            with nogil:
+                for i in range(self.n):
+                    if self.rc[i] == VEO_COMMAND_UNFINISHED:
+                        self.rc[i] = veo_call_wait_result(thr_ctxt, self.ids[i],
+                                                          &self.res[i])
+            self._finish()
+        out = []
+        for i in range(self.n):
+            if self.rc[i] == VEO_COMMAND_EXCEPTION:
+                raise ArithmeticError("wait_result command exception on VE "
+                                      "(graph operation %d)" % i)
+            elif self.rc[i] == VEO_COMMAND_ERROR:
+                raise RuntimeError("wait_result command handling error "
+                                   "(graph operation %d)" % i)
+            elif self.rc[i] < 0:
+                raise RuntimeError("wait_result command exception on VH "
+                                   "(graph operation %d)" % i)
+            if self.graph._funcs[i] is not None:
+                f = <VeoFunction>self.graph._funcs[i]
+                out.append(f._result(self.res[i]))
+        return out
+
+    def __dealloc__(self):
+        cdef Py_ssize_t i
+        cdef veo_thr_ctxt *thr_ctxt
+        if not self._finished and self.graph is not None \
+                and self.graph.ctx.thr_ctxt != NULL:
+            # the pinned buffers must outlive the transfers
+            thr_ctxt = self.graph.ctx.thr_ctxt
+            with nogil:
+                for i in range(self.n):
+                    if self.rc[i] == VEO_COMMAND_UNFINISHED:
+                        veo_call_wait_result(thr_ctxt, self.ids[i], &self.res[i])
+        if self.views != NULL:
+            for i in range(self.nviews):
+                PyBuffer_Release(&self.views[i])
+        free(self.ids)
+        free(self.res)
+        free(self.rc)
+        free(self.views)
+
+    def __repr__(self):
+        return "<VeoGraphRun ops=%d%s>" % (
+            self.n, " finished" if self._finished else "")
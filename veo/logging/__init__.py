@@ -33,3 +33,9 @@ from veo.logging._vp_logging import VEO  # NOQA
 from veo.logging._vp_logging import set_stream_handler  # NOQA
 from veo.logging._vp_logging import set_file_handler  # NOQA
 from veo.logging._vp_logging import reset_handler  # NOQA
+from veo.logging._vp_trace import enable_tracing  # NOQA
+from veo.logging._vp_trace import disable_tracing  # NOQA
+from veo.logging._vp_trace import tracing  # NOQA
+from veo.logging._vp_trace import trace_events  # NOQA
+from veo.logging._vp_trace import chrome_trace  # NOQA
+from veo.logging._vp_trace import export_chrome_trace  # NOQA
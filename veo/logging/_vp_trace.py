@@ -0,0 +1,191 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Request tracing with Chrome trace event export.
+
+While tracing is enabled every call and memory transfer records the time
+of its submission, of the start of waiting for it and of its completion
+together with the function name, context, VE node and size in a
+preallocated ring buffer. When the buffer is full the oldest events are
+overwritten. The events are exported in the Chrome trace event format,
+which chrome://tracing and https://ui.perfetto.dev display as timeline
+with one lane per VE context and one per waiting host thread:
+
+    from veo.logging import enable_tracing, export_chrome_trace
+
+    enable_tracing(1 << 16)
+    ...
+    export_chrome_trace("veo-trace.json")
+
+The slices of a context span from submission to the completion seen by
+the host, a call queued behind others therefore includes its queueing
+time. While tracing is disabled the calls only test a C flag.
+"""
+import contextlib
+import json
+
+import numpy as np
+
+from veo import _veo
+
+
+TRACE_DTYPE = np.dtype([("t", np.float64), ("ctx", np.uint64),
+                        ("req", np.uint64), ("nbytes", np.uint64),
+                        ("tid", np.uint64), ("node", np.int32),
+                        ("name", np.int32), ("kind", np.int32),
+                        ("pad", np.int32)])
+
+CALL, READ, WRITE, WAIT, DONE, SYNC_READ, SYNC_WRITE, SYNC_DONE = range(1, 9)
+
+_LABELS = {READ: "read_mem", WRITE: "write_mem",
+           SYNC_READ: "read_mem (sync)", SYNC_WRITE: "write_mem (sync)"}
+
+_SYNC = (SYNC_READ, SYNC_WRITE)
+
+_buf = None
+
+
+def enable_tracing(capacity=1 << 16):
+    """ Starts recording trace events.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of events kept in the ring buffer.
+
+    """
+
+    global _buf
+    if _buf is None or len(_buf) != capacity:
+        _buf = np.zeros(capacity, dtype=TRACE_DTYPE)
+    _veo._trace_enable(_buf)
+
+
+def disable_tracing():
+    """ Stops recording, the recorded events are kept. """
+
+    _veo._trace_disable()
+
+
+@contextlib.contextmanager
+def tracing(filename=None, capacity=1 << 16):
+    """ Traces the enclosed block and writes the Chrome trace to filename. """
+
+    enable_tracing(capacity)
+    try:
+        yield
+    finally:
+        disable_tracing()
+        if filename is not None:
+            export_chrome_trace(filename)
+
+
+def trace_events():
+    """ Returns the recorded events.
+
+    Returns
+    -------
+    events : numpy.ndarray
+        Records of TRACE_DTYPE, oldest first.
+    names : list
+        Function names, indexed by the name field of the records.
+    dropped : int
+        Number of events overwritten in the ring buffer.
+
+    """
+
+    pos, names = _veo._trace_info()
+    if _buf is None:
+        return np.zeros(0, dtype=TRACE_DTYPE), names, 0
+    cap = len(_buf)
+    if pos <= cap:
+        return _buf[:pos].copy(), names, 0
+    i = pos % cap
+    return np.concatenate((_buf[i:], _buf[:i])), names, pos - cap
+
+
+def chrome_trace():
+    """ Returns the recorded events as Chrome trace event dict. """
+
+    events, names, dropped = trace_events()
+    out = []
+    if len(events) == 0:
+        return {"traceEvents": out, "displayTimeUnit": "ns"}
+    t0 = events["t"].min()
+    lanes = dict()
+    pending = dict()
+
+    def us(t):
+        return (t - t0) * 1e6
+
+    def lane(p):
+        key = (p["node"], p["ctx"])
+        if key not in lanes:
+            node = p["node"]
+            lanes[key] = len([k for k in lanes if k[0] == node]) + 1
+            if lanes[key] == 1:
+                out.append({"ph": "M", "name": "process_name", "pid": node,
+                            "args": {"name": "VE node %d" % node}})
+            name = ("sync transfers" if p["sync"] else "context %x" % p["ctx"])
+            out.append({"ph": "M", "name": "thread_name", "pid": node,
+                        "tid": lanes[key], "args": {"name": name}})
+        return lanes[key]
+
+    hosts = set()
+    for r in events.tolist():
+        t, ctx, req, nbytes, tid, node, name, kind = r[:8]
+        if kind in (SYNC_READ, SYNC_WRITE, SYNC_DONE):
+            key = (ctx, None, tid)
+        else:
+            key = (ctx, req)
+        if kind == WAIT:
+            p = pending.get(key)
+            if p is not None:
+                p["wait"] = t
+                p["waiter"] = tid
+        elif kind != DONE and kind != SYNC_DONE:
+            label = names[name] if kind == CALL else _LABELS[kind]
+            pending[key] = {"t": t, "node": node, "ctx": ctx, "req": req,
+                            "nbytes": nbytes, "label": label,
+                            "sync": kind in _SYNC,
+                            "wait": None, "waiter": tid}
+        else:
+            p = pending.pop(key, None)
+            if p is None:
+                continue    # submission was overwritten
+            args = {"req": p["req"]}
+            if p["nbytes"]:
+                args["bytes"] = p["nbytes"]
+            if p["wait"] is not None:
+                args["wait_us"] = us(t) - us(p["wait"])
+                hosts.add(p["waiter"])
+                out.append({"ph": "X", "name": "wait " + p["label"],
+                            "ts": us(p["wait"]), "dur": us(t) - us(p["wait"]),
+                            "pid": -1, "tid": p["waiter"], "args": args})
+            out.append({"ph": "X", "name": p["label"], "ts": us(p["t"]),
+                        "dur": us(t) - us(p["t"]), "pid": p["node"],
+                        "tid": lane(p), "args": args})
+    for p in pending.values():
+        out.append({"ph": "i", "s": "t", "name": p["label"] + " (unfinished)",
+                    "ts": us(p["t"]), "pid": p["node"],
+                    "tid": lane(p), "args": {"req": p["req"]}})
+    if hosts:
+        out.append({"ph": "M", "name": "process_name", "pid": -1,
+                    "args": {"name": "host"}})
+    return {"traceEvents": out, "displayTimeUnit": "ns",
+            "otherData": {"dropped_events": dropped}}
+
+
+def export_chrome_trace(filename):
+    """ Writes the recorded events as Chrome trace JSON file. """
+
+    with open(filename, "w") as f:
+        json.dump(chrome_trace(), f)
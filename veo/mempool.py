@@ -0,0 +1,172 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Caching allocator for VE memory.
+
+Every veo_alloc_mem() and veo_free_mem() is a round trip to the VE. A
+VeoMemPool keeps freed buffers in bins of size classes and hands them out
+again for allocations of the same size class, the VE is only involved
+when a bin is empty. The size classes are the powers of two and three
+intermediate steps, the rounding therefore wastes less than 25% of an
+allocation.
+
+The pool of a VeoProc is enabled with
+
+    pool = proc.enable_mem_pool(max_cached=1 << 30)
+
+afterwards proc.alloc_mem() and proc.free_mem() go through the pool.
+The cached bytes are bounded by the high-water mark max_cached, the
+least recently freed buffers are released first. When the VE is out of
+memory the whole cache is released and the allocation is retried.
+"""
+import collections
+import threading
+import weakref
+
+
+MIN_BLOCK = 256
+DEFAULT_MAX_CACHED = 1 << 30
+
+
+def size_class(size):
+    """
+    Round size up to its size class: a multiple of MIN_BLOCK below
+    4*MIN_BLOCK, above that one of 4, 5, 6 or 7 times a power of two.
+    """
+    if size <= 4 * MIN_BLOCK:
+        return max(1, (size + MIN_BLOCK - 1) // MIN_BLOCK) * MIN_BLOCK
+    step = 1 << (size.bit_length() - 3)
+    return (size + step - 1) & ~(step - 1)
+
+
+class VeoMemPool(object):
+    """
+    Per VeoProc caching allocator of VE memory.
+    """
+    def __init__(self, proc, max_cached=DEFAULT_MAX_CACHED):
+        # the VeoProc owns the pool, avoid a reference cycle
+        self._proc = weakref.ref(proc)
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        # size class -> list of free addresses
+        self._bins = collections.defaultdict(list)
+        # free blocks in the order they were freed, addr -> size class
+        self._lru = collections.OrderedDict()
+        # addr -> size class of the blocks handed out
+        self._used = dict()
+        self.hits = 0
+        self.misses = 0
+        self.trims = 0
+        self.bytes_cached = 0
+        self.bytes_in_use = 0
+
+    @property
+    def proc(self):
+        return self._proc()
+
+    def alloc(self, size):
+        """
+        Allocate at least size bytes on the VE, from the cache if possible.
+        """
+        sc = size_class(size)
+        with self._lock:
+            b = self._bins.get(sc)
+            if b:
+                addr = b.pop()
+                del self._lru[addr]
+                self.bytes_cached -= sc
+                self.hits += 1
+                self._used[addr] = sc
+                self.bytes_in_use += sc
+                return addr
+            self.misses += 1
+        try:
+            addr = self.proc._alloc_mem(sc)
+        except MemoryError:
+            # memory pressure: give the cached blocks back and retry
+            self.trim()
+            addr = self.proc._alloc_mem(sc)
+        with self._lock:
+            self._used[addr] = sc
+            self.bytes_in_use += sc
+        return addr
+
+    def free(self, addr):
+        """
+        Return a block to the cache. Addresses that were not allocated by
+        the pool are freed on the VE.
+        """
+        with self._lock:
+            sc = self._used.pop(addr, None)
+            if sc is not None:
+                self.bytes_in_use -= sc
+                self._bins[sc].append(addr)
+                self._lru[addr] = sc
+                self.bytes_cached += sc
+                release = self._evict(self.max_cached)
+        if sc is None:
+            self.proc._free_mem(addr)
+            return
+        for a in release:
+            self.proc._free_mem(a)
+
+    def _evict(self, limit):
+        # called with the lock held, returns the addresses to be freed
+        release = []
+        while self.bytes_cached > limit and self._lru:
+            a, sc = self._lru.popitem(last=False)
+            self._bins[sc].remove(a)
+            self.bytes_cached -= sc
+            release.append(a)
+        if release:
+            self.trims += 1
+        return release
+
+    def trim(self, max_cached=0):
+        """
+        Release cached blocks on the VE until at most max_cached bytes
+        remain cached. Returns the number of bytes released.
+        """
+        with self._lock:
+            before = self.bytes_cached
+            release = self._evict(max_cached)
+            released = before - self.bytes_cached
+        for a in release:
+            self.proc._free_mem(a)
+        return released
+
+    def discard(self):
+        """
+        Forget all blocks without freeing them, used when the VE process
+        is destroyed.
+        """
+        with self._lock:
+            self._bins.clear()
+            self._lru.clear()
+            self._used.clear()
+            self.bytes_cached = 0
+            self.bytes_in_use = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "trims": self.trims,
+                    "bytes_cached": self.bytes_cached,
+                    "bytes_in_use": self.bytes_in_use,
+                    "blocks_cached": len(self._lru),
+                    "blocks_in_use": len(self._used),
+                    "max_cached": self.max_cached}
+
+    def __repr__(self):
+        return ("<VeoMemPool nodeid=%d cached=%d in_use=%d hits=%d misses=%d>"
+                % (self.proc.nodeid, self.bytes_cached, self.bytes_in_use,
+                   self.hits, self.misses))
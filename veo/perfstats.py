@@ -0,0 +1,170 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Performance counters and latency histograms.
+
+Every VeoFunction, VeoCtxt and VeoProc counts in a C struct, always on,
+the calls, errors, transfers and transferred bytes, a VeoProc also the
+VE memory allocations and the bytes allocated. The latency of requests,
+from submission to the completion seen by the host, is kept in a
+log-linear histogram with 8 buckets per power of two (at most 12.5%
+relative error). stats() returns a snapshot dict, reset_stats() clears
+the counters:
+
+    s = lib.func.stats()
+    print(s["calls"], percentile(s, 99))
+    print(collect(proc))
+    open("veo.prom", "w").write(prometheus_text([proc]))
+"""
+import numpy as np
+
+
+HIST_SUB_BITS = 3
+HIST_BUCKETS = 320
+
+
+def _lower_ns(idx):
+    sub = 1 << HIST_SUB_BITS
+    idx = np.asarray(idx, dtype=np.int64)
+    m = idx >> HIST_SUB_BITS
+    lower = (sub + (idx & (sub - 1))) << np.maximum(m - 1, 0)
+    return np.where(idx < sub, idx, lower)
+
+
+def bucket_bounds():
+    """
+    Lower and upper bounds in seconds of the latency histogram buckets.
+    """
+    idx = np.arange(HIST_BUCKETS + 1)
+    b = _lower_ns(idx) * 1e-9
+    return b[:-1], b[1:]
+
+
+def percentile(snap, q):
+    """
+    Latency percentile q (0..100) in seconds of a stats() snapshot, the
+    upper bound of the bucket containing it. None without requests.
+    """
+    hist = snap["latency_hist"]
+    n = int(hist.sum())
+    if n == 0:
+        return None
+    k = np.searchsorted(np.cumsum(hist), max(1, int(np.ceil(q / 100.0 * n))))
+    return min(float(bucket_bounds()[1][k]), snap["latency_max"])
+
+
+def summary(snap):
+    """
+    Counters of a snapshot with mean, p50, p90, p99 and max latency in
+    seconds instead of the histogram.
+    """
+    res = dict((k, v) for k, v in snap.items() if not k.startswith("latency"))
+    n = snap["latency_count"]
+    res["latency_mean"] = snap["latency_sum"] / n if n else None
+    for q in (50, 90, 99):
+        res["latency_p%d" % q] = percentile(snap, q)
+    res["latency_max"] = snap["latency_max"] if n else None
+    return res
+
+
+def _functions(proc):
+    for lib in list(proc.lib.values()):
+        for name, f in list(lib.func.items()):
+            yield name.decode() if isinstance(name, bytes) else name, f
+
+
+def collect(proc):
+    """
+    Snapshots of proc, its contexts and the functions found in its
+    libraries.
+    """
+    return {"proc": proc.stats(),
+            "contexts": [c.stats() for c in proc.context],
+            "functions": dict((n, f.stats()) for n, f in _functions(proc))}
+
+
+def reset(proc):
+    """
+    Reset the counters of proc, its contexts and functions.
+    """
+    proc.reset_stats()
+    for c in proc.context:
+        c.reset_stats()
+    for n, f in _functions(proc):
+        f.reset_stats()
+
+
+_COUNTERS = (("calls", "calls_total", "Calls submitted"),
+             ("errors", "errors_total", "Failed calls and requests"),
+             ("reads", "reads_total", "Transfers from the VE"),
+             ("writes", "writes_total", "Transfers to the VE"),
+             ("bytes_read", "read_bytes_total", "Bytes read from the VE"),
+             ("bytes_written", "written_bytes_total", "Bytes written to the VE"))
+
+# histogram bounds exported to Prometheus: powers of two from ~1us to ~17s
+_PROM_EXP = range(10, 35)
+
+
+def _labels(d):
+    return ",".join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                    for k, v in d.items())
+
+
+def prometheus_text(procs, prefix="veo"):
+    """
+    Counters and latency histograms of the VeoProcs procs, their contexts
+    and functions in the Prometheus text exposition format.
+    """
+    scopes = []
+    for p in procs:
+        node = {"node": p.nodeid}
+        scopes.append(("proc", node, p.stats()))
+        for i, c in enumerate(p.context):
+            scopes.append(("context", dict(node, context=i), c.stats()))
+        for n, f in _functions(p):
+            scopes.append(("function", dict(node, function=n), f.stats()))
+    out = []
+    for scope in ("proc", "context", "function"):
+        items = [(lab, s) for sc, lab, s in scopes if sc == scope]
+        if not items:
+            continue
+        for key, name, help in _COUNTERS:
+            metric = "%s_%s_%s" % (prefix, scope, name)
+            out.append("# HELP %s %s" % (metric, help))
+            out.append("# TYPE %s counter" % metric)
+            for lab, s in items:
+                out.append("%s{%s} %d" % (metric, _labels(lab), s[key]))
+        if scope == "proc":
+            for key, name, typ, help in (
+                    ("allocs", "allocs_total", "counter", "VE memory allocations"),
+                    ("frees", "frees_total", "counter", "VE memory frees"),
+                    ("bytes_allocated", "allocated_bytes", "gauge",
+                     "VE memory allocated and not freed")):
+                metric = "%s_proc_%s" % (prefix, name)
+                out.append("# HELP %s %s" % (metric, help))
+                out.append("# TYPE %s %s" % (metric, typ))
+                for lab, s in items:
+                    out.append("%s{%s} %d" % (metric, _labels(lab), s[key]))
+        metric = "%s_%s_latency_seconds" % (prefix, scope)
+        out.append("# HELP %s Latency from submission to completion" % metric)
+        out.append("# TYPE %s histogram" % metric)
+        for lab, s in items:
+            cum = np.cumsum(s["latency_hist"])
+            for e in _PROM_EXP:
+                # 2**e ns is the lower bound of bucket (e - 2) * 8
+                n = int(cum[(e - HIST_SUB_BITS + 1 << HIST_SUB_BITS) - 1])
+                out.append('%s_bucket{%s,le="%.9g"} %d'
+                           % (metric, _labels(lab), 2 ** e * 1e-9, n))
+            out.append('%s_bucket{%s,le="+Inf"} %d'
+                       % (metric, _labels(lab), s["latency_count"]))
+            out.append("%s_sum{%s} %.9g" % (metric, _labels(lab), s["latency_sum"]))
+            out.append("%s_count{%s} %d" % (metric, _labels(lab), s["latency_count"]))
+    return "\n".join(out) + "\n"
@@ -0,0 +1,340 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Pool of warm VeoProcs.
+
+Creating a VeoProc starts veorun on the VE, then libraries are loaded
+and functions resolved, each step a round trip to the VE. A VeoProcPool
+does this for all VE processes of a host concurrently, one thread per
+process (veo_proc_create() and veo_load_library() release the GIL), and
+keeps the processes alive for reuse:
+
+    pool = VeoProcPool([0, 1, 2, 3], libs=["./libkern.so"],
+                       funcs={"axpy": (("double", "void *", "void *",
+                                        "long"), "long")}, nctx=2)
+    print(pool.report())
+    with pool.acquire() as wp:
+        wp.funcs["axpy"](wp.contexts[0], 2.0, x, y, n).wait_result()
+
+The time of every startup stage is recorded per process in
+WarmProc.times. A process released with discard=True is destroyed and
+replaced in the background, so that the pool stays warm.
+"""
+import collections
+import concurrent.futures
+import threading
+import time
+
+from veo._veo import VeoProc
+
+
+STAGES = ("create", "load", "resolve", "contexts", "init")
+
+
+class WarmProc(object):
+    """
+    A VeoProc of a VeoProcPool with its preloaded libraries (libs, in the
+    order given to the pool), resolved functions (funcs, name ->
+    VeoFunction) and opened contexts. times maps the startup stages to
+    seconds, "create" includes the proc init hooks. Used as context
+    manager it is released to its pool on exit.
+    """
+    def __init__(self, pool, nodeid):
+        self.pool = pool
+        self.nodeid = nodeid
+        self.proc = None
+        self.libs = []
+        self.funcs = dict()
+        self.contexts = []
+        self.times = collections.OrderedDict()
+
+    def _start(self, libs, funcs, nctx, veorun_bin, init):
+        t0 = t = time.perf_counter()
+
+        def stage(name):
+            nonlocal t
+            now = time.perf_counter()
+            self.times[name] = now - t
+            t = now
+
+        self.proc = VeoProc(self.nodeid, veorun_bin)
+        stage("create")
+        for path in libs:
+            self.libs.append(self.proc.load_library(path))
+        stage("load")
+        for name, sig in funcs.items():
+            self.funcs[name] = self._resolve(name, sig)
+        stage("resolve")
+        for i in range(nctx):
+            self.contexts.append(self.proc.open_context())
+        stage("contexts")
+        if init is not None:
+            init(self)
+        stage("init")
+        self.times["total"] = t - t0
+        return self
+
+    def _resolve(self, name, sig):
+        for lib in self.libs:
+            try:
+                f = lib.find_function(name)
+                break
+            except RuntimeError:
+                continue
+        else:
+            raise RuntimeError("VeoProcPool: function %s not found in %r"
+                               % (name, [lib.name for lib in self.libs]))
+        if sig is not None:
+            args, ret = sig
+            f.args_type(*args)
+            f.ret_type(ret)
+        return f
+
+    def destroy(self):
+        proc, self.proc = self.proc, None
+        self.funcs = dict()
+        self.libs = []
+        self.contexts = []
+        if proc is not None:
+            # close the contexts while their process still exists
+            for c in proc.context:
+                c.context_close()
+            del proc.context[:]
+            proc.proc_destroy()
+
+    def release(self, discard=False):
+        self.pool.release(self, discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.release()
+
+    def __repr__(self):
+        return "<WarmProc nodeid=%d contexts=%d funcs=%d>" % (
+            self.nodeid, len(self.contexts), len(self.funcs))
+
+
+class VeoProcPool(object):
+    """
+    Warm VeoProcs on the VE nodes nodeids, per_node processes each.
+
+    libs are loaded into every process, funcs maps function names to
+    their signature, a tuple (args_type, ret_type), or None; they are
+    looked up in the libraries in order. nctx contexts are opened per
+    process and init(warm_proc) is called last for further setup. With
+    veorun_bin the processes are created with veo_proc_create_static().
+    """
+    def __init__(self, nodeids, libs=(), funcs=None, nctx=1, per_node=1,
+                 veorun_bin=None, init=None, start=True):
+        if isinstance(nodeids, int):
+            nodeids = [nodeids]
+        self.nodeids = list(nodeids)
+        self.libs = list(libs)
+        if funcs is None:
+            funcs = dict()
+        elif not isinstance(funcs, dict):
+            funcs = dict((name, None) for name in funcs)
+        self.funcs = funcs
+        self.nctx = nctx
+        self.per_node = per_node
+        self.veorun_bin = veorun_bin
+        self.init = init
+        # (nodeid, exception) of failed process starts
+        self.failed = []
+        self.startup_time = None
+        self._cond = threading.Condition()
+        self._free = collections.deque()
+        self._busy = set()
+        # nodeid -> number of processes being started
+        self._starting = collections.Counter()
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(self.nodeids) * per_node),
+            thread_name_prefix="veo-procpool")
+        if start:
+            self.start()
+
+    def _spawn(self, nodeid):
+        wp = WarmProc(self, nodeid)
+        try:
+            wp._start(self.libs, self.funcs, self.nctx, self.veorun_bin,
+                      self.init)
+        except BaseException as e:
+            try:
+                wp.destroy()
+            except Exception:
+                pass
+            with self._cond:
+                self._starting[nodeid] -= 1
+                self.failed.append((nodeid, e))
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._starting[nodeid] -= 1
+            if self._closed:
+                wp.destroy()
+            else:
+                self._free.append(wp)
+            self._cond.notify_all()
+        return wp
+
+    def _submit(self, nodeid):
+        with self._cond:
+            self._starting[nodeid] += 1
+        return self._executor.submit(self._spawn, nodeid)
+
+    def start(self):
+        """
+        Start the processes of all nodes concurrently and wait for them.
+        Failures are collected in failed, RuntimeError is raised when no
+        process could be started.
+        """
+        t0 = time.perf_counter()
+        futs = [self._submit(n) for n in self.nodeids
+                for i in range(self.per_node)]
+        concurrent.futures.wait(futs)
+        self.startup_time = time.perf_counter() - t0
+        if futs and all(f.exception() is not None for f in futs):
+            raise RuntimeError("VeoProcPool: no VE process started: %s"
+                               % "; ".join("node %d: %s" % (n, e)
+                                           for n, e in self.failed))
+        return self
+
+    def _matches(self, nodeid, wp):
+        return nodeid is None or wp.nodeid == nodeid
+
+    def _pending(self, nodeid):
+        # called with the lock held: a process of nodeid may become free
+        if any(self._matches(nodeid, wp) for wp in self._busy):
+            return True
+        if nodeid is None:
+            return sum(self._starting.values()) > 0
+        return self._starting[nodeid] > 0
+
+    def acquire(self, nodeid=None, timeout=None):
+        """
+        Take a warm process, from node nodeid if given, waiting up to
+        timeout seconds for one to become free. RuntimeError is raised
+        when the pool is closed or no process of the node is left.
+        """
+        where = "" if nodeid is None else " on node %d" % nodeid
+
+        def free():
+            for wp in self._free:
+                if self._matches(nodeid, wp):
+                    return wp
+            return None
+
+        def ready():
+            return (self._closed or free() is not None
+                    or not self._pending(nodeid))
+
+        with self._cond:
+            if not self._cond.wait_for(ready, timeout):
+                raise TimeoutError("VeoProcPool: no free process%s" % where)
+            if self._closed:
+                raise RuntimeError("VeoProcPool is closed")
+            wp = free()
+            if wp is None:
+                failed = ["node %d: %s" % (n, e) for n, e in self.failed
+                          if nodeid is None or n == nodeid]
+                raise RuntimeError("VeoProcPool: no process%s%s" % (
+                    where, ", failed: " + "; ".join(failed) if failed else ""))
+            self._free.remove(wp)
+            self._busy.add(wp)
+            return wp
+
+    def release(self, wp, discard=False):
+        """
+        Return wp to the pool. With discard the process is destroyed and
+        a new one is started in the background.
+        """
+        with self._cond:
+            self._busy.remove(wp)
+            if not discard and not self._closed:
+                self._free.append(wp)
+                self._cond.notify_all()
+                return
+            # counted as starting, waiters for the node keep waiting
+            respawn = not self._closed
+            if respawn:
+                self._starting[wp.nodeid] += 1
+            self._cond.notify_all()
+        wp.destroy()
+        if respawn:
+            with self._cond:
+                # close() shuts the executor down once _closed is set
+                if not self._closed:
+                    self._executor.submit(self._spawn, wp.nodeid)
+                    return
+                self._starting[wp.nodeid] -= 1
+                self._cond.notify_all()
+
+    def timings(self):
+        """
+        Startup stage times of the processes: a list of dicts with nodeid
+        and the seconds per stage.
+        """
+        with self._cond:
+            procs = list(self._free) + list(self._busy)
+        res = []
+        for wp in sorted(procs, key=lambda w: w.nodeid):
+            d = dict(nodeid=wp.nodeid)
+            d.update(wp.times)
+            res.append(d)
+        return res
+
+    def report(self):
+        """
+        Table of the startup stage times in ms per process.
+        """
+        cols = STAGES + ("total",)
+        lines = ["node " + "".join("%10s" % c for c in cols)]
+        for d in self.timings():
+            lines.append("%4d " % d["nodeid"] + "".join(
+                "%10.1f" % (d.get(c, 0.0) * 1e3) for c in cols))
+        if self.startup_time is not None:
+            lines.append("pool startup %.1f ms" % (self.startup_time * 1e3))
+        for n, e in self.failed:
+            lines.append("node %d failed: %s" % (n, e))
+        return "\n".join(lines)
+
+    def close(self):
+        """
+        Destroy the free processes and those released later. Processes
+        still acquired are destroyed when they are released.
+        """
+        with self._cond:
+            self._closed = True
+            free = list(self._free)
+            self._free.clear()
+            self._cond.notify_all()
+        for wp in free:
+            wp.destroy()
+        self._executor.shutdown(wait=True)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._free) + len(self._busy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        with self._cond:
+            return "<VeoProcPool nodes=%r free=%d busy=%d starting=%d>" % (
+                self.nodeids, len(self._free), len(self._busy),
+                sum(self._starting.values()))
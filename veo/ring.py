@@ -0,0 +1,297 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Low latency calls through a ring of command slots in VEO_HMEM memory.
+
+A persistent VE kernel, veo_ring_worker() from veo_ring.c, polls a ring
+of slots allocated with veo_alloc_hmem(). The host posts calls by
+writing the function address and arguments into the next slot and polls
+the slot for the result, both with veo_hmemcpy() on the hmem address;
+the VEO command queue and its request ids are not involved:
+
+    ch = RingChannel.create(proc, nslots=64)
+    ch.start(ctx)                    # occupies ctx until stop()
+    res = ch.call(lib.f, 1, 2)
+    ch.stop()
+
+The protocol is described in veo_ring.c. The host side is one producer,
+calls are serialized by a lock; tickets can be waited for in any order.
+Functions take up to 8 integer or pointer arguments, like those of the
+dispatcher (veo.dispatch).
+
+VEO_HMEM memory is VE memory, the VH can't dereference it: libveo does
+not map VE memory into the host address space, the hmem address only
+selects the process for veo_hmemcpy(). Every post (record, then
+sequence word) and every poll therefore is a veo_hmemcpy(), i.e. a
+small DMA. This is still far cheaper than a veo_call_async() round trip
+through the command queue and the VE worker thread of the context,
+examples/bench-ring.py reports both, and the cost of one hmemcpy.
+
+The ring can live in any host memory: RingChannel.local() creates one in
+a numpy array and HostRingWorker serves it from a host thread, for
+testing the protocol without a VE.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from veo._veo import VEO_HMEM, _dispatch_pack_into, _dispatch_result
+
+
+RING_MAGIC = 0x7665_6f72_696e_6731   # "veoring1"
+RING_HDR = 16
+RING_SLOT = 16
+# words of a slot: sequence, then a dispatcher record
+_SEQ, _FUNC, _ARGC, _ARGS, _RES = 0, 1, 2, 3, 11
+
+
+def ring_words(nslots):
+    return RING_HDR + nslots * RING_SLOT
+
+
+class RingChannel(object):
+    """
+    Host side of a ring of nslots command slots in the uint64 array mem.
+    For a ring in VEO_HMEM memory mem is the host copy of the ring, slots
+    are copied to and from the hmem address hmem with veo_hmemcpy().
+    """
+    def __init__(self, mem, nslots):
+        if len(mem) < ring_words(nslots):
+            raise ValueError("ring memory too small for %d slots" % nslots)
+        self.mem = mem
+        self.nslots = nslots
+        self.proc = None
+        self.hmem = 0
+        self.ve_addr = 0
+        self.request = None
+        mem[:ring_words(nslots)] = 0
+        mem[0] = RING_MAGIC
+        mem[1] = nslots
+        self._lock = threading.Lock()
+        self._next = 1
+        # ticket -> function, for converting the result
+        self._func = dict()
+        # results of tickets whose slot was reused before they were waited for
+        self._done = dict()
+
+    @classmethod
+    def local(cls, nslots=64):
+        """
+        Ring in a host numpy array, served by a HostRingWorker.
+        """
+        return cls(np.zeros(ring_words(nslots), dtype=np.uint64), nslots)
+
+    @classmethod
+    def create(cls, proc, nslots=64):
+        """
+        Ring in VEO_HMEM memory of proc, served by veo_ring_worker() on
+        the VE.
+        """
+        nwords = ring_words(nslots)
+        ch = cls(np.zeros(nwords, dtype=np.uint64), nslots)
+        hmem = proc.alloc_hmem(nwords * 8)
+        try:
+            VEO_HMEM.hmemcpy(hmem, ch.mem.ctypes.data, nwords * 8)
+        except Exception:
+            proc.free_hmem(hmem)
+            raise
+        ch.proc = proc
+        ch.hmem = hmem
+        # the address the worker uses on the VE
+        ch.ve_addr = VEO_HMEM.get_hmem_addr(hmem)
+        return ch
+
+    def _slot(self, t):
+        off = RING_HDR + ((t - 1) % self.nslots) * RING_SLOT
+        return off
+
+    def _publish(self, off, seq):
+        """
+        Set the sequence word of the slot at off after its record, the
+        worker reads the record once it sees the sequence.
+        """
+        mem = self.mem
+        mem[off + _SEQ] = seq
+        if self.hmem:
+            base = mem.ctypes.data
+            VEO_HMEM.hmemcpy(self.hmem + (off + _FUNC) * 8,
+                             base + (off + _FUNC) * 8,
+                             (RING_SLOT - _FUNC) * 8)
+            VEO_HMEM.hmemcpy(self.hmem + off * 8, base + off * 8, 8)
+
+    def _fetch(self, off):
+        """
+        Words of the slot at off up to the result, a copy read from the
+        VE for a ring in VEO_HMEM memory.
+        """
+        if not self.hmem:
+            return self.mem[off:off + _RES + 1]
+        w = np.empty(_RES + 1, dtype=np.uint64)
+        VEO_HMEM.hmemcpy(w.ctypes.data, self.hmem + off * 8, (_RES + 1) * 8)
+        return w
+
+    def submit(self, func, *args):
+        """
+        Post a call of func, a VeoFunction or for a HostRingWorker any
+        integer function id, and return its ticket.
+        """
+        with self._lock:
+            t = self._next
+            off = self._slot(t)
+            mem = self.mem
+            prev = t - self.nslots
+            if prev > 0:
+                # the slot is free when the worker finished its last ticket
+                w = self._spin(off, 2 * prev, None)
+                if prev in self._func:
+                    self._done[prev] = self._convert(prev, int(w[_RES]))
+            if isinstance(func, int):
+                if len(args) > 8:
+                    raise TypeError("ring calls take at most 8 arguments")
+                mem[off + _FUNC] = func
+                mem[off + _ARGC] = len(args)
+                mem[off + _ARGS:off + _RES + 1] = 0
+                for i, a in enumerate(args):
+                    mem[off + _ARGS + i] = a & 0xffffffffffffffff
+            else:
+                _dispatch_pack_into(func, args, mem, off + _FUNC)
+            self._func[t] = func
+            self._next = t + 1
+            # publish: the sequence word is written last
+            self._publish(off, 2 * t - 1)
+            return t
+
+    def _convert(self, t, raw):
+        func = self._func.pop(t)
+        if isinstance(func, int):
+            return raw
+        return _dispatch_result(func, raw)
+
+    def _spin(self, off, seq, timeout):
+        # returns the slot words once the sequence reached seq
+        w = self._fetch(off)
+        if w[_SEQ] >= seq:
+            return w
+        tmax = None if timeout is None else time.monotonic() + timeout
+        spins = 0
+        while True:
+            w = self._fetch(off)
+            if w[_SEQ] >= seq:
+                return w
+            spins += 1
+            if spins > 20:
+                # back off, the worker needs the CPU on small hosts
+                os.sched_yield()
+                if tmax is not None and time.monotonic() > tmax:
+                    raise TimeoutError("ring call did not finish in time")
+
+    def wait(self, t, timeout=None):
+        """
+        Wait for ticket t and return its result.
+        """
+        if t in self._done:
+            return self._done.pop(t)
+        if t not in self._func:
+            raise KeyError("unknown or already collected ticket %d" % t)
+        w = self._spin(self._slot(t), 2 * t, timeout)
+        with self._lock:
+            if t in self._done:
+                return self._done.pop(t)
+            return self._convert(t, int(w[_RES]))
+
+    def call(self, func, *args):
+        return self.wait(self.submit(func, *args))
+
+    def start(self, ctx, worker=None, **kwargs):
+        """
+        Start veo_ring_worker() in the context ctx. worker can be the
+        VeoFunction of a worker linked into a static veorun, otherwise it
+        is built like the dispatcher; kwargs (compiler, flags, cache) are
+        passed to veo.dispatch.build_src().
+        """
+        if worker is None:
+            from veo.dispatch import build_src
+            lib = ctx.proc.load_library(build_src("veo_ring", **kwargs))
+            worker = lib.find_function("veo_ring_worker")
+        worker.args_type("void *")
+        worker.ret_type("long")
+        self.request = worker(ctx, self.ve_addr)
+        return self.request
+
+    def stop(self):
+        """
+        Stop the worker. Returns the number of calls it served.
+        """
+        t = self.submit(0)
+        self._spin(self._slot(t), 2 * t, None)
+        with self._lock:
+            self._func.pop(t, None)
+        if self.request is not None:
+            res = self.request.wait_result()
+            self.request = None
+            return res
+        return t - 1
+
+    def close(self):
+        if self.hmem and self.proc is not None:
+            self.mem = None
+            self.proc.free_hmem(self.hmem)
+            self.hmem = 0
+            self.ve_addr = 0
+
+
+class HostRingWorker(object):
+    """
+    Host thread standing in for veo_ring_worker(): serves the ring of
+    channel with the Python callables of funcs, a dict mapping integer
+    function ids to callables. Arguments and results are unsigned 64 bit
+    integers, exceptions are collected in errors and return -1.
+    """
+    def __init__(self, channel, funcs):
+        self.channel = channel
+        self.funcs = funcs
+        self.served = 0
+        self.errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="veo-ring-worker")
+        self._thread.start()
+
+    def _run(self):
+        mem = self.channel.mem
+        n = int(mem[1])
+        t = 1
+        while True:
+            off = RING_HDR + ((t - 1) % n) * RING_SLOT
+            spins = 0
+            while mem[off + _SEQ] != 2 * t - 1:
+                spins += 1
+                if spins > 20:
+                    os.sched_yield()
+            fid = int(mem[off + _FUNC])
+            if fid == 0:
+                mem[off + _SEQ] = 2 * t
+                return
+            argc = int(mem[off + _ARGC])
+            args = [int(x) for x in mem[off + _ARGS:off + _ARGS + argc]]
+            try:
+                res = self.funcs[fid](*args)
+            except Exception as e:
+                self.errors.append((t, e))
+                res = -1
+            mem[off + _RES] = res & 0xffffffffffffffff
+            self.served += 1
+            mem[off + _SEQ] = 2 * t
+            t += 1
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
@@ -0,0 +1,294 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Executor placing VE calls on several VeoProcs and contexts.
+
+A VeoScheduler owns the contexts of several VE processes, typically one
+per VE card, and accepts calls by function name. Each call goes to the
+context with the fewest calls in flight:
+
+    with VeoScheduler([0, 1], nctx=2, libs=["./libkern.so"],
+                      funcs={"work": (("long",), "long")}) as sched:
+        futs = [sched.submit("work", i) for i in range(100)]
+        results = [f.result() for f in futs]
+
+The scheduler is a concurrent.futures.Executor, submit() returns a
+Future and map() works as for thread pools. Calls with VeArray arguments
+are placed on the VeoProc holding the arrays (data affinity), affinity=
+pins a call to a VeoProc, VeArray or node id. Contexts whose VE thread
+is no longer running (veo_get_context_state) are skipped.
+
+Every context has a collector thread waiting for its requests in order,
+which resolves the futures and updates the load counts.
+"""
+import collections
+import concurrent.futures
+import itertools
+import threading
+
+from veo._veo import VeoProc, VeoFunction, _veo_context_state
+from veo.procpool import WarmProc
+from veo.vearray import VeArray
+
+
+class _Slot(object):
+    """
+    A context of the scheduler and its queue of requests in flight.
+    """
+    def __init__(self, sched, wp, ctx):
+        self.sched = sched
+        self.wp = wp
+        self.proc = wp.proc
+        self.ctx = ctx
+        self.inflight = 0
+        self.submitted = 0
+        self.alive = True
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, daemon=True,
+            name="veo-sched-%d-%x" % (wp.nodeid, id(ctx)))
+        self._thread.start()
+
+    def push(self, req, fut):
+        with self._cond:
+            self._queue.append((req, fut))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                req, fut = self._queue[0]
+            try:
+                res = req.wait_result()
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(res)
+            with self._cond:
+                self._queue.popleft()
+            self.sched._done(self)
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
+
+
+class VeoScheduler(concurrent.futures.Executor):
+    """
+    Executor over the VE processes procs: node ids, VeoProcs or WarmProcs
+    of a VeoProcPool. Processes created from node ids are destroyed by
+    shutdown(). nctx contexts are opened in processes without contexts,
+    libs are loaded into each of them, funcs maps function names to
+    (args_type, ret_type) or None. With check_state the state of a
+    context is checked with veo_get_context_state() before submitting.
+    """
+    def __init__(self, procs, nctx=2, libs=(), funcs=None, check_state=True):
+        if isinstance(procs, int):
+            procs = [procs]
+        self.check_state = check_state
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._idle = threading.Condition(self._lock)
+        self._inflight = 0
+        self._rr = itertools.count()
+        self._own = []
+        self._wps = []
+        for p in procs:
+            if isinstance(p, WarmProc):
+                wp = p
+            else:
+                if not isinstance(p, VeoProc):
+                    p = VeoProc(p)
+                    self._own.append(p)
+                wp = WarmProc(None, p.nodeid)
+                wp.proc = p
+                wp.contexts = list(p.context)
+            for path in libs:
+                wp.libs.append(wp.proc.load_library(path))
+            for name, sig in (funcs or dict()).items():
+                wp.funcs[name] = wp._resolve(name, sig)
+            if not wp.contexts:
+                wp.contexts = [wp.proc.open_context() for i in range(nctx)]
+            self._wps.append(wp)
+        self._slots = [_Slot(self, wp, ctx) for wp in self._wps
+                       for ctx in wp.contexts]
+        if not self._slots:
+            raise ValueError("VeoScheduler needs at least one context")
+
+    @property
+    def procs(self):
+        return [wp.proc for wp in self._wps]
+
+    def function(self, name, proc):
+        """
+        Return the VeoFunction name in proc, looked up in the libraries
+        loaded into proc if it wasn't declared in funcs.
+        """
+        for wp in self._wps:
+            if wp.proc is proc:
+                break
+        else:
+            raise ValueError("VeoScheduler: unknown VeoProc %r" % proc)
+        f = wp.funcs.get(name)
+        if f is None:
+            for lib in itertools.chain(wp.libs, proc.lib.values()):
+                try:
+                    f = lib.find_function(name)
+                    break
+                except RuntimeError:
+                    continue
+            else:
+                raise RuntimeError("VeoScheduler: function %s not found" % name)
+            wp.funcs[name] = f
+        return f
+
+    def _affinity(self, args, affinity):
+        """
+        The VeoProcs a call may run on, an empty set for any.
+        """
+        procs = None
+        for a in args:
+            if isinstance(a, VeArray):
+                if procs is not None and a.proc not in procs:
+                    raise ValueError("VeoScheduler: arguments on more than one VeoProc")
+                procs = {a.proc}
+        if affinity is None:
+            return procs or set()
+        if isinstance(affinity, VeArray):
+            aff = {affinity.proc}
+        elif isinstance(affinity, VeoProc):
+            aff = {affinity}
+        else:
+            aff = set(wp.proc for wp in self._wps if wp.nodeid == affinity)
+        if procs is not None:
+            aff &= procs
+        if not aff:
+            raise ValueError("VeoScheduler: no VE process for affinity %r" % affinity)
+        return aff
+
+    def _place(self, procs):
+        """
+        Choose the least loaded live slot, in the processes procs if not
+        empty. Must be called with the lock held.
+        """
+        start = next(self._rr)
+        n = len(self._slots)
+        best = None
+        for i in range(n):
+            s = self._slots[(start + i) % n]
+            if not s.alive or (procs and s.proc not in procs):
+                continue
+            if best is None or s.inflight < best.inflight:
+                best = s
+                if s.inflight == 0:
+                    break
+        return best
+
+    def submit(self, fn, *args, affinity=None, **kwargs):
+        """
+        Call fn, a function name or a VeoFunction, with args on the least
+        loaded context. Returns a concurrent.futures.Future.
+        """
+        if kwargs:
+            raise TypeError("VE functions take no keyword arguments")
+        if isinstance(fn, VeoFunction):
+            procs = self._affinity(args, fn.lib.proc)
+        else:
+            procs = self._affinity(args, affinity)
+        while True:
+            with self._lock:
+                if self._shutdown:
+                    raise RuntimeError("cannot schedule new calls after shutdown")
+                s = self._place(procs)
+                if s is None:
+                    raise RuntimeError("VeoScheduler: no running context%s"
+                                       % (" for the arguments" if procs else ""))
+                if (self.check_state and s.ctx.context_state()
+                        != _veo_context_state.STATE_RUNNING):
+                    s.alive = False
+                    continue
+                s.inflight += 1
+                s.submitted += 1
+                self._inflight += 1
+            break
+        fut = concurrent.futures.Future()
+        fut.set_running_or_notify_cancel()
+        try:
+            f = fn if isinstance(fn, VeoFunction) else self.function(fn, s.proc)
+            req = f(s.ctx, *args)
+        except BaseException:
+            self._done(s)
+            raise
+        s.push(req, fut)
+        return fut
+
+    def _done(self, s):
+        with self._lock:
+            s.inflight -= 1
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.notify_all()
+
+    def load(self):
+        """
+        List of (nodeid, context, calls in flight) of the live contexts.
+        """
+        with self._lock:
+            return [(s.wp.nodeid, s.ctx, s.inflight) for s in self._slots
+                    if s.alive]
+
+    def stats(self):
+        """
+        Number of calls submitted per node.
+        """
+        res = collections.Counter()
+        with self._lock:
+            for s in self._slots:
+                res[s.wp.nodeid] += s.submitted
+        return dict(res)
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until no call is in flight.
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: self._inflight == 0, timeout)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        # calls already on the VE can't be cancelled, cancel_futures has
+        # nothing to do
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        if not wait:
+            threading.Thread(target=self._finish, daemon=True).start()
+            return
+        self._finish()
+
+    def _finish(self):
+        self.wait_idle()
+        for s in self._slots:
+            s.stop()
+        for p in self._own:
+            p.proc_destroy()
+
+    def __repr__(self):
+        return "<VeoScheduler procs=%d contexts=%d inflight=%d>" % (
+            len(self._wps), len(self._slots), self._inflight)
@@ -0,0 +1,362 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Host staging buffers and double-buffered streaming to the VE.
+
+The VEO memory transfers need contiguous host buffers. A StagingBuffer is
+a page-aligned anonymous mapping that can be locked into memory, strided
+numpy views are packed into it before they are transferred. A
+StagingPool keeps staging buffers for reuse.
+
+A StreamWriter pushes a sequence of arrays into consecutive VE memory
+through a few staging buffers, with one async_write_mem() per array: the
+next array is packed into a free staging buffer while the previous ones
+are still in flight.
+
+    w = StreamWriter(ctx, ve_addr, chunk_size=4 << 20)
+    for block in sensor_blocks():
+        w.write(block)
+    w.flush()
+
+load_file() streams a file, a byte range of it or an np.memmap into VE
+memory and dump_file() writes VE memory into a file, in chunks through
+nbuf staging buffers: the file is read (written) with pread (pwrite)
+while the transfers of the previous chunks are in flight in one or
+more contexts. Host memory use stays at nbuf * chunk_size bytes.
+
+    addr, size = load_file(ctxs, "input.bin")
+    dump_file(ctxs, addr, size, "output.bin")
+"""
+import collections
+import ctypes
+import ctypes.util
+import mmap
+import os
+
+import numpy as np
+
+
+PAGE_SIZE = mmap.PAGESIZE
+
+_libc = None
+
+
+def _mlock(addr, size, lock=True):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        _libc.mlock.argtypes = _libc.munlock.argtypes = [
+            ctypes.c_void_p, ctypes.c_size_t]
+    f = _libc.mlock if lock else _libc.munlock
+    return f(ctypes.c_void_p(addr), ctypes.c_size_t(size)) == 0
+
+
+class StagingBuffer(object):
+    """
+    Page-aligned host buffer of at least size bytes, locked into memory
+    if lock is True and the limits allow it.
+    """
+    def __init__(self, size, lock=False):
+        self.size = max(PAGE_SIZE, (size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1))
+        self._mmap = mmap.mmap(-1, self.size)
+        self.buf = np.frombuffer(self._mmap, dtype=np.uint8)
+        self.addr = self.buf.ctypes.data
+        self.locked = False
+        if lock:
+            self.locked = _mlock(self.addr, self.size)
+
+    def pack(self, a):
+        """
+        Copy the array a, which may be a strided view, into the buffer and
+        return a contiguous uint8 view of its nbytes.
+        """
+        a = np.asarray(a)
+        if a.nbytes > self.size:
+            raise ValueError("array of %d bytes does not fit into staging "
+                             "buffer of %d bytes" % (a.nbytes, self.size))
+        dst = self.buf[:a.nbytes]
+        np.copyto(dst.view(a.dtype).reshape(a.shape), a, casting="no")
+        return dst
+
+    def view(self, dtype, shape):
+        """
+        Return the beginning of the buffer as numpy array.
+        """
+        dtype = np.dtype(dtype)
+        n = int(np.prod(shape, dtype=np.int64))
+        return self.buf[:n * dtype.itemsize].view(dtype).reshape(shape)
+
+    def close(self):
+        if self._mmap is None:
+            return
+        if self.locked:
+            _mlock(self.addr, self.size, lock=False)
+            self.locked = False
+        self.buf = None
+        self._mmap.close()
+        self._mmap = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            pass  # exported views are still alive, the mapping stays
+
+    def __repr__(self):
+        return "<StagingBuffer size=%d addr=%x%s>" % (
+            self.size, self.addr, " locked" if self.locked else "")
+
+
+class StagingPool(object):
+    """
+    Reusable staging buffers. get() returns the smallest free buffer that
+    is large enough, or a new one.
+    """
+    def __init__(self, lock=False, max_free=8):
+        self.lock = lock
+        self.max_free = max_free
+        self._free = []
+
+    def get(self, size):
+        best = None
+        for b in self._free:
+            if b.size >= size and (best is None or b.size < best.size):
+                best = b
+        if best is not None:
+            self._free.remove(best)
+            return best
+        return StagingBuffer(size, lock=self.lock)
+
+    def put(self, b):
+        if len(self._free) < self.max_free:
+            self._free.append(b)
+        else:
+            b.close()
+
+    def clear(self):
+        for b in self._free:
+            b.close()
+        self._free = []
+
+
+class StreamWriter(object):
+    """
+    Write consecutive arrays to VE memory starting at dst through the
+    context ctx, double buffered (nbuf staging buffers of chunk_size
+    bytes). Arrays larger than chunk_size are split along the first axis.
+    """
+    def __init__(self, ctx, dst, chunk_size=4 << 20, nbuf=2, lock=False,
+                 pool=None):
+        if nbuf < 1:
+            raise ValueError("StreamWriter needs at least one buffer")
+        self.ctx = ctx
+        self.dst = dst
+        self.offset = 0
+        self.chunk_size = chunk_size
+        self._pool = pool if pool is not None else StagingPool(lock=lock)
+        self._bufs = [self._pool.get(chunk_size) for i in range(nbuf)]
+        self._reqs = [None] * nbuf
+        self._next = 0
+
+    def _submit(self, a):
+        i = self._next
+        self._next = (i + 1) % len(self._bufs)
+        # the buffer is free again when its previous transfer finished
+        if self._reqs[i] is not None:
+            self._reqs[i].wait_result()
+            self._reqs[i] = None
+        data = self._bufs[i].pack(a)
+        self._reqs[i] = self.ctx.async_write_mem(
+            self.dst + self.offset, data, data.nbytes)
+        self.offset += data.nbytes
+
+    def write(self, a):
+        """
+        Queue the array a, which may be non-contiguous, for transfer to
+        the current position of the stream.
+        """
+        a = np.asarray(a)
+        if a.nbytes <= self.chunk_size:
+            self._submit(a)
+            return
+        if a.ndim == 0 or a[0].nbytes > self.chunk_size:
+            a = np.ascontiguousarray(a).reshape(-1)
+        rows = max(1, self.chunk_size // a[0].nbytes)
+        for r in range(0, a.shape[0], rows):
+            self._submit(a[r:r + rows])
+
+    def flush(self):
+        """
+        Wait for all queued transfers. Returns the number of bytes
+        written so far.
+        """
+        for i, r in enumerate(self._reqs):
+            if r is not None:
+                r.wait_result()
+                self._reqs[i] = None
+        return self.offset
+
+    def close(self):
+        self.flush()
+        for b in self._bufs:
+            self._pool.put(b)
+        self._bufs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _contexts(ctxs):
+    if isinstance(ctxs, (list, tuple)):
+        if not ctxs:
+            raise ValueError("at least one context is needed")
+        return list(ctxs)
+    return [ctxs]
+
+
+def _open(f, flags):
+    """
+    File descriptor, start offset and memmap of f: a path, an object
+    with fileno() or an np.memmap, whose pending writes are flushed.
+    """
+    if isinstance(f, np.memmap):
+        if f.filename is None or not f.flags.c_contiguous:
+            raise ValueError("memmap must be a C-contiguous file mapping")
+        if flags != os.O_RDONLY and f.mode not in ("r+", "w+"):
+            raise ValueError("memmap of mode %r is not written through"
+                             % f.mode)
+        f.flush()
+        return os.open(f.filename, flags), f.offset, f
+    if hasattr(f, "fileno"):
+        if hasattr(f, "flush"):
+            f.flush()
+        return os.dup(f.fileno()), 0, None
+    return os.open(f, flags, 0o644), 0, None
+
+
+def load_file(ctxs, src, dst=None, offset=0, size=None,
+              chunk_size=8 << 20, nbuf=4, lock=False, pool=None):
+    """
+    Stream size bytes at offset of the file src (path, file object or
+    np.memmap) into VE memory at dst, by default a new allocation in the
+    process of the contexts. The chunks are written round robin through
+    the contexts ctxs. Returns the VE address and the size.
+    """
+    ctxs = _contexts(ctxs)
+    fd, base, mm = _open(src, os.O_RDONLY)
+    try:
+        if size is None:
+            size = (mm.nbytes if mm is not None
+                    else os.fstat(fd).st_size - base) - offset
+        if size < 0:
+            raise ValueError("offset is beyond the end of the file")
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, base + offset, size,
+                             os.POSIX_FADV_SEQUENTIAL)
+        proc = None
+        if dst is None:
+            proc = ctxs[0].proc
+            dst = proc.alloc_mem(max(size, 1))
+        try:
+            _stream(ctxs, fd, base + offset, dst, size, chunk_size, nbuf,
+                    lock, pool, True)
+        except BaseException:
+            # the allocation made here is not handed out
+            if proc is not None:
+                proc.free_mem(dst)
+            raise
+    finally:
+        os.close(fd)
+    return dst, size
+
+
+def dump_file(ctxs, src, size, dst, offset=0, chunk_size=8 << 20, nbuf=4,
+              lock=False, pool=None):
+    """
+    Write size bytes of VE memory at src into the file dst (path, file
+    object or np.memmap of mode "r+" or "w+") at offset, reading the
+    chunks round robin through the contexts ctxs. A path is created if
+    it does not exist, it is not truncated. Returns the number of bytes written.
+    """
+    ctxs = _contexts(ctxs)
+    fd, base, mm = _open(dst, os.O_WRONLY | os.O_CREAT)
+    try:
+        if mm is not None and offset + size > mm.nbytes:
+            raise ValueError("memmap is smaller than offset + size")
+        _stream(ctxs, fd, base + offset, src, size, chunk_size, nbuf,
+                lock, pool, False)
+    finally:
+        os.close(fd)
+    return size
+
+
+def _stream(ctxs, fd, foff, addr, size, chunk_size, nbuf, lock, pool, load):
+    if chunk_size <= 0 or nbuf < 1:
+        raise ValueError("chunk_size and nbuf must be positive")
+    nbuf = max(1, min(nbuf, (size + chunk_size - 1) // chunk_size))
+    if pool is None:
+        pool = StagingPool(lock=lock)
+    bufs = [pool.get(chunk_size) for i in range(nbuf)]
+    # (request, chunk, file offset) in submission order, the oldest one
+    # occupies the buffer needed next
+    inflight = collections.deque()
+
+    def finish():
+        r, b, fo = inflight.popleft()
+        r.wait_result()
+        if not load:
+            _pwrite(fd, b, fo)
+
+    try:
+        for i, off in enumerate(range(0, size, chunk_size)):
+            n = min(chunk_size, size - off)
+            if len(inflight) == nbuf:
+                finish()
+            b = bufs[i % nbuf].buf[:n]
+            ctx = ctxs[i % len(ctxs)]
+            if load:
+                _pread(fd, b, foff + off)
+                r = ctx.async_write_mem(addr + off, b, n)
+            else:
+                r = ctx.async_read_mem(b, addr + off, n)
+            inflight.append((r, b, foff + off))
+        while inflight:
+            finish()
+    finally:
+        for r, b, fo in inflight:
+            try:
+                r.wait_result()
+            except Exception:
+                pass
+        inflight.clear()
+        for b in bufs:
+            pool.put(b)
+
+
+def _pread(fd, b, off):
+    mv = memoryview(b)
+    while len(mv):
+        n = os.preadv(fd, [mv], off)
+        if n == 0:
+            raise EOFError("file ends before the requested range")
+        mv = mv[n:]
+        off += n
+
+
+def _pwrite(fd, b, off):
+    mv = memoryview(b)
+    while len(mv):
+        n = os.pwritev(fd, [mv], off)
+        mv = mv[n:]
+        off += n
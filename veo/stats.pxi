@@ -0,0 +1,82 @@
+#
+# Performance counters, see veo/perfstats.py.
+#
+# Every VeoFunction, VeoCtxt and VeoProc keeps a _VeoStats struct. Calls
+# and transfers are counted once they were submitted (synchronous
+# transfers once they succeeded), failures count as errors. The latency from
+# submission to the completion seen by the host goes into the histograms
+# of the request's function, context and process. All updates are done
+# with the GIL held.
+#
+from libc.string cimport memset
+
+cdef extern from *:
+    int __builtin_clzll(unsigned long long) nogil
+
+
+cdef inline int _hist_index(uint64_t ns) noexcept nogil:
+    """
+    Bucket of a latency in ns: below 8 one bucket per ns, above 8
+    buckets for each power of two.
+    """
+    cdef int msb, idx
+    if ns < (1 << _HIST_SUB_BITS):
+        return <int>ns
+    msb = 63 - __builtin_clzll(ns)
+    idx = (((msb - _HIST_SUB_BITS + 1) << _HIST_SUB_BITS)
+           + <int>((ns >> (msb - _HIST_SUB_BITS)) & ((1 << _HIST_SUB_BITS) - 1)))
+    if idx >= _HIST_BUCKETS:
+        idx = _HIST_BUCKETS - 1
+    return idx
+
+
+cdef inline void _stats_done(_VeoStats *s, int rc, double dt) noexcept nogil:
+    if rc != VEO_COMMAND_OK:
+        s.errors += 1
+    s.lat_count += 1
+    s.lat_sum += dt
+    if dt > s.lat_max:
+        s.lat_max = dt
+    s.lat_hist[_hist_index(<uint64_t>(dt * 1e9))] += 1
+
+
+cdef _stats_dict(_VeoStats *s):
+    cdef int i
+    hist = np.empty(_HIST_BUCKETS, dtype=np.uint64)
+    cdef uint64_t[::1] h = hist
+    for i in range(_HIST_BUCKETS):
+        h[i] = s.lat_hist[i]
+    return {"calls": s.calls, "errors": s.errors,
+            "reads": s.reads, "writes": s.writes,
+            "bytes_read": s.bytes_read, "bytes_written": s.bytes_written,
+            "allocs": s.allocs, "frees": s.frees,
+            "bytes_allocated": s.bytes_allocated,
+            "latency_count": s.lat_count, "latency_sum": s.lat_sum,
+            "latency_max": s.lat_max, "latency_hist": hist}
+
+
+cdef void _stats_reset(_VeoStats *s) noexcept:
+    # the allocated bytes are a state, not a counter
+    cdef int64_t allocated = s.bytes_allocated
+    memset(s, 0, sizeof(_VeoStats))
+    s.bytes_allocated = allocated
+
+
+cdef inline void _count_call(VeoFunction f, VeoCtxt ctx, bint ok) noexcept:
+    if ok:
+        f._stats.calls += 1
+        ctx._stats.calls += 1
+        ctx.proc._stats.calls += 1
+    else:
+        f._stats.errors += 1
+        ctx._stats.errors += 1
+        ctx.proc._stats.errors += 1
+
+
+cdef inline void _count_transfer(_VeoStats *s, bint write, uint64_t size) noexcept:
+    if write:
+        s.writes += 1
+        s.bytes_written += size
+    else:
+        s.reads += 1
+        s.bytes_read += size
@@ -8,26 +8,45 @@
 #
 # See LICENSE file for details.
 #
-ctypedef int size_t
+# distutils: language = c++
+"""
+System V shared memory segments as buffers.
 
+Worker processes feeding the same VE can hand buffers to each other
+without copies: a SysVShm segment supports the buffer protocol, can be
+viewed as numpy array and passed directly to write_mem(), read_mem(),
+the async transfers and OnStack. Pickling a SysVShm (for example when
+putting it into a multiprocessing queue) only transfers the segment id,
+the receiver attaches the same memory.
 
-cdef extern from "errno.h":
-    int EEXIST, errno
-    int EACCES, errno
-    int ENOMEM, errno
+    seg = SysVShm(size=1 << 20, name="/tmp/veo-batch", proj_id=1)
+    a = seg.array(np.float64, (1024, 128))
+    ...
+    proc.write_mem(ve_buff, seg, seg.size)
+
+The segment is removed with IPC_RMID when the last process detaches
+(auto_remove, the default) or explicitly with remove(). A sender that
+drops its handle before the receiver attached passes the ownership on
+with handoff():
+
+    queue.put(seg.handoff())
+    del seg                     # the receiver removes the segment
+"""
+from libc.errno cimport errno
+from libc.string cimport strerror
+
+import numpy as np
 
-cdef extern from "string.h":
-    void memset(void *addr, int val, size_t len)
-    void memcpy(void *trg, void *src, size_t len)
 
 cdef extern from "sys/types.h":
     ctypedef int key_t
 
 cdef extern from "sys/shm.h":
 
-    ctypedef unsigned int shmatt_t
+    ctypedef unsigned long shmatt_t
 
     cdef struct shmid_ds:
+        size_t shm_segsz
         shmatt_t shm_nattch
 
     int shmget(key_t key, size_t size, int shmflg)
@@ -41,3 +60,201 @@ cdef extern from "sys/ipc.h":
     key_t ftok(char *path, int id)
 
     int IPC_STAT, IPC_RMID, IPC_CREAT, IPC_EXCL, IPC_PRIVATE
+
+
+cdef _oserror(what):
+    return OSError(errno, "%s: %s" % (what, strerror(errno).decode()))
+
+
+def key_from_path(path, int proj_id=1):
+    """
+    Return the IPC key of an existing file path and proj_id (ftok).
+    """
+    cdef key_t key
+    if isinstance(path, str):
+        path = path.encode()
+    key = ftok(path, proj_id)
+    if key == -1:
+        raise _oserror("ftok(%r)" % path)
+    return key
+
+
+cdef class SysVShm(object):
+    """
+    Attached System V shared memory segment.
+
+    The segment is identified by key, by the path name and proj_id
+    (through ftok), or by shmid of an existing segment. Without key, name
+    and shmid a new private segment is created. With create=True a
+    missing segment of size bytes is created, exclusive=True fails if it
+    exists already.
+    """
+    cdef readonly int shmid
+    cdef readonly long key
+    cdef readonly size_t size
+    cdef char *_addr
+    cdef int _exports
+    cdef public bint auto_remove
+    cdef bint _handoff
+
+    def __cinit__(self):
+        self.shmid = -1
+        self._addr = NULL
+        self._exports = 0
+        self._handoff = False
+
+    def __init__(self, size_t size=0, key=None, name=None, int proj_id=1,
+                 shmid=None, bint create=True, bint exclusive=False,
+                 int mode=0o600, bint auto_remove=True):
+        cdef int flags = mode
+        cdef shmid_ds ds
+        cdef void *p
+        self.auto_remove = auto_remove
+        if shmid is None:
+            if name is not None:
+                key = key_from_path(name, proj_id)
+            elif key is None:
+                key = IPC_PRIVATE
+            if create:
+                flags |= IPC_CREAT
+                if exclusive:
+                    flags |= IPC_EXCL
+            self.shmid = shmget(<key_t>key, size, flags)
+            if self.shmid == -1:
+                raise _oserror("shmget(key=%d, size=%d)" % (key, size))
+        else:
+            self.shmid = shmid
+        if shmctl(self.shmid, IPC_STAT, &ds) == -1:
+            raise _oserror("shmctl(%d, IPC_STAT)" % self.shmid)
+        self.size = ds.shm_segsz
+        self.key = key if key is not None else -1
+        p = shmat(self.shmid, NULL, 0)
+        if p == <void *>-1:
+            raise _oserror("shmat(%d)" % self.shmid)
+        self._addr = <char *>p
+
+    def __dealloc__(self):
+        if self._addr != NULL:
+            shmdt(self._addr)
+            self._addr = NULL
+            if self.auto_remove:
+                self._remove_if_unused()
+
+    cdef _remove_if_unused(self):
+        cdef shmid_ds ds
+        if shmctl(self.shmid, IPC_STAT, &ds) == 0 and ds.shm_nattch == 0:
+            shmctl(self.shmid, IPC_RMID, NULL)
+
+    @property
+    def addr(self):
+        """
+        Host address of the segment in this process.
+        """
+        return <unsigned long>self._addr
+
+    @property
+    def attached(self):
+        return self._addr != NULL
+
+    def nattch(self):
+        """
+        Number of processes attached to the segment.
+        """
+        cdef shmid_ds ds
+        if shmctl(self.shmid, IPC_STAT, &ds) == -1:
+            raise _oserror("shmctl(%d, IPC_STAT)" % self.shmid)
+        return ds.shm_nattch
+
+    def detach(self):
+        """
+        Detach the segment. With auto_remove the segment is removed when
+        no process is attached anymore.
+        """
+        if self._addr == NULL:
+            return
+        if self._exports > 0:
+            raise BufferError("SysVShm has %d exported buffers" % self._exports)
+        if shmdt(self._addr) == -1:
+            raise _oserror("shmdt")
+        self._addr = NULL
+        if self.auto_remove:
+            self._remove_if_unused()
+
+    def remove(self):
+        """
+        Mark the segment for removal (IPC_RMID). It is destroyed when the
+        last process detaches, it can't be looked up by key anymore.
+        """
+        if shmctl(self.shmid, IPC_RMID, NULL) == -1:
+            raise _oserror("shmctl(%d, IPC_RMID)" % self.shmid)
+
+    def handoff(self):
+        """
+        Pass the ownership of the segment to the next unpickled copy:
+        this handle does not remove the segment anymore, the receiver
+        removes it when it detaches last. The sender may detach before
+        the receiver attached. Returns self.
+        """
+        self._handoff = True
+        self.auto_remove = False
+        return self
+
+    def array(self, dtype=np.uint8, shape=None, size_t offset=0):
+        """
+        Return a numpy array of dtype and shape in the segment, starting
+        at offset bytes. Without shape the rest of the segment is used.
+        """
+        dtype = np.dtype(dtype)
+        if shape is None:
+            count = (self.size - offset) // dtype.itemsize
+            return np.frombuffer(self, dtype=dtype, count=count, offset=offset)
+        if isinstance(shape, int):
+            shape = (shape,)
+        count = int(np.prod(shape, dtype=np.int64))
+        return np.frombuffer(self, dtype=dtype, count=count,
+                             offset=offset).reshape(shape)
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        if self._addr == NULL:
+            raise BufferError("SysVShm segment is detached")
+        buffer.buf = self._addr
+        buffer.obj = self
+        buffer.len = self.size
+        buffer.readonly = 0
+        buffer.itemsize = 1
+        buffer.format = "B"
+        buffer.ndim = 1
+        buffer.shape = <Py_ssize_t *>&buffer.len
+        buffer.strides = <Py_ssize_t *>&buffer.itemsize
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+        self._exports += 1
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        self._exports -= 1
+
+    def __len__(self):
+        return self.size
+
+    def __reduce__(self):
+        # another process attaches the same segment, after handoff() the
+        # first copy takes over the removal
+        if self._handoff:
+            self._handoff = False
+            return (_attach, (self.shmid, True))
+        return (_attach, (self.shmid, self.auto_remove))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    def __repr__(self):
+        return "<SysVShm shmid=%d size=%d addr=%x%s>" % (
+            self.shmid, self.size, <unsigned long>self._addr,
+            "" if self._addr != NULL else " detached")
+
+
+def _attach(shmid, auto_remove):
+    return SysVShm(shmid=shmid, auto_remove=auto_remove)
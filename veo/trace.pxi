@@ -0,0 +1,98 @@
+#
+# Request tracing, see veo/logging/_vp_trace.py.
+#
+# Events are written into a preallocated ring buffer, a numpy array of
+# _TraceRec records handed over by _trace_enable(). Submission, start of
+# waiting and completion are recorded for calls and transfers, the
+# records are matched into timeline slices when they are exported. The
+# hot paths only test the C flag _tracing while tracing is disabled.
+#
+from cpython.pythread cimport PyThread_get_thread_ident
+
+cdef enum:
+    _TR_CALL = 1
+    _TR_READ = 2
+    _TR_WRITE = 3
+    _TR_WAIT = 4
+    _TR_DONE = 5
+    _TR_SYNC_READ = 6
+    _TR_SYNC_WRITE = 7
+    _TR_SYNC_DONE = 8
+
+cdef struct _TraceRec:
+    double t
+    uint64_t ctx
+    uint64_t req
+    uint64_t nbytes
+    uint64_t tid
+    int32_t node
+    int32_t name
+    int32_t kind
+    int32_t pad
+
+cdef bint _tracing = False
+cdef _TraceRec *_trace_buf = NULL
+cdef Py_ssize_t _trace_cap = 0
+cdef Py_ssize_t _trace_pos = 0
+cdef object _trace_arr = None
+cdef dict _trace_names = dict()
+
+
+cdef int _trace_name(name) except -2:
+    i = _trace_names.get(name)
+    if i is None:
+        i = len(_trace_names)
+        _trace_names[name] = i
+    return i
+
+
+cdef void _trace(int kind, uint64_t ctx, int node, uint64_t req,
+                 uint64_t nbytes, int name) noexcept:
+    """
+    Record an event, called with the GIL held.
+    """
+    global _trace_pos
+    cdef _TraceRec *r = &_trace_buf[_trace_pos % _trace_cap]
+    r.t = _monotonic()
+    r.ctx = ctx
+    r.req = req
+    r.nbytes = nbytes
+    r.tid = PyThread_get_thread_ident()
+    r.node = node
+    r.name = name
+    r.kind = kind
+    _trace_pos += 1
+
+
+def _trace_enable(buf):
+    """
+    Start recording into buf, a C-contiguous numpy array with records of
+    the layout of _TraceRec. Recording starts over at its beginning.
+    """
+    global _tracing, _trace_buf, _trace_cap, _trace_pos, _trace_arr
+    if buf.dtype.itemsize != sizeof(_TraceRec) or not buf.flags.c_contiguous:
+        raise ValueError("trace buffer has the wrong layout")
+    if len(buf) == 0:
+        raise ValueError("trace buffer is empty")
+    _tracing = False
+    _trace_arr = buf
+    _trace_buf = <_TraceRec *><uintptr_t>buf.ctypes.data
+    _trace_cap = len(buf)
+    _trace_pos = 0
+    _tracing = True
+
+
+def _trace_disable():
+    global _tracing
+    _tracing = False
+
+
+def _trace_info():
+    """
+    Return the number of events recorded since _trace_enable() and the
+    function names, indexed by the name field of the records.
+    """
+    names = [None] * len(_trace_names)
+    for k, v in _trace_names.items():
+        names[v] = k.decode() if isinstance(k, bytes) else k
+    return _trace_pos, names
@@ -0,0 +1,163 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Chunked, pipelined transfers of large buffers.
+
+A single veo_read_mem() or veo_async_write_mem() moves a whole buffer
+with one request. A TransferEngine splits large buffers into chunks and
+submits them round robin to the command queues of several VeoCtxts, the
+chunks are then transferred concurrently by the context threads and
+overlap with calls queued in other contexts. The chunk requests are
+returned as one TransferRequest.
+
+    eng = TransferEngine(proc, nctx=4, chunk_size=8 << 20)
+    req = eng.async_write_mem(ve_addr, a, a.nbytes)
+    ...
+    req.wait_result()
+
+The chunks of one transfer are distributed over all contexts of the
+engine, a transfer is therefore only ordered with respect to calls in
+other contexts after its TransferRequest has been waited for.
+"""
+from veo._veo import wait_all
+
+
+DEFAULT_CHUNK_SIZE = 8 << 20
+
+
+class TransferRequest(object):
+    """
+    Composite request of the chunk requests of one transfer.
+    """
+    def __init__(self, requests, nbytes):
+        self.requests = requests
+        self.nbytes = nbytes
+
+    def done(self):
+        return all(r.done() for r in self.requests)
+
+    def wait_result(self):
+        """
+        Wait until all chunks are transferred. Returns 0, errors of the
+        chunk requests are raised.
+        """
+        wait_all(self.requests)
+        return 0
+
+    def peek_result(self):
+        """
+        Return 0 if the transfer has finished, raise NameError like
+        VeoRequest.peek_result() otherwise.
+        """
+        if not self.done():
+            raise NameError("transfer is still in progress")
+        return self.wait_result()
+
+    def __await__(self):
+        import asyncio
+        from veo.aio import wrap_request
+        yield from asyncio.gather(
+            *[wrap_request(r) for r in self.requests]).__await__()
+        return 0
+
+    def __repr__(self):
+        return "<TransferRequest nbytes=%d chunks=%d>" % (
+            self.nbytes, len(self.requests))
+
+
+def _byte_view(buf, size, name):
+    mv = memoryview(buf)
+    if not mv.contiguous:
+        raise ValueError("%s must be a contiguous buffer" % name)
+    mv = mv.cast("B")
+    if len(mv) < size:
+        raise ValueError("%s buffer is smaller than required size (%d < %d)"
+                         % (name, len(mv), size))
+    return mv
+
+
+class TransferEngine(object):
+    """
+    Split transfers into chunks of chunk_size bytes and spread them over
+    the contexts ctxs, or over nctx contexts opened in proc.
+    """
+    def __init__(self, proc, ctxs=None, nctx=4, chunk_size=DEFAULT_CHUNK_SIZE):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.proc = proc
+        self._own = ctxs is None
+        if ctxs is None:
+            ctxs = [proc.open_context() for i in range(nctx)]
+        self.ctxs = list(ctxs)
+        if not self.ctxs:
+            raise ValueError("TransferEngine needs at least one context")
+        self.chunk_size = chunk_size
+        self._next = 0
+
+    def _chunks(self, size):
+        n = len(self.ctxs)
+        for off in range(0, size, self.chunk_size):
+            ctx = self.ctxs[self._next % n]
+            self._next += 1
+            yield ctx, off, min(self.chunk_size, size - off)
+
+    def _submit(self, size, submit):
+        """
+        Submit the chunks of a transfer of size bytes with
+        submit(ctx, off, n). If a submission fails, the chunks already
+        submitted are waited for before the error is raised, they still
+        use the buffer.
+        """
+        reqs = []
+        try:
+            for ctx, off, n in self._chunks(size):
+                reqs.append(submit(ctx, off, n))
+        except Exception:
+            if reqs:
+                try:
+                    wait_all(reqs)
+                except Exception:
+                    pass
+            raise
+        return TransferRequest(reqs, size)
+
+    def async_write_mem(self, dst, src, size):
+        """
+        Write size bytes from the buffer src to the VE address dst.
+        """
+        mv = _byte_view(src, size, "src")
+        return self._submit(size, lambda ctx, off, n:
+                            ctx.async_write_mem(dst + off, mv[off:off + n], n))
+
+    def async_read_mem(self, dst, src, size):
+        """
+        Read size bytes from the VE address src into the buffer dst.
+        """
+        mv = _byte_view(dst, size, "dst")
+        if mv.readonly:
+            raise ValueError("dst buffer is read-only")
+        return self._submit(size, lambda ctx, off, n:
+                            ctx.async_read_mem(mv[off:off + n], src + off, n))
+
+    def write_mem(self, dst, src, size):
+        return self.async_write_mem(dst, src, size).wait_result()
+
+    def read_mem(self, dst, src, size):
+        return self.async_read_mem(dst, src, size).wait_result()
+
+    def close(self):
+        """
+        Close the contexts opened by the engine.
+        """
+        if self._own:
+            for ctx in self.ctxs:
+                self.proc.close_context(ctx)
+        self.ctxs = []
@@ -0,0 +1,177 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Arrays in VE memory with lazy synchronization of a host copy.
+
+A VeArray owns a contiguous buffer in the memory of a VeoProc and a host
+buffer of the same shape and dtype. Both sides carry a dirty flag, data
+is only transferred when the other side needs it:
+
+- passing a VeArray as argument of a VeoFunction writes the host data to
+  the VE if the host side is dirty, afterwards the VE side is considered
+  dirty because the function may have changed it;
+- host access (np.asarray(), indexing, host()) reads the VE data if the
+  VE side is dirty.
+
+Transfers go through the context given as ctx, if any, and are thereby
+ordered after the requests queued in that context. Without a context
+they use the synchronous VeoProc transfers, the requests working on the
+array must then be collected before the array is accessed on the host.
+"""
+import numpy as np
+
+
+class VeArray(object):
+    """
+    Contiguous array in the memory of a VeoProc with a lazily
+    synchronized host copy.
+    """
+    def __init__(self, proc, shape, dtype=np.float64, ctx=None, _host=None):
+        if isinstance(shape, int):
+            shape = (shape,)
+        self.proc = proc
+        self.ctx = ctx
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = int(np.prod(self.shape, dtype=np.int64))
+        self.nbytes = self.size * self.dtype.itemsize
+        strides = []
+        s = self.dtype.itemsize
+        for n in reversed(self.shape):
+            strides.insert(0, s)
+            s *= n
+        self.strides = tuple(strides)
+        self.addr = proc.alloc_mem(max(self.nbytes, 1))
+        self._host = _host
+        self.host_dirty = _host is not None
+        self.device_dirty = False
+
+    @classmethod
+    def from_host(cls, proc, a, ctx=None, copy=True):
+        """
+        Create a VeArray from a copy of the host array a. The data is
+        written to the VE when it is needed there.
+
+        With copy=False a writable, C-contiguous a becomes the host
+        buffer of the VeArray: data read back from the VE is written
+        into a, and changes made to a directly afterwards must be
+        followed by mark_host_dirty() to reach the VE.
+        """
+        a = np.asarray(a)
+        if copy or not a.flags.c_contiguous or not a.flags.writeable:
+            a = np.array(a, order="C", copy=True)
+        return cls(proc, a.shape, a.dtype, ctx=ctx, _host=a)
+
+    def __del__(self):
+        proc = getattr(self, "proc", None)
+        addr = getattr(self, "addr", 0)
+        if proc is not None and addr:
+            self.addr = 0
+            try:
+                proc.free_mem(addr)
+            except Exception:
+                pass  # the VE process is gone
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "<VeArray shape=%r dtype=%s addr=%x%s%s>" % (
+            self.shape, self.dtype, self.addr,
+            " host_dirty" if self.host_dirty else "",
+            " device_dirty" if self.device_dirty else "")
+
+    def _host_buffer(self):
+        if self._host is None:
+            self._host = np.empty(self.shape, dtype=self.dtype)
+        return self._host
+
+    def to_device(self):
+        """
+        Write the host data to the VE if the host side is dirty.
+        """
+        if not self.host_dirty:
+            return
+        h = self._host
+        if self.ctx is not None:
+            self.ctx.async_write_mem(self.addr, h, self.nbytes).wait_result()
+        else:
+            self.proc.write_mem(self.addr, h, self.nbytes)
+        self.host_dirty = False
+
+    def to_host(self):
+        """
+        Read the VE data into the host buffer if the VE side is dirty.
+        """
+        h = self._host_buffer()
+        if not self.device_dirty:
+            return
+        if self.ctx is not None:
+            self.ctx.async_read_mem(h, self.addr, self.nbytes).wait_result()
+        else:
+            self.proc.read_mem(h, self.addr, self.nbytes)
+        self.device_dirty = False
+
+    def host(self, write=True):
+        """
+        Return the host buffer as numpy array, synchronized with the VE.
+        With write=True the host side is marked dirty.
+        """
+        self.to_host()
+        if write:
+            self.host_dirty = True
+        return self._host
+
+    def ve_ptr(self, write=True):
+        """
+        Return the VE address of the data, synchronized with the host.
+        With write=True the VE side is marked dirty.
+        """
+        self.to_device()
+        if write:
+            self.device_dirty = True
+        return self.addr
+
+    @property
+    def _ve_array(self):
+        # argument of a VeoFunction call, the function may write the array
+        return self.ve_ptr(write=True)
+
+    @property
+    def __array_interface__(self):
+        h = self.host(write=False)
+        return {"shape": self.shape,
+                "typestr": self.dtype.str,
+                "descr": self.dtype.descr,
+                "data": (h.ctypes.data, True),
+                "strides": None,
+                "version": 3}
+
+    def __getitem__(self, idx):
+        v = self.host(write=False)[idx]
+        if isinstance(v, np.ndarray):
+            # writes through the view would not mark the host dirty,
+            # they go through __setitem__ or host(write=True)
+            v.flags.writeable = False
+        return v
+
+    def __setitem__(self, idx, value):
+        self.host(write=True)[idx] = value
+
+    def mark_host_dirty(self):
+        self.host_dirty = True
+
+    def mark_device_dirty(self):
+        self.device_dirty = True
@@ -9,8 +9,13 @@
 # See LICENSE file for details.
 #
 import collections
+import concurrent.futures
+import hashlib
 import subprocess
 import os
+import shutil
+import tempfile
+import threading
 from shutil import rmtree
 
 
@@ -28,11 +33,164 @@ FLAGS = {
 }
 
 
-def _shell_cmd(cmd, verbose=False):
+def _file_stamp(path):
+    # modification time and size of an existing file, None otherwise
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _file_digest(path):
+    # sha256 of the content of a file, None if it can't be read
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class VeBuildCache(object):
+    """
+    Persistent, content-addressed cache of compiled objects and linked
+    .so and veorun files.
+
+    Entries are files named after the sha256 of everything that went
+    into producing them: the source text, the content of the files it
+    includes (as listed by the compiler with -MM), compiler path and
+    flags for objects; the object keys, linker, flags and libs for
+    linked files. Objects whose includes the compiler can't list are
+    not cached.
+    The total size is bounded by max_bytes, the least recently used
+    entries are evicted first.
+    """
+    def __init__(self, path=None, max_bytes=1 << 30):
+        if path is None:
+            path = os.getenv("VEO_BUILD_CACHE") or os.path.join(
+                os.path.expanduser("~"), ".cache", "py-veo")
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha256()
+        for p in parts:
+            h.update(repr(p).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _entry(self, key, suffix):
+        return os.path.join(self.path, key + suffix)
+
+    def get(self, key, suffix, dest):
+        """
+        Copy the entry key to dest. Returns True on a hit.
+        """
+        entry = self._entry(key, suffix)
+        try:
+            shutil.copyfile(entry, dest)
+            os.utime(entry)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        if suffix != ".o":
+            os.chmod(dest, 0o755)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, suffix, src):
+        """
+        Store the file src as entry key, then evict old entries.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, self._entry(key, suffix))
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self.trim(self.max_bytes)
+
+    def _entries(self):
+        res = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue
+            st = _file_stamp(os.path.join(self.path, name))
+            if st is not None:
+                res.append((st[0], name, st[1]))
+        return res
+
+    def trim(self, max_bytes=0):
+        """
+        Evict least recently used entries until at most max_bytes remain.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(e[2] for e in entries)
+            for mtime, name, size in entries:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                    total -= size
+                except OSError:
+                    pass
+            return total
+
+    def stats(self):
+        entries = self._entries()
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(entries),
+                "bytes": sum(e[2] for e in entries),
+                "max_bytes": self.max_bytes}
+
+
+_default_cache = None
+
+
+def default_build_cache():
+    """
+    The VeBuildCache used by new VeBuild objects when the environment
+    variable VEO_BUILD_CACHE is set, otherwise None.
+    """
+    global _default_cache
+    if _default_cache is None and os.getenv("VEO_BUILD_CACHE"):
+        _default_cache = VeBuildCache()
+    return _default_cache
+
+
+_built_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _build_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix="vebuild")
+        return _executor
+
+
+def _shell_cmd(cmd, verbose=False, cwd=None):
     if verbose:
         print(cmd)
     try:
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True,
+                                      cwd=cwd)
         if verbose:
             print(out)
 
@@ -57,32 +215,67 @@ class VeObj(object):
         else:
             self._compiler = compiler
 
-    def build(self, oname, dir=None, verbose=False):
-        owd = os.getcwd()
-        if dir:
-            os.chdir(dir)
-        sname = oname + SUFFIX[self._type]
+    def _write_src(self, oname, dir):
+        dir = os.path.abspath(dir or ".")
+        base = os.path.join(dir, oname)
+        sname = base + SUFFIX[self._type]
         with open(sname, "w") as f:
             f.write(self._src)
+        return dir, base, sname
 
-        cmd = self._compiler + " " + self._flags + " -c " + sname + " -o " + oname + ".o"
-        try:
-            rc = _shell_cmd(cmd, verbose=verbose)
-        except Exception as e:
-            os.chdir(owd)
-            raise (e)
-        if verbose and os.path.isfile(oname + ".L"):
+    def build(self, oname, dir=None, verbose=False):
+        """
+        Compile the source into dir/oname.o. Works with absolute paths and
+        does not change the working directory, concurrent builds from
+        several threads are safe.
+        """
+        dir, base, sname = self._write_src(oname, dir)
+
+        cmd = self._compiler + " " + self._flags + " -c " + sname + " -o " + base + ".o"
+        rc = _shell_cmd(cmd, verbose=verbose, cwd=dir)
+        if verbose and os.path.isfile(base + ".L"):
             print("---------")
-            with open(oname + ".L", "r") as f:
+            with open(base + ".L", "r") as f:
                 for line in f:
                     if line.endswith("\n"):
                         line = line[:-1]
                     print(line)
             print("---------")
-        if dir:
-            os.chdir(owd)
         return rc
 
+    def depends(self, oname, dir=None):
+        """
+        List of (path, sha256) of the files included by the source when
+        compiled as dir/oname, from the -MM output of the compiler.
+        Returns None if the compiler can't list them.
+        """
+        dir, base, sname = self._write_src(oname, dir)
+        cmd = self._compiler + " " + self._flags + " -MM " + sname
+        try:
+            out = subprocess.check_output(cmd, stderr=subprocess.DEVNULL,
+                                          shell=True, cwd=dir)
+        except Exception:
+            return None
+        # make rule "oname.o: sname dep1 ...", lines end in a backslash
+        words = out.decode().replace("\\\n", " ").split()
+        if not words or not words[0].endswith(":"):
+            return None
+        deps = []
+        for w in words[1:]:
+            path = os.path.join(dir, w)
+            if path == sname:
+                continue
+            digest = _file_digest(path)
+            if digest is None:
+                return None
+            deps.append((w, digest))
+        return sorted(deps)
+
+    def cache_key(self, deps=()):
+        return VeBuildCache.key(self._type, self._src, self._compiler,
+                                _file_stamp(self._compiler), self._flags,
+                                list(deps))
+
     def clean(self, oname):
         sname = oname + SUFFIX[self._type]
         try:
@@ -125,9 +318,19 @@ class VeFtnObj(VeObj):
 class VeBuild(object):
     _built = []  # built files, to be deleted by realclean()
 
-    def __init__(self):
+    def __init__(self, cache=None):
         self._obj = collections.OrderedDict()
         self._blddir = ""
+        self._cache = cache if cache is not None else default_build_cache()
+
+    def set_cache(self, cache):
+        """
+        Use the VeBuildCache cache, True selects the default cache
+        location, None disables caching.
+        """
+        if cache is True:
+            cache = VeBuildCache()
+        self._cache = cache
 
     def set_c_src(self, label, content, flags=None, compiler=None):
         self._obj[label] = VeCObj(content, flags=flags, compiler=compiler)
@@ -143,65 +346,154 @@ class VeBuild(object):
             dirname = dirname + "/"
         self._blddir = dirname
 
-    def build_so(self, label=None, flags=None, libs=[], linker=None, verbose=False):
-        if label is None and self._obj.keys():
-            label = self._first_label()
-        if label is None:
-            raise ValueError("No label. Did you define any sources?")
-        self._check_create_blddir()
-        for src, obj in self._obj.items():
-            if obj.build(src, dir=self._blddir, verbose=verbose):
-                print("compile %s -> ok" % src)
-            else:
-                print("compile %s -> failed" % src)
-                return
-
-        soname = self._blddir + label + ".so"
+    def build_so(self, label=None, flags=None, libs=[], linker=None, verbose=False,
+                 jobs=None):
+        objs, bdir, blddir, label = self._prepare(label)
+        soname = os.path.join(bdir, label + ".so")
         if linker is None:
             linker = self._find_linker()
+        keys = self._obj_keys(objs, bdir, jobs)
+        key = self._link_key(keys, "so", linker, flags, libs)
+        if self._cached(key, ".so", soname):
+            return blddir + label + ".so"
+        if not self._compile_all(objs, keys, bdir, verbose, jobs):
+            return
+
         if flags:
             cmd = linker + " " + flags
         else:
             cmd = linker + " " + GLOBAL_SO_FLAGS
         cmd += " -o " + soname
         cmd += " " + " ".join(
-            ["%s%s.o" % (self._blddir, src) for src in self._obj.keys()]
+            [os.path.join(bdir, src + ".o") for src, obj in objs]
         )
         if libs:
             cmd += " " + " ".join(libs)
-        if _shell_cmd(cmd, verbose=verbose):
-            if soname not in self._built:
-                self._built.append(soname)
-            return soname
+        if _shell_cmd(cmd, verbose=verbose, cwd=bdir):
+            self._add_built(soname)
+            if self._cache is not None:
+                self._cache.put(key, ".so", soname)
+            return blddir + label + ".so"
         return None
 
-    def build_veorun(self, label=None, flags=None, libs=[], verbose=False):
-        if label is None and self._obj.keys():
-            label = self._first_label()
-        if label is None:
-            raise ValueError("No label. Did you define any sources?")
-        self._check_create_blddir()
-        for src, obj in self._obj.items():
-            if obj.build(src, dir=self._blddir, verbose=verbose):
-                print("compile %s -> ok" % src)
-            else:
-                print("compile %s -> failed" % src)
-                return
+    def build_veorun(self, label=None, flags=None, libs=[], verbose=False,
+                     jobs=None):
+        objs, bdir, blddir, label = self._prepare(label)
+        oname = os.path.join(bdir, label + ".veorun")
+        keys = self._obj_keys(objs, bdir, jobs)
+        key = self._link_key(keys, "veorun", MK_VEORUN_STATIC, flags, libs)
+        if self._cached(key, ".veorun", oname):
+            return blddir + label + ".veorun"
+        if not self._compile_all(objs, keys, bdir, verbose, jobs):
+            return
 
-        oname = self._blddir + label + ".veorun"
         cmd = MK_VEORUN_STATIC + " " + oname
         if flags:
             cmd = "env CFLAGS=\"%s\" " % flags + cmd
         cmd += " " + " ".join(
-            ["%s%s.o" % (self._blddir, src) for src in self._obj.keys()]
+            [os.path.join(bdir, src + ".o") for src, obj in objs]
         )
         if libs:
             cmd += " " + " ".join(libs)
-        if _shell_cmd(cmd, verbose=verbose):
+        if _shell_cmd(cmd, verbose=verbose, cwd=bdir):
+            self._add_built(oname)
+            if self._cache is not None:
+                self._cache.put(key, ".veorun", oname)
+            return blddir + label + ".veorun"
+        return None
+
+    def build_so_async(self, *args, **kwargs):
+        """
+        Run build_so() in the background, returns a
+        concurrent.futures.Future with the result.
+        """
+        return _build_executor().submit(self.build_so, *args, **kwargs)
+
+    def build_veorun_async(self, *args, **kwargs):
+        """
+        Run build_veorun() in the background, returns a
+        concurrent.futures.Future with the result.
+        """
+        return _build_executor().submit(self.build_veorun, *args, **kwargs)
+
+    def _prepare(self, label):
+        # snapshot of the sources and the absolute build directory, the
+        # build does not depend on later changes or on the cwd. The built
+        # file is returned relative to the build directory as configured.
+        if label is None and self._obj.keys():
+            label = self._first_label()
+        if label is None:
+            raise ValueError("No label. Did you define any sources?")
+        self._check_create_blddir()
+        return (list(self._obj.items()), os.path.abspath(self._blddir or "."),
+                self._blddir, label)
+
+    def _map(self, fn, items, jobs=None):
+        # fn over items with up to jobs threads (default: number of CPUs)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = max(1, min(jobs, len(items)))
+        if jobs == 1:
+            return [fn(item) for item in items]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as ex:
+            return list(ex.map(fn, items))
+
+    def _obj_keys(self, objs, bdir, jobs=None):
+        """
+        Cache keys of the objects, including the files they include.
+        None for objects whose includes can't be listed, and for all
+        objects without cache.
+        """
+        if self._cache is None:
+            return [None] * len(objs)
+
+        def key(so):
+            deps = so[1].depends(so[0], dir=bdir)
+            return None if deps is None else so[1].cache_key(deps)
+        return self._map(key, objs, jobs)
+
+    def _compile_one(self, src, obj, key, bdir, verbose):
+        oname = os.path.join(bdir, src + ".o")
+        if key is not None:
+            if self._cache.get(key, ".o", oname):
+                return "cached"
+        if not obj.build(src, dir=bdir, verbose=verbose):
+            return "failed"
+        if key is not None:
+            self._cache.put(key, ".o", oname)
+        return "ok"
+
+    def _compile_all(self, objs, keys, bdir, verbose, jobs=None):
+        """
+        Compile the source blocks in parallel, with up to jobs compilers
+        running at the same time (default: number of CPUs).
+        """
+        res = self._map(lambda sok: self._compile_one(sok[0][0], sok[0][1], sok[1],
+                                                      bdir, verbose),
+                        list(zip(objs, keys)), jobs)
+        for (src, obj), r in zip(objs, res):
+            print("compile %s -> %s" % (src, r))
+        return "failed" not in res
+
+    def _link_key(self, keys, kind, linker, flags, libs):
+        if self._cache is None or None in keys:
+            return None
+        return VeBuildCache.key(
+            kind, keys,
+            linker, _file_stamp(linker), flags,
+            [(lib, _file_stamp(lib)) for lib in libs])
+
+    def _cached(self, key, suffix, oname):
+        if key is None or not self._cache.get(key, suffix, oname):
+            return False
+        print("link %s -> cached" % oname)
+        self._add_built(oname)
+        return True
+
+    def _add_built(self, oname):
+        with _built_lock:
             if oname not in self._built:
                 self._built.append(oname)
-            return oname
-        return None
 
     def clean(self):
         for src, obj in self._obj.items():
@@ -231,7 +523,7 @@ class VeBuild(object):
                 raise OSError("Directory '%s' exists but is not readable "
                               "or writable!" % self._blddir)
         else:
-            os.mkdir(self._blddir)
+            os.makedirs(self._blddir, exist_ok=True)
 
     def _first_label(self):
         if self._obj.keys():
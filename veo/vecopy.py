@@ -0,0 +1,181 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Copies of VE memory between VeoProcs.
+
+copy_between() copies size bytes from src_addr in src_proc to dst_addr
+in dst_proc, e.g. the halos of a domain decomposition over several
+cards:
+
+    copy_between(p0, halo0, p1, ghost1, nbytes)
+
+With the "hmem" method the addresses are turned into VEO_HMEM addresses
+and copied with one veo_hmemcpy(). The "staged" method bounces the data
+through a small ring of reusable host staging buffers in chunks: the
+chunks are read with async_read_mem() in a context of src_proc and
+written with async_write_mem() in a context of dst_proc, reading the
+next chunks overlaps with writing the previous ones. "auto" tries hmem
+first and falls back to staged when the platform does not copy between
+VEs with veo_hmemcpy().
+
+When contexts are given, the copy starts after the calls queued there
+have finished. The GIL is released while waiting, copies in different
+threads proceed concurrently.
+"""
+import collections
+import threading
+
+from veo._veo import VEO_HMEM
+from veo.staging import StagingPool
+
+
+DEFAULT_CHUNK_SIZE = 4 << 20
+DEFAULT_NBUF = 4
+METHODS = ("auto", "hmem", "staged")
+
+# staging buffers shared by all copies
+_pool = StagingPool()
+_pool_lock = threading.Lock()
+# False once a probe showed that veo_hmemcpy() can't copy between VEs
+_hmem_works = True
+
+
+def hmem_addr(proc, addr):
+    """
+    VEO_HMEM address of the VE address addr of proc.
+    """
+    if VEO_HMEM.is_ve_addr(addr):
+        return addr
+    return proc.set_proc_identifier(addr, proc.proc_identifier())
+
+
+def _context(proc, ctx):
+    if ctx is not None:
+        return ctx
+    if proc.context:
+        return proc.context[0]
+    return proc.open_context()
+
+
+def _copy_hmem(src_proc, src_addr, dst_proc, dst_addr, size, src_ctx,
+               dst_ctx):
+    for ctx in (src_ctx, dst_ctx):
+        if ctx is not None:
+            ctx.context_sync()
+    VEO_HMEM.hmemcpy(hmem_addr(dst_proc, dst_addr),
+                     hmem_addr(src_proc, src_addr), size)
+
+
+def _hmem_probe(src_proc, dst_proc):
+    """
+    True if veo_hmemcpy() copies between the two processes, tried with a
+    small copy between fresh allocations.
+    """
+    src = src_proc.alloc_mem(8)
+    try:
+        dst = dst_proc.alloc_mem(8)
+        try:
+            VEO_HMEM.hmemcpy(hmem_addr(dst_proc, dst),
+                             hmem_addr(src_proc, src), 8)
+            return True
+        except RuntimeError:
+            return False
+        finally:
+            dst_proc.free_mem(dst)
+    finally:
+        src_proc.free_mem(src)
+
+
+def _copy_staged(src_proc, src_addr, dst_proc, dst_addr, size, src_ctx,
+                 dst_ctx, chunk_size, nbuf, pool):
+    src_ctx = _context(src_proc, src_ctx)
+    dst_ctx = _context(dst_proc, dst_ctx)
+    nbuf = max(1, min(nbuf, (size + chunk_size - 1) // chunk_size))
+    with _pool_lock:
+        bufs = [pool.get(chunk_size) for i in range(nbuf)]
+    writes = [None] * nbuf
+    reads = collections.deque()
+    try:
+        for i, off in enumerate(range(0, size, chunk_size)):
+            n = min(chunk_size, size - off)
+            slot = i % nbuf
+            if writes[slot] is not None:
+                writes[slot].wait_result()
+                writes[slot] = None
+            b = bufs[slot].buf[:n]
+            reads.append((src_ctx.async_read_mem(b, src_addr + off, n),
+                          slot, off, b))
+            if len(reads) == nbuf:
+                # all buffers are being filled, pass the oldest one on
+                r, s, o, b = reads.popleft()
+                r.wait_result()
+                writes[s] = dst_ctx.async_write_mem(dst_addr + o, b, len(b))
+        while reads:
+            r, s, o, b = reads.popleft()
+            r.wait_result()
+            writes[s] = dst_ctx.async_write_mem(dst_addr + o, b, len(b))
+        for w in writes:
+            if w is not None:
+                w.wait_result()
+    finally:
+        # requests still in flight keep their buffer exported, wait for
+        # them before the buffers are reused
+        for r, s, o, b in reads:
+            _wait_quietly(r)
+        for w in writes:
+            if w is not None:
+                _wait_quietly(w)
+        with _pool_lock:
+            for b in bufs:
+                pool.put(b)
+
+
+def _wait_quietly(req):
+    try:
+        req.wait_result()
+    except Exception:
+        pass
+
+
+def copy_between(src_proc, src_addr, dst_proc, dst_addr, size,
+                 method="auto", src_ctx=None, dst_ctx=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, nbuf=DEFAULT_NBUF, pool=None):
+    """
+    Copy size bytes from the VE address src_addr of src_proc to dst_addr
+    of dst_proc. Returns the method used, "hmem" or "staged".
+
+    src_ctx and dst_ctx are the contexts the copy is ordered with, the
+    staged copy also transfers in them; by default the first context of
+    the process, opened if necessary. The staged copy uses nbuf buffers
+    of chunk_size bytes taken from pool, a StagingPool.
+    """
+    global _hmem_works
+    if method not in METHODS:
+        raise ValueError("method must be one of %s" % ", ".join(METHODS))
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if size == 0:
+        return "hmem" if method == "hmem" else "staged"
+    if method == "hmem" or (method == "auto" and _hmem_works):
+        try:
+            _copy_hmem(src_proc, src_addr, dst_proc, dst_addr, size,
+                       src_ctx, dst_ctx)
+            return "hmem"
+        except RuntimeError:
+            if method == "hmem":
+                raise
+            # a failure caused by this copy's arguments does not disable
+            # hmem for later copies
+            if not _hmem_probe(src_proc, dst_proc):
+                _hmem_works = False
+    _copy_staged(src_proc, src_addr, dst_proc, dst_addr, size, src_ctx,
+                 dst_ctx, chunk_size, nbuf, _pool if pool is None else pool)
+    return "staged"
@@ -0,0 +1,36 @@
+/*
+ * VE side call dispatcher of py-veo.
+ *
+ * veo_dispatch() runs a batch of calls back to back with a single
+ * veo_call_async(). The batch is an array of uint64_t words in VE memory:
+ *
+ *   blk[0]          number of calls
+ *   blk[1 + 11*i]   record of call i:
+ *     [0]           function address
+ *     [1]           number of arguments (at most 8)
+ *     [2..9]        arguments, integers and pointers widened to 64 bits
+ *     [10]          result, written by the dispatcher
+ *
+ * Unused argument slots are zero. Functions with fewer arguments ignore
+ * the surplus registers. The dispatcher can be built into a .so with
+ * VeBuild or linked into a static veorun.
+ */
+#include <stdint.h>
+
+#define VEO_DISPATCH_REC 11
+
+typedef uint64_t (*veo_dispatch_fn)(uint64_t, uint64_t, uint64_t, uint64_t,
+				    uint64_t, uint64_t, uint64_t, uint64_t);
+
+int64_t veo_dispatch(uint64_t *blk)
+{
+	uint64_t i, n = blk[0];
+	uint64_t *r = blk + 1;
+
+	for (i = 0; i < n; i++, r += VEO_DISPATCH_REC) {
+		veo_dispatch_fn f = (veo_dispatch_fn)r[0];
+
+		r[10] = f(r[2], r[3], r[4], r[5], r[6], r[7], r[8], r[9]);
+	}
+	return (int64_t)n;
+}
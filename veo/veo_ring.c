@@ -0,0 +1,64 @@
+/*
+ * VE side worker of the py-veo ring channel (veo/ring.py).
+ *
+ * veo_ring_worker() is started once with veo_call_async() and then
+ * serves calls posted by the host into a ring of slots in VEO_HMEM
+ * memory, without going through the VEO command queue. The host writes
+ * and polls the slots with veo_hmemcpy(). All fields
+ * are uint64_t words:
+ *
+ *   ring[0]          magic
+ *   ring[1]          number of slots n
+ *   ring[16 + 16*i]  slot i:
+ *     [0]            sequence: 2*t-1 when ticket t is posted by the host,
+ *                    2*t when the worker finished it
+ *     [1]            function address, 0 stops the worker
+ *     [2]            number of arguments (at most 8)
+ *     [3..10]        arguments, integers and pointers widened to 64 bits
+ *     [11]           result
+ *
+ * Ticket t lives in slot (t-1) % n. The host is the only producer, the
+ * worker the only consumer, each writes the sequence word last.
+ */
+#include <stdint.h>
+#ifndef __ve__
+#include <sched.h>
+#endif
+
+#define VEO_RING_HDR 16
+#define VEO_RING_SLOT 16
+#define VEO_RING_SPIN 100
+
+typedef uint64_t (*veo_ring_fn)(uint64_t, uint64_t, uint64_t, uint64_t,
+				uint64_t, uint64_t, uint64_t, uint64_t);
+
+int64_t veo_ring_worker(uint64_t *ring)
+{
+	uint64_t n = ring[1], t, spins;
+
+	for (t = 1; ; t++) {
+		volatile uint64_t *s = ring + VEO_RING_HDR +
+			((t - 1) % n) * VEO_RING_SLOT;
+		veo_ring_fn f;
+
+		for (spins = 0; s[0] != 2 * t - 1; spins++) {
+#ifndef __ve__
+			/* host emulation: let the producer run */
+			if (spins >= VEO_RING_SPIN) {
+				sched_yield();
+				spins = 0;
+			}
+#endif
+		}
+		__sync_synchronize();
+		f = (veo_ring_fn)s[1];
+		if (f == 0) {
+			__sync_synchronize();
+			s[0] = 2 * t;
+			return (int64_t)(t - 1);
+		}
+		s[11] = f(s[3], s[4], s[5], s[6], s[7], s[8], s[9], s[10]);
+		__sync_synchronize();
+		s[0] = 2 * t;
+	}
+}
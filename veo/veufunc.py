@@ -0,0 +1,243 @@
+# Copyright (c) 2018 - 2023 Erich Focht, NEC HPCE.
+#
+# Re-integrated and adapted code that has been derived from PyVEO and
+# used in NLCPY, therefore:
+#
+# # NLCPy License #
+#     Copyright (c) 2020 NEC Corporation
+#
+# See LICENSE file for details.
+#
+"""
+Elementwise VE kernels generated from C expressions ("VE ufuncs").
+
+    axpy = VeUfunc("a * x + y", ("a", "x", "y"))
+    z = axpy(ctx, 2.0, x, y)
+
+The expression is C, over the argument names. For every signature - the
+dtypes of the arguments and whether they are arrays or scalars - a
+vectorizable loop is generated, compiled with VeBuild and loaded into
+the VeoProc of the context. Libraries are cached per signature and
+process, VeBuild's compile cache is used when it is enabled.
+
+A call writes the numpy array arguments to the VE, runs the kernel and
+reads the result back, all queued in the context so that only the final
+read is waited for. VeArray arguments are used in place, a VeArray as
+out keeps the result on the VE.
+"""
+import hashlib
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from veo._veo import wait_all
+from veo.vebuild import VeBuild, COMPILER, FLAGS
+from veo.vearray import VeArray
+
+
+# numpy dtype -> (C type, VeoFunction argument type)
+_CTYPES = {
+    np.dtype(np.float64): ("double", "double"),
+    np.dtype(np.float32): ("float", "float"),
+    np.dtype(np.int64): ("int64_t", "long"),
+    np.dtype(np.int32): ("int32_t", "int"),
+    np.dtype(np.int16): ("int16_t", "short"),
+    np.dtype(np.int8): ("int8_t", "char"),
+    np.dtype(np.uint64): ("uint64_t", "unsigned long"),
+    np.dtype(np.uint32): ("uint32_t", "unsigned int"),
+    np.dtype(np.uint16): ("uint16_t", "unsigned short"),
+    np.dtype(np.uint8): ("uint8_t", "unsigned char"),
+}
+
+_SRC = r"""#include <stdint.h>
+#include <math.h>
+
+int64_t %(name)s(%(params)s, %(otype)s *restrict out_, int64_t n_)
+{
+	int64_t i_;
+#pragma _NEC ivdep
+	for (i_ = 0; i_ < n_; i_++) {
+%(loads)s
+		out_[i_] = (%(otype)s)(%(expr)s);
+	}
+	return n_;
+}
+"""
+
+
+def _ctype(dt):
+    try:
+        return _CTYPES[np.dtype(dt)]
+    except KeyError:
+        raise TypeError("VeUfunc: unsupported dtype %s" % dt)
+
+
+class VeUfunc(object):
+    """
+    Elementwise kernel computing the C expression expr over the arguments
+    named in args. dtypes optionally fixes the dtypes of the arguments,
+    out_dtype the dtype of the result (default: numpy result type).
+    """
+    def __init__(self, expr, args, dtypes=None, out_dtype=None, name=None,
+                 compiler=None, flags=None, cache=None):
+        if isinstance(args, str):
+            args = tuple(a.strip() for a in args.split(","))
+        self.expr = expr
+        self.args = tuple(args)
+        self.dtypes = None if dtypes is None else tuple(np.dtype(d) for d in dtypes)
+        if self.dtypes is not None and len(self.dtypes) != len(self.args):
+            raise ValueError("VeUfunc: %d args but %d dtypes"
+                             % (len(self.args), len(self.dtypes)))
+        self.out_dtype = None if out_dtype is None else np.dtype(out_dtype)
+        self.name = name or "veufunc"
+        self.compiler = compiler or COMPILER["C"]
+        self.flags = flags or FLAGS["C"]
+        self.cache = cache
+        # proc -> {signature: VeoFunction}
+        self._funcs = weakref.WeakKeyDictionary()
+
+    def source(self, sig):
+        """
+        Return the function name and C source for the signature sig, a
+        tuple of (dtype, is_array) per argument followed by the output
+        dtype.
+        """
+        otype = _ctype(sig[-1])[0]
+        params, loads = [], []
+        for a, (dt, is_array) in zip(self.args, sig[:-1]):
+            ct = _ctype(dt)[0]
+            if is_array:
+                params.append("const %s *restrict %s_" % (ct, a))
+                loads.append("\t\tconst %s %s = %s_[i_];" % (ct, a, a))
+            else:
+                params.append("const %s %s" % (ct, a))
+        h = hashlib.sha256(repr((self.expr, sig)).encode()).hexdigest()[:16]
+        name = "%s_%s" % (self.name, h)
+        return name, _SRC % {"name": name, "params": ", ".join(params),
+                             "otype": otype, "loads": "\n".join(loads),
+                             "expr": self.expr}
+
+    def _load(self, proc, sig):
+        """
+        Build the kernel of signature sig in a temporary directory and
+        load it into proc. The directory is removed once the library is
+        loaded.
+        """
+        name, src = self.source(sig)
+        blddir = tempfile.mkdtemp(prefix="veufunc-")
+        try:
+            bld = VeBuild(cache=self.cache)
+            bld.set_build_dir(blddir)
+            bld.set_c_src(name, src, flags=self.flags, compiler=self.compiler)
+            so = bld.build_so(linker=self.compiler)
+            if so is None:
+                raise RuntimeError("VeUfunc: building %s failed" % name)
+            return name, proc.load_library(so)
+        finally:
+            shutil.rmtree(blddir, ignore_errors=True)
+
+    def function(self, proc, sig):
+        """
+        Return the VeoFunction of signature sig in proc, building and
+        loading it if needed.
+        """
+        funcs = self._funcs.setdefault(proc, dict())
+        f = funcs.get(sig)
+        if f is not None:
+            return f
+        name, lib = self._load(proc, sig)
+        f = lib.find_function(name)
+        f.args_type(*([_ctype(dt)[1] if not is_array else "void *"
+                       for dt, is_array in sig[:-1]] + ["void *", "long"]))
+        f.ret_type("long")
+        funcs[sig] = f
+        return f
+
+    def __call__(self, ctx, *args, out=None):
+        if len(args) != len(self.args):
+            raise TypeError("VeUfunc takes %d arguments (%d given)"
+                            % (len(self.args), len(args)))
+        proc = ctx.proc
+        shape = None
+        vals, sig = [], []
+        for i, a in enumerate(args):
+            dt = None if self.dtypes is None else self.dtypes[i]
+            if isinstance(a, VeArray):
+                if dt is not None and a.dtype != dt:
+                    raise TypeError("VeUfunc: argument %s has dtype %s, expected %s"
+                                    % (self.args[i], a.dtype, dt))
+                vals.append(a)
+                sig.append((a.dtype, True))
+            elif np.ndim(a) == 0:
+                a = np.asarray(a, dtype=dt)
+                vals.append(a[()])
+                sig.append((a.dtype, False))
+                continue
+            else:
+                a = np.ascontiguousarray(a, dtype=dt)
+                vals.append(a)
+                sig.append((a.dtype, True))
+            if shape is None:
+                shape = a.shape
+            elif a.shape != shape:
+                raise ValueError("VeUfunc: shape mismatch %r != %r" % (a.shape, shape))
+        if shape is None:
+            raise ValueError("VeUfunc needs at least one array argument")
+        odt = self.out_dtype
+        if odt is None:
+            odt = out.dtype if out is not None else np.result_type(
+                *[v.dtype for v in vals])
+        sig = tuple(sig) + (np.dtype(odt),)
+        f = self.function(proc, sig)
+
+        n = int(np.prod(shape, dtype=np.int64))
+        tmp, reqs = [], []
+        try:
+            cargs = []
+            for v, (dt, is_array) in zip(vals, sig[:-1]):
+                if isinstance(v, VeArray):
+                    cargs.append(v.ve_ptr(write=False))
+                elif is_array:
+                    addr = proc.alloc_mem(max(v.nbytes, 1))
+                    tmp.append(addr)
+                    reqs.append(ctx.async_write_mem(addr, v, v.nbytes))
+                    cargs.append(addr)
+                else:
+                    cargs.append(v.item())
+            oaddr = 0
+            if isinstance(out, VeArray):
+                if out.shape != shape or out.dtype != sig[-1]:
+                    raise ValueError("VeUfunc: out does not match the result")
+                cargs.append(out.ve_ptr(write=True))
+            else:
+                if out is None:
+                    out = np.empty(shape, dtype=sig[-1])
+                elif (out.shape != shape or out.dtype != sig[-1]
+                      or not out.flags.c_contiguous):
+                    raise ValueError("VeUfunc: out does not match the result")
+                oaddr = proc.alloc_mem(max(out.nbytes, 1))
+                tmp.append(oaddr)
+                cargs.append(oaddr)
+            req = f(ctx, *cargs, n)
+            if req is None:
+                raise RuntimeError("VeUfunc: submitting %s failed" % self.name)
+            reqs.append(req)
+            if oaddr:
+                # queued behind the kernel in the same context
+                reqs.append(ctx.async_read_mem(out, oaddr, out.nbytes))
+            wait_all(reqs)
+            reqs = []
+            return out
+        finally:
+            if reqs:
+                try:
+                    wait_all(reqs)
+                except Exception:
+                    pass
+            for addr in tmp:
+                proc.free_mem(addr)
+
+    def __repr__(self):
+        return "<VeUfunc %s(%s) = %s>" % (self.name, ", ".join(self.args), self.expr)